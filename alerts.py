@@ -0,0 +1,153 @@
+import numpy as np
+from rules import DEFAULT_RULES
+
+# 风险控制参数（阈值和减仓比例），与规则组 risk_action 的 params 相同；
+# 规则文件修改了参数时，由 StockProcessor 把 RuleBook 中的参数传进来
+RISK_PARAMS = DEFAULT_RULES['risk_action']['params']
+
+# 触发价种类编号
+BAND_LOW, STOP_LOSS, TAKE_PROFIT, BAND_HIGH = range(4)
+
+
+def risk_rules(params=None):
+    """各风险动作的 {动作: {'action', 'percent', 'reason'}}，percent 为减仓比例"""
+    p = dict(RISK_PARAMS, **(params or {}))
+    return {
+        'reduce': {'action': 'reduce', 'percent': p['reduce_cut'],
+                   'reason': f"单日波动大于{p['band_percent']:g}%（黑天鹅融断机制）"},
+        'sell_all': {'action': 'sell_all', 'percent': p['sell_all_cut'],
+                     'reason': f"跌破买入价{p['stop_percent']:g}%（止损机制）"},
+        'take_profit': {'action': 'take_profit', 'percent': p['take_profit_cut'],
+                        'reason': f"盈利达到{p['profit_percent']:g}%（止盈机制）"},
+    }
+
+
+def trigger_levels(stocks, params=None):
+    """每个持仓的 (止损价, 止盈价, 前收盘下轨, 前收盘上轨)，各为与 stocks 等长的数组"""
+    p = dict(RISK_PARAMS, **(params or {}))
+    avg_price = np.array([stock['avg_price'] for stock in stocks], dtype=float)
+    # 没有前收盘价时由日涨跌幅反推
+    prev_close = np.array([
+        stock.get('prev_close') or stock.get('current_price', stock['avg_price']) / (1 + stock.get('daily_change', 0) / 100)
+        for stock in stocks
+    ], dtype=float)
+    # 与规则表达式的写法相同，保证边界上的判断一致
+    return (avg_price * (1 - p['stop_percent'] / 100), avg_price * (1 + p['profit_percent'] / 100),
+            prev_close * (1 - p['band_percent'] / 100), prev_close * (1 + p['band_percent'] / 100))
+
+
+def active_alerts(stocks, params=None):
+    """按持仓的现价判断当前处于触发状态的风险信号（不改变任何预警状态）
+
+    返回与 AlertEngine.evaluate 相同格式的列表，crossed 恒为False。
+    """
+    if not stocks:
+        return []
+    prices = np.array([stock.get('current_price', stock['avg_price']) for stock in stocks], dtype=float)
+    stop, take, band_low, band_high = trigger_levels(stocks, params)
+    return _alerts([stock['ticker'] for stock in stocks], prices < band_low, prices > band_high,
+                   prices < stop, prices > take, np.zeros(len(stocks), dtype=bool), risk_rules(params))
+
+
+def _alerts(tickers, below_band, above_band, stop, take, crossed, rules):
+    """按优先级（熔断 > 止损 > 止盈）生成信号列表"""
+    band = below_band | above_band
+    alerts = []
+    for i in np.flatnonzero(band | stop | take):
+        if band[i]:
+            rule = rules['reduce']
+        elif stop[i]:
+            rule = rules['sell_all']
+        else:
+            rule = rules['take_profit']
+        alerts.append(dict(rule, ticker=tickers[i], crossed=bool(crossed[i])))
+    return alerts
+
+
+class AlertEngine:
+    """风险规则预警引擎
+
+    为每个持仓预先计算触发价（止损价、止盈价、前收盘±5%），按升序存放在
+    levels 矩阵中。价格更新时通过向量化比较得到价格所在的区间，区间编号
+    变化即表示穿越了某个触发价，因此每次更新只需 O(N) 的数组运算。
+    params 为风险控制参数（默认与内置规则相同）。
+    """
+
+    def __init__(self, params=None):
+        self.params = dict(RISK_PARAMS, **(params or {}))
+        self.rules = risk_rules(self.params)
+        self.tickers = []
+        self.index = {}
+        self.stop = np.empty(0)
+        self.take = np.empty(0)
+        self.band_low = np.empty(0)
+        self.band_high = np.empty(0)
+        # 每行已排序的触发价及其种类
+        self.levels = np.empty((0, 4))
+        self.kinds = np.empty((0, 4), dtype=np.int8)
+        # 上一次价格所处的区间（价格之下的触发价个数）
+        self.zones = np.empty(0, dtype=np.int8)
+
+    def rebuild(self, stocks, baseline=None):
+        """根据持仓列表重建所有触发价，baseline为判断穿越时使用的上一次价格（默认取当前价）"""
+        self.tickers = [stock['ticker'] for stock in stocks]
+        self.index = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+        current = np.array([stock.get('current_price', stock['avg_price']) for stock in stocks], dtype=float)
+        self.stop, self.take, self.band_low, self.band_high = trigger_levels(stocks, self.params)
+
+        levels = np.column_stack([self.band_low, self.stop, self.take, self.band_high]).reshape(-1, 4)
+        order = np.argsort(levels, axis=1)
+        self.levels = np.take_along_axis(levels, order, axis=1)
+        self.kinds = order.astype(np.int8)
+        if baseline is not None:
+            previous = self._align(baseline)
+            current = np.where(np.isnan(previous), current, previous)
+        self.zones = self._zones(current)
+
+    def _zones(self, prices):
+        """计算每个价格之下有多少个触发价"""
+        return (prices[:, None] > self.levels).sum(axis=1).astype(np.int8)
+
+    def _align(self, prices):
+        """把 {ticker: price} 或数组对齐为与持仓顺序一致的数组，缺失的价格为NaN"""
+        if isinstance(prices, dict):
+            aligned = np.full(len(self.tickers), np.nan)
+            for ticker, price in prices.items():
+                i = self.index.get(ticker)
+                if i is not None and price is not None:
+                    aligned[i] = price
+            return aligned
+        return np.asarray(prices, dtype=float)
+
+    def evaluate(self, prices):
+        """批量检测所有持仓的风险信号
+
+        返回与 check_risk_control 相同格式的信号列表，额外包含 ticker 和 crossed
+        （本次价格更新是否刚刚穿越触发价）。
+        """
+        if not self.tickers:
+            return []
+        prices = self._align(prices)
+        valid = ~np.isnan(prices)
+
+        zones = np.where(valid, self._zones(np.nan_to_num(prices)), self.zones)
+        crossed = zones != self.zones
+        self.zones = zones
+
+        # 优先级与 check_risk_control 相同：熔断 > 止损 > 止盈
+        return _alerts(self.tickers, valid & (prices < self.band_low), valid & (prices > self.band_high),
+                       valid & (prices < self.stop), valid & (prices > self.take), crossed, self.rules)
+
+    def on_tick(self, ticker, price):
+        """单个股票价格更新，用二分查找判断是否穿越触发价，返回被穿越的触发价种类列表"""
+        i = self.index.get(ticker)
+        if i is None or price is None:
+            return []
+        zone = int(np.searchsorted(self.levels[i], price, side='left'))
+        previous = int(self.zones[i])
+        self.zones[i] = zone
+        if zone == previous:
+            return []
+        low, high = min(zone, previous), max(zone, previous)
+        return [int(kind) for kind in self.kinds[i, low:high]]
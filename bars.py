@@ -0,0 +1,216 @@
+import os
+import time
+import datetime
+import threading
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from metrics import metrics
+import market_calendar
+
+BAR_DIR = os.path.join('cache', 'bars')
+MARKET_TZ = 'America/New_York'
+
+# 支持的周期（秒），'1d' 按交易日聚合
+INTERVAL_SECONDS = {
+    '1m': 60,
+    '5m': 5 * 60,
+    '15m': 15 * 60,
+    '30m': 30 * 60,
+    '1h': 60 * 60,
+}
+INTRADAY_INTERVALS = tuple(INTERVAL_SECONDS)
+
+# 一分钟数据最多能回溯的天数（yfinance限制）
+MAX_MINUTE_HISTORY_DAYS = 29
+
+COLUMNS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+# 交易时段内两次补齐同一股票的最短间隔（秒），切换周期不会重复请求网络
+MIN_REFRESH_SECONDS = 60
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=30)
+
+
+def period_to_days(period):
+    """把 '5d'、'1mo'、'1y' 之类的周期转换为天数"""
+    units = {'d': 1, 'wk': 7, 'mo': 30, 'y': 365}
+    for unit, days in units.items():
+        if period.endswith(unit) and period[:-len(unit)].isdigit():
+            return int(period[:-len(unit)]) * days
+    return MAX_MINUTE_HISTORY_DAYS
+
+
+def fetch_minute_bars(ticker, start=None, period='7d'):
+    """从yfinance获取一分钟K线"""
+    stock = yf.Ticker(ticker)
+    if start is not None:
+        return stock.history(interval='1m', start=start)
+    return stock.history(interval='1m', period=period)
+
+
+def resample(frame, interval):
+    """把一分钟K线向量化聚合为更大周期的OHLCV"""
+    if frame.empty or interval == '1m':
+        return frame
+
+    index = frame.index
+    if index.tz is None:
+        index = index.tz_localize(MARKET_TZ)
+    # 以交易所本地时间分桶，日内周期从9:30开盘对齐；索引可能是秒或毫秒精度，统一换成纳秒
+    local = index.tz_convert(MARKET_TZ).tz_localize(None).as_unit('ns')
+    ns = local.asi8
+    day = local.normalize().asi8
+    if interval == '1d':
+        keys = day
+    else:
+        step = INTERVAL_SECONDS[interval] * 10**9
+        anchor = day + SESSION_OPEN.value
+        keys = anchor + (ns - anchor) // step * step
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+
+    result = pd.DataFrame({
+        'Open': frame['Open'].to_numpy()[starts],
+        'High': np.maximum.reduceat(frame['High'].to_numpy(), starts),
+        'Low': np.minimum.reduceat(frame['Low'].to_numpy(), starts),
+        'Close': frame['Close'].to_numpy()[ends],
+        'Volume': np.add.reduceat(frame['Volume'].to_numpy(), starts),
+    }, index=pd.DatetimeIndex(keys[starts].astype('datetime64[ns]')).tz_localize(MARKET_TZ))
+    return result
+
+
+class BarStore:
+    """一分钟K线的列式磁盘缓存
+
+    每个股票每个交易日一个 .npz 分块，时间戳为int64（UTC纳秒），
+    OHLC为float32，成交量为int64。读取时按需重采样为5m/15m/1h/1d，
+    不同周期之间无需重复请求网络；只有缓存的最新数据按交易日历可能过期时才补齐。
+    """
+
+    def __init__(self, root=BAR_DIR, fetch=None):
+        self.root = root
+        self.fetch = fetch or fetch_minute_bars
+        self._checked = {}          # {股票: (补齐时的纽约时间, time.monotonic())}
+        self._lock = threading.Lock()
+
+    def _ticker_dir(self, ticker):
+        return os.path.join(self.root, ticker.replace('^', '_'))
+
+    def _chunk_path(self, ticker, day):
+        return os.path.join(self._ticker_dir(ticker), f"{day}.npz")
+
+    def days(self, ticker):
+        """返回已缓存的交易日列表（升序）"""
+        path = self._ticker_dir(ticker)
+        if not os.path.isdir(path):
+            return []
+        return sorted(name[:-4] for name in os.listdir(path) if name.endswith('.npz'))
+
+    def write(self, ticker, frame):
+        """把一分钟K线按交易日拆分写入分块，与已有分块合并去重"""
+        if frame.empty:
+            return
+        os.makedirs(self._ticker_dir(ticker), exist_ok=True)
+        index = frame.index if frame.index.tz is not None else frame.index.tz_localize(MARKET_TZ)
+        local_days = index.tz_convert(MARKET_TZ).strftime('%Y-%m-%d')
+        ts = index.tz_convert('UTC').as_unit('ns').asi8
+
+        for day in np.unique(local_days):
+            mask = local_days == day
+            columns = {
+                'ts': ts[mask],
+                'open': frame['Open'].to_numpy(dtype=np.float32)[mask],
+                'high': frame['High'].to_numpy(dtype=np.float32)[mask],
+                'low': frame['Low'].to_numpy(dtype=np.float32)[mask],
+                'close': frame['Close'].to_numpy(dtype=np.float32)[mask],
+                'volume': frame['Volume'].to_numpy(dtype=np.int64)[mask],
+            }
+            path = self._chunk_path(ticker, day)
+            if os.path.exists(path):
+                with np.load(path) as old:
+                    columns = {name: np.concatenate([old[name], values]) for name, values in columns.items()}
+            # 按时间排序并去掉重复的分钟（新数据覆盖旧数据）
+            order = np.argsort(columns['ts'], kind='stable')
+            ts_sorted = columns['ts'][order]
+            keep = np.r_[ts_sorted[1:] != ts_sorted[:-1], True]
+            np.savez_compressed(path, **{name: values[order][keep] for name, values in columns.items()})
+
+    def read(self, ticker, days=None):
+        """读取指定交易日的一分钟K线，返回与yfinance相同列名的DataFrame"""
+        days = self.days(ticker) if days is None else days
+        chunks = []
+        for day in days:
+            path = self._chunk_path(ticker, day)
+            if os.path.exists(path):
+                metrics.increment('cache.bars.hit')
+                with np.load(path) as chunk:
+                    chunks.append({name: chunk[name] for name in chunk.files})
+            else:
+                metrics.increment('cache.bars.miss')
+        if not chunks:
+            return pd.DataFrame(columns=COLUMNS)
+        data = {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+        index = pd.DatetimeIndex(data['ts'].astype('datetime64[ns]')).tz_localize('UTC').tz_convert(MARKET_TZ)
+        return pd.DataFrame({
+            'Open': data['open'],
+            'High': data['high'],
+            'Low': data['low'],
+            'Close': data['close'],
+            'Volume': data['volume'],
+        }, index=index)
+
+    def last_timestamp(self, ticker):
+        """最后一根已缓存K线的时间（纽约时区），没有缓存时为None"""
+        cached = self.days(ticker)
+        if not cached:
+            return None
+        with np.load(self._chunk_path(ticker, cached[-1])) as chunk:
+            ts = chunk['ts']
+        if not len(ts):
+            return None
+        return pd.Timestamp(int(ts.max()), unit='ns', tz='UTC').tz_convert(MARKET_TZ)
+
+    def is_fresh(self, ticker, now=None):
+        """按交易日历判断缓存是否已是当前能得到的最新数据
+
+        休市时，本次运行中在最近一次收盘后补齐过，或缓存已有收盘前最后一分钟的K线，
+        都不可能再有新数据；交易时段内 MIN_REFRESH_SECONDS 内补齐过即视为最新。
+        """
+        now = market_calendar.market_now(now)
+        with self._lock:
+            checked = self._checked.get(ticker)
+        if market_calendar.market_open(now):
+            return checked is not None and time.monotonic() - checked[1] < MIN_REFRESH_SECONDS
+        day = market_calendar.last_session_day(now)
+        closing = pd.Timestamp(day).tz_localize(MARKET_TZ) + market_calendar.close_time(day)
+        if checked is not None and checked[0] >= closing:
+            return True
+        last = self.last_timestamp(ticker)
+        return last is not None and last >= closing - pd.Timedelta(minutes=1)
+
+    def refresh(self, ticker):
+        """从最后一个已缓存交易日开始补齐一分钟K线"""
+        cached = self.days(ticker)
+        try:
+            if cached:
+                data = self.fetch(ticker, start=cached[-1])
+            else:
+                data = self.fetch(ticker)
+            self.write(ticker, data)
+        except Exception as e:
+            print(f"Error fetching minute bars for {ticker}: {e}")
+            return
+        with self._lock:
+            self._checked[ticker] = (market_calendar.market_now(), time.monotonic())
+
+    def load(self, ticker, period='5d', interval='5m', refresh=True):
+        """读取最近 period 的K线并重采样为 interval 周期，缓存过期时先补齐"""
+        if refresh and not self.is_fresh(ticker):
+            self.refresh(ticker)
+        else:
+            metrics.increment('cache.bars.fresh')
+        today = datetime.datetime.now().date()
+        first_day = (today - datetime.timedelta(days=period_to_days(period))).isoformat()
+        days = [day for day in self.days(ticker) if day >= first_day]
+        return resample(self.read(ticker, days), interval)
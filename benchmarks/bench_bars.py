@@ -0,0 +1,91 @@
+"""一分钟K线缓存与重采样：校验结果与 DataFrame.resample 一致，并比较耗时
+
+秒精度和纳秒精度的时间索引（新版pandas/yfinance返回秒精度）都要得到相同结果，
+写入 BarStore 后读回的时间戳也不变。
+
+用法: python benchmarks/bench_bars.py [--days 60]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bars import BarStore, resample, MARKET_TZ
+
+
+def session_frame(days, seed=0):
+    """生成 days 个交易日、每天9:30-16:00的一分钟K线"""
+    rng = np.random.default_rng(seed)
+    sessions = pd.bdate_range('2024-01-02', periods=days)
+    index = pd.DatetimeIndex(np.concatenate([
+        pd.date_range(day + pd.Timedelta(hours=9, minutes=30), periods=390, freq='min') for day in sessions
+    ])).tz_localize(MARKET_TZ)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, len(index))))
+    spread = np.abs(rng.normal(0, 0.0005, len(index))) * close
+    return pd.DataFrame({
+        'Open': close * (1 + rng.normal(0, 0.0002, len(index))),
+        'High': close + spread,
+        'Low': close - spread,
+        'Close': close,
+        'Volume': rng.integers(100, 10_000, len(index)),
+    }, index=index)
+
+
+def pandas_resample(frame, interval):
+    """DataFrame.resample 写法，日内周期从9:30对齐"""
+    rule = {'5m': '5min', '15m': '15min', '1h': '60min', '1d': '1D'}[interval]
+    offset = '30min' if interval == '1h' else None
+    result = frame.resample(rule, offset=offset).agg(
+        {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'})
+    return result.dropna(subset=['Open'])
+
+
+def check(frame, interval):
+    expected = pandas_resample(frame, interval)
+    actual = resample(frame, interval)
+    if not (actual.index.as_unit('ns').equals(expected.index.as_unit('ns'))
+            and np.allclose(actual.to_numpy(dtype=float), expected.to_numpy(dtype=float))):
+        raise SystemExit(f"{interval} 重采样结果与 DataFrame.resample 不一致（索引精度 {frame.index.unit}）")
+
+
+def best_of(func, *args, repeat=5):
+    """多次运行取最短耗时（秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, default=60)
+    args = parser.parse_args()
+
+    frame = session_frame(args.days)
+    for unit in ('ns', 's'):
+        indexed = frame.set_axis(frame.index.as_unit(unit))
+        for interval in ('5m', '15m', '1h', '1d'):
+            check(indexed, interval)
+        # 写入缓存后读回，时间戳与原始数据相同
+        with tempfile.TemporaryDirectory() as root:
+            store = BarStore(root=root, fetch=lambda *args, **kwargs: indexed)
+            store.write('TEST', indexed)
+            loaded = store.read('TEST')
+            if not loaded.index.as_unit('ns').equals(frame.index.as_unit('ns')):
+                raise SystemExit(f"缓存读回的时间戳与原始数据不一致（索引精度 {unit}）")
+
+    print(f"{args.days} 个交易日 × 390 根一分钟K线")
+    for interval in ('5m', '15m', '1h', '1d'):
+        ours = best_of(resample, frame, interval)
+        theirs = best_of(pandas_resample, frame, interval)
+        print(f"  {interval:<4} resample {ours * 1000:8.2f} ms    DataFrame.resample {theirs * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
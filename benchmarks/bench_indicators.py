@@ -0,0 +1,92 @@
+"""技术指标性能对比：indicators模块（NumPy / Numba）与原来的pandas写法
+
+用法: python benchmarks/bench_indicators.py [--days 2520] [--tickers 500]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import indicators
+
+
+def synthetic_panel(days, tickers, seed=0):
+    """生成随机游走的收盘价和成交量面板 (时间 × 股票)"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, size=(days, tickers)), axis=0))
+    volume = rng.integers(1_000_000, 5_000_000, size=(days, tickers)).astype(float)
+    return close, volume
+
+
+def pandas_indicators(close, volume):
+    """原来 processor.py / ui.py 中的pandas写法"""
+    close = pd.DataFrame(close)
+    volume = pd.DataFrame(volume)
+    exp1 = close.ewm(span=12, adjust=False).mean()
+    exp2 = close.ewm(span=26, adjust=False).mean()
+    macd = exp1 - exp2
+    signal = macd.ewm(span=9, adjust=False).mean()
+    ma20 = close.rolling(window=20).mean()
+    ma200 = close.rolling(window=200).mean()
+    high_20d = close.rolling(window=20).max()
+    avg_volume = volume.rolling(window=20).mean()
+    cross = (macd.shift(1) < signal.shift(1)) & (macd > signal)
+    return macd.values, signal.values, ma20.values, ma200.values, high_20d.values, avg_volume.values, cross.values
+
+
+def numpy_indicators(close, volume):
+    """indicators模块的写法"""
+    macd, signal, _ = indicators.macd(close)
+    ma20 = indicators.sma(close, 20)
+    ma200 = indicators.sma(close, 200)
+    high_20d = indicators.rolling_max(close, 20)
+    avg_volume = indicators.rolling_mean(volume, 20)
+    cross = indicators.crossover(macd, signal)
+    return macd, signal, ma20, ma200, high_20d, avg_volume, cross
+
+
+def best_of(func, *args, repeat=5):
+    """多次运行取最短耗时（秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, default=2520)
+    parser.add_argument('--tickers', type=int, default=500)
+    args = parser.parse_args()
+
+    close, volume = synthetic_panel(args.days, args.tickers)
+
+    # 先校验结果一致
+    expected = pandas_indicators(close, volume)
+    actual = numpy_indicators(close, volume)
+    for name, a, b in zip(('macd', 'signal', 'ma20', 'ma200', 'high_20d', 'avg_volume', 'cross'), expected, actual):
+        if not np.allclose(a, b, equal_nan=True, rtol=1e-9, atol=1e-9):
+            raise SystemExit(f"{name} 与pandas结果不一致")
+
+    results = {'pandas': best_of(pandas_indicators, close, volume)}
+    use_numba = indicators.USE_NUMBA
+    indicators.USE_NUMBA = False
+    results['numpy'] = best_of(numpy_indicators, close, volume)
+    if indicators.HAS_NUMBA:
+        indicators.USE_NUMBA = True
+        numpy_indicators(close, volume)  # 预热JIT编译
+        results['numba'] = best_of(numpy_indicators, close, volume)
+    indicators.USE_NUMBA = use_numba
+
+    print(f"{args.days} 天 × {args.tickers} 只股票")
+    for name, seconds in results.items():
+        print(f"  {name:<8}{seconds * 1000:10.1f} ms  ({results['pandas'] / seconds:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
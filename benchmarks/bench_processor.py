@@ -0,0 +1,162 @@
+"""StockProcessor 热点路径性能测试
+
+使用离线合成数据源，在不同持仓规模下测量主要操作的耗时，
+结果保存为JSON，并可与之前版本的结果对比以发现性能回退。
+
+用法:
+    python benchmarks/bench_processor.py [--sizes 10 100 1000 10000] [--output results.json]
+    python benchmarks/bench_processor.py --compare benchmarks/results/old.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+# 性能测试在无界面环境下运行
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from processor import StockProcessor
+from synthetic import SyntheticProvider, make_portfolio
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# 耗时超过旧结果的这个倍数视为回退
+REGRESSION_THRESHOLD = 1.2
+
+
+def best_of(func, repeat):
+    """多次运行取最短耗时（秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def make_processor(size, workdir):
+    """创建使用合成数据源和临时投资组合文件的处理器"""
+    portfolio_file = os.path.join(workdir, f'portfolio_{size}.json')
+    with open(portfolio_file, 'w') as f:
+        json.dump(make_portfolio(size), f)
+    return StockProcessor(portfolio_file=portfolio_file, provider=SyntheticProvider())
+
+
+def bench_size(size, workdir, repeat):
+    """测量某个持仓规模下各操作的耗时"""
+    processor = make_processor(size, workdir)
+    ticker = processor.snapshot()['stocks'][0]['ticker']
+    # 大规模组合减少重复次数
+    repeat = max(1, repeat if size <= 1000 else repeat // 3)
+
+    results = {
+        'update_stock_prices': best_of(processor.update_stock_prices, repeat),
+        'generate_position_advice': best_of(lambda: processor.generate_position_advice(ticker), repeat),
+        'auto_detect_sentiment': best_of(lambda: processor.auto_detect_sentiment(ticker), repeat),
+        'plot_stock_chart': best_of(lambda: processor.plot_stock_chart(ticker), repeat),
+        'save_portfolio': best_of(processor.save_portfolio, repeat),
+        'load_portfolio': best_of(processor.load_portfolio, repeat),
+    }
+
+    load_stocks = bench_load_stocks(processor, repeat)
+    if load_stocks is not None:
+        results['ui.load_stocks'] = load_stocks
+    return results
+
+
+def bench_load_stocks(processor, repeat):
+    """测量界面刷新股票列表的耗时，没有图形界面时跳过"""
+    try:
+        import tkinter as tk
+        from ui import StockPortfolioApp
+        root = tk.Tk()
+    except Exception as e:
+        print(f"跳过 ui.load_stocks: {e}")
+        return None
+    try:
+        root.withdraw()
+        app = StockPortfolioApp(root, processor=processor)
+        return best_of(app.load_stocks, repeat)
+    finally:
+        root.destroy()
+
+
+def git_version():
+    """返回当前代码的git提交号"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare(current, baseline):
+    """对比两次结果，返回回退项列表"""
+    regressions = []
+    for size, results in current['results'].items():
+        for name, seconds in results.items():
+            old = baseline['results'].get(size, {}).get(name)
+            if old and seconds > old * REGRESSION_THRESHOLD:
+                regressions.append((size, name, old, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='结果JSON路径（默认 benchmarks/results/<提交号>.json）')
+    parser.add_argument('--compare', help='用于对比的旧结果JSON')
+    args = parser.parse_args()
+
+    version = git_version()
+    report = {
+        'version': version,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': {},
+    }
+
+    workdir = tempfile.mkdtemp(prefix='stock_bench_')
+    cwd = os.getcwd()
+    try:
+        # 缓存目录写在临时目录中，避免污染项目
+        os.chdir(workdir)
+        for size in args.sizes:
+            results = bench_size(size, workdir, args.repeat)
+            report['results'][str(size)] = results
+            print(f"持仓数 {size}:")
+            for name, seconds in results.items():
+                print(f"  {name:<28}{seconds * 1000:12.2f} ms")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{version}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"结果已保存到 {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline)
+        for size, name, old, new in regressions:
+            print(f"性能回退: 持仓数 {size} {name} {old * 1000:.2f} ms -> {new * 1000:.2f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""规则引擎性能对比：编译后的声明式规则与手写的 NumPy 和逐股票 Python 写法
+
+用法: python benchmarks/bench_rules.py [--days 2520] [--tickers 500]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rules
+
+
+def best_of(func, *args, repeat=5):
+    """多次运行取最短耗时（秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def synthetic_columns(days, tickers, seed=0):
+    """随机游走面板 (时间 × 股票) 的全部规则指标列"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, size=(days, tickers)), axis=0))
+    high = close * (1 + rng.uniform(0, 0.02, size=(days, tickers)))
+    volume = rng.lognormal(15, 0.4, size=(days, tickers))
+    columns = rules.panel_columns(close, high, volume)
+    columns['price'] = close
+    columns['avg_price'] = np.broadcast_to(close[0] * rng.uniform(0.8, 1.2, tickers), close.shape)
+    columns['daily_change'] = np.nan_to_num(columns['price_change'])
+    return columns
+
+
+def numpy_rules(c):
+    """手写的 np.select 写法，与内置规则逐条对应"""
+    ma = np.select([c['count'] < 200, c['close'] < c['ma200'], c['close'] < c['ma20']], [0, 0, 5], default=15)
+    macd = np.select([c['count'] < 26, c['golden_cross'] & (c['macd'] > 0), c['golden_cross']], [0, 5, 3], default=0)
+    risk = np.select([np.abs(c['daily_change']) > 5, c['price'] < c['avg_price'] * 0.97,
+                      (c['price'] - c['avg_price']) / c['avg_price'] * 100 > 15], [1, 2, 3], default=0)
+    sentiment = np.select([c['count'] < 20, c['breakout'] & c['high_volume'],
+                           c['high_volume'] & (c['price_change'] < -2), c['range_5d'] < 3], [0, 1, 2, 3], default=0)
+    return {'ma_position': ma, 'macd_adjustment': macd, 'risk_action': risk, 'sentiment': sentiment}
+
+
+def loop_rules(c):
+    """逐个日期、逐只股票用 if/elif 判断（原来的标量写法）"""
+    results = {name: [] for name in rules.DEFAULT_RULES}
+    flat = {name: np.ravel(values).tolist() for name, values in c.items()}
+    for i in range(len(flat['close'])):
+        v = {name: values[i] for name, values in flat.items()}
+        if v['count'] < 200 or v['close'] < v['ma200']:
+            results['ma_position'].append(0)
+        else:
+            results['ma_position'].append(5 if v['close'] < v['ma20'] else 15)
+        if v['count'] < 26 or not v['golden_cross']:
+            results['macd_adjustment'].append(0)
+        else:
+            results['macd_adjustment'].append(5 if v['macd'] > 0 else 3)
+        if abs(v['daily_change']) > 5:
+            results['risk_action'].append(1)
+        elif v['price'] < v['avg_price'] * 0.97:
+            results['risk_action'].append(2)
+        elif (v['price'] - v['avg_price']) / v['avg_price'] * 100 > 15:
+            results['risk_action'].append(3)
+        else:
+            results['risk_action'].append(0)
+        if v['count'] < 20:
+            results['sentiment'].append(0)
+        elif v['breakout'] and v['high_volume']:
+            results['sentiment'].append(1)
+        elif v['high_volume'] and v['price_change'] < -2:
+            results['sentiment'].append(2)
+        else:
+            results['sentiment'].append(3 if v['range_5d'] < 3 else 0)
+    return {name: np.reshape(values, np.shape(c['close'])) for name, values in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, default=2520)
+    parser.add_argument('--tickers', type=int, default=500)
+    args = parser.parse_args()
+
+    columns = synthetic_columns(args.days, args.tickers)
+    book = rules.RuleBook()
+
+    # 先校验编译后的规则与手写写法结果一致
+    compiled = book.evaluate_all(columns)
+    expected = numpy_rules(columns)
+    loop = loop_rules(columns)
+    for name in rules.DEFAULT_RULES:
+        if not np.array_equal(compiled[name], expected[name]) or not np.array_equal(compiled[name], loop[name]):
+            raise SystemExit(f"规则组 {name} 的结果与手写写法不一致")
+
+    backend = 'numexpr' if rules.USE_NUMEXPR else 'NumPy'
+    results = {
+        f'rules ({backend})': best_of(book.evaluate_all, columns),
+        'hand-written NumPy': best_of(numpy_rules, columns),
+        'loop': best_of(loop_rules, columns, repeat=1),
+        'compile rules': best_of(rules.RuleBook),
+    }
+
+    print(f"{args.days} 天 × {args.tickers} 只股票, {len(rules.DEFAULT_RULES)} 个规则组")
+    for name, seconds in results.items():
+        print(f"  {name:<22}{seconds * 1000:10.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
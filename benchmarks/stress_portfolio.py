@@ -0,0 +1,155 @@
+"""投资组合并发压力测试
+
+多个线程同时修改持仓、现金、成本价并刷新报价，另一些线程反复读取快照。
+检查每个快照内部一致（总价值 = 现金 + 持仓市值），且结束后磁盘上的JSON与最终快照
+逐个字段一致。tests/test_stress_portfolio.py 用较小的规模运行同样的检查。
+
+用法: python benchmarks/stress_portfolio.py [--threads 8] [--iterations 50] [--size 20]
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from processor import StockProcessor
+from synthetic import SyntheticProvider, make_portfolio
+
+
+# 读线程两次读取之间的间隔（秒），不停地读会一直占用GIL，写线程几乎无法执行
+READ_INTERVAL = 0.001
+
+
+def check_snapshot(snapshot):
+    """检查快照的总价值与现金和持仓市值一致，每只股票的市值与股数和现价一致"""
+    expected = snapshot['cash'] + sum(stock['value'] for stock in snapshot['stocks'])
+    if abs(snapshot['total_value'] - expected) > 1e-6 * max(1.0, abs(expected)):
+        raise AssertionError(f"快照不一致: total_value={snapshot['total_value']} expected={expected}")
+    for stock in snapshot['stocks']:
+        value = stock['shares'] * stock['current_price']
+        if abs(stock['value'] - value) > 1e-6 * max(1.0, abs(value)):
+            raise AssertionError(f"{stock['ticker']} 的市值与股数×现价不一致: {stock['value']} != {value}")
+
+
+def plain(snapshot):
+    """把只读快照转换为与JSON文件相同的普通字典"""
+    portfolio = dict(snapshot)
+    portfolio['stocks'] = [dict(stock) for stock in snapshot['stocks']]
+    return json.loads(json.dumps(portfolio))
+
+
+def check_saved(snapshot, saved):
+    """检查磁盘上的投资组合与快照逐个字段一致"""
+    expected = plain(snapshot)
+    if set(saved) != set(expected):
+        raise AssertionError(f"磁盘上的字段不同: {sorted(set(saved) ^ set(expected))}")
+    for key in expected:
+        if key != 'stocks' and saved[key] != expected[key]:
+            raise AssertionError(f"磁盘上的 {key} 与最终快照不一致: {saved[key]!r} != {expected[key]!r}")
+    if [stock['ticker'] for stock in saved['stocks']] != [stock['ticker'] for stock in expected['stocks']]:
+        raise AssertionError("磁盘上的持仓列表与最终快照不一致")
+    for disk, memory in zip(saved['stocks'], expected['stocks']):
+        if disk != memory:
+            fields = sorted(k for k in set(disk) | set(memory) if disk.get(k) != memory.get(k))
+            raise AssertionError(f"{memory['ticker']} 的字段与最终快照不一致: {', '.join(fields)}")
+
+
+def writer(processor, tickers, iterations, seed, errors):
+    rng = random.Random(seed)
+    try:
+        for _ in range(iterations):
+            ticker = rng.choice(tickers)
+            action = rng.random()
+            if action < 0.4:
+                processor.update_shares(ticker, rng.randint(1, 100))
+            elif action < 0.6:
+                processor.update_avg_price(ticker, rng.uniform(10, 300))
+            elif action < 0.8:
+                processor.update_cash(rng.uniform(50000, 150000))
+            elif action < 0.95:
+                processor.update_stock_fields(ticker, sentiment=rng.choice(['突破前高+放量', '横盘震荡', '放量破位']))
+            else:
+                processor.update_stock_prices(max_workers=4)
+    except Exception as e:
+        errors.append(e)
+
+
+def reader(processor, stop, errors, reads):
+    try:
+        while not stop.is_set():
+            check_snapshot(processor.snapshot())
+            reads.append(1)
+            stop.wait(READ_INTERVAL)
+    except Exception as e:
+        errors.append(e)
+
+
+def run(workdir, threads=8, readers=4, iterations=50, size=20):
+    """在 workdir 中运行一次压力测试，返回 (错误列表, 读取快照的次数)
+
+    缓存目录相对于当前目录，调用前应先切换到 workdir。
+    """
+    portfolio_file = os.path.join(workdir, 'portfolio.json')
+    with open(portfolio_file, 'w') as f:
+        json.dump(make_portfolio(size, cash=1e9), f)
+
+    processor = StockProcessor(portfolio_file=portfolio_file, provider=SyntheticProvider())
+    tickers = [stock['ticker'] for stock in processor.snapshot()['stocks']]
+
+    errors, reads = [], []
+    stop = threading.Event()
+    reader_threads = [threading.Thread(target=reader, args=(processor, stop, errors, reads)) for _ in range(readers)]
+    writers = [threading.Thread(target=writer, args=(processor, tickers, iterations, i, errors))
+               for i in range(threads)]
+    for thread in reader_threads + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+    processor.close()
+
+    final = processor.snapshot()
+    try:
+        check_snapshot(final)
+        with open(portfolio_file, 'r') as f:
+            check_saved(final, json.load(f))
+    except AssertionError as e:
+        errors.append(e)
+    return errors, len(reads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--size', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='stock_stress_')
+    os.chdir(workdir)
+    start = time.perf_counter()
+    errors, reads = run(workdir, args.threads, args.readers, args.iterations, args.size)
+    elapsed = time.perf_counter() - start
+
+    if errors:
+        for error in errors:
+            print(f"失败: {error!r}")
+        sys.exit(1)
+    print(f"通过: {args.threads} 个写线程 × {args.iterations} 次操作, {args.readers} 个读线程"
+          f"（读取 {reads} 次快照, {elapsed:.1f} 秒）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""离线合成行情数据源，供性能测试在无网络环境下使用"""
+import zlib
+import numpy as np
+import pandas as pd
+
+# 合成的 (行业, 细分行业)
+CLASSIFICATIONS = (
+    ('Technology', 'Software'), ('Technology', 'Semiconductors'), ('Healthcare', 'Biotechnology'),
+    ('Financial Services', 'Banks'), ('Energy', 'Oil & Gas'), ('Consumer Cyclical', 'Retail'),
+    ('Industrials', 'Aerospace & Defense'), ('Utilities', 'Utilities - Regulated'),
+)
+
+# 各周期对应的pandas频率
+FREQUENCIES = {'1m': 'min', '5m': '5min', '15m': '15min', '30m': '30min', '1h': 'h', '1d': 'B'}
+
+
+def _period_rows(period, interval):
+    """估算某个周期需要生成多少根K线"""
+    days = {'1d': 1, '5d': 5, '7d': 7, '1mo': 21, '3mo': 63, '6mo': 126, '1y': 252, '2y': 504, '5y': 1260}.get(period, 252)
+    if interval == '1d':
+        return days
+    return days * 390 * 60 // {'1m': 60, '5m': 300, '15m': 900, '30m': 1800, '1h': 3600}[interval]
+
+
+class SyntheticProvider:
+    """根据股票代码生成确定性的随机游走K线，接口与 YFinanceProvider 相同"""
+
+    def __init__(self, end='2024-12-31'):
+        self.end = pd.Timestamp(end, tz='America/New_York')
+
+    def _rng(self, ticker):
+        return np.random.default_rng(zlib.crc32(ticker.encode()))
+
+    def history(self, ticker, period=None, interval='1d', start=None, end=None):
+        end_ts = self.end if end is None else pd.Timestamp(end).tz_localize(None).tz_localize('America/New_York')
+        if start is not None:
+            start_ts = pd.Timestamp(start).tz_localize(None).tz_localize('America/New_York')
+            index = pd.date_range(start_ts, end_ts, freq=FREQUENCIES[interval])
+        else:
+            index = pd.date_range(end=end_ts, periods=_period_rows(period or '1y', interval), freq=FREQUENCIES[interval])
+        rng = self._rng(ticker)
+        n = len(index)
+        close = 50 + 150 * rng.random() * np.exp(np.cumsum(rng.normal(0, 0.015, n)))
+        spread = np.abs(rng.normal(0, 0.01, n)) * close
+        return pd.DataFrame({
+            'Open': close * (1 + rng.normal(0, 0.005, n)),
+            'High': close + spread,
+            'Low': close - spread,
+            'Close': close,
+            'Volume': rng.integers(1_000_000, 10_000_000, n),
+        }, index=index)
+
+    def info(self, ticker):
+        rng = self._rng(ticker)
+        price = float(50 + 150 * rng.random())
+        return {
+            'regularMarketPrice': price,
+            'previousClose': price * (1 + rng.normal(0, 0.02)),
+            'shortName': ticker,
+            'sector': CLASSIFICATIONS[zlib.crc32(ticker.encode()) % len(CLASSIFICATIONS)][0],
+            'industry': CLASSIFICATIONS[zlib.crc32(ticker.encode()) % len(CLASSIFICATIONS)][1],
+        }
+
+
+def make_portfolio(size, cash=100000.0):
+    """生成包含 size 只股票的投资组合字典"""
+    provider = SyntheticProvider()
+    stocks = []
+    for i in range(size):
+        ticker = f"T{i:05d}"
+        price = provider.info(ticker)['regularMarketPrice']
+        shares = 10 + i % 90
+        stocks.append({
+            'ticker': ticker,
+            'shares': shares,
+            'avg_price': price,
+            'current_price': price,
+            'value': shares * price,
+            'sentiment': '横盘震荡',
+            'profit_loss': 0,
+            'profit_loss_percent': 0,
+            'kelly_position': 0,
+            'ma_position': 0,
+            'position_advice': '',
+            'daily_change': 0,
+        })
+    return {
+        'cash': cash,
+        'stocks': stocks,
+        'total_value': cash + sum(stock['value'] for stock in stocks),
+    }
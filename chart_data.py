@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+import indicators
+from metrics import metrics
+
+# 最粗一级保留的点数下限
+MIN_POINTS = 256
+
+# 每根K线至少占用的像素，决定K线和MACD柱的聚合粒度
+PIXELS_PER_CANDLE = 4
+
+LINE_FIELDS = ('close', 'ma20', 'ma200', 'macd', 'signal')
+
+
+def _lttb_numpy(x, y, threshold, passes=2):
+    """所有桶一起向量化计算的LTTB
+
+    标准LTTB中每个桶的锚点是上一个桶选出的点，只能逐桶计算；这里先用上一个
+    桶的平均点作锚点对所有桶同时选点，再用选出的点作锚点重算一遍，
+    结果与逐桶计算基本一致，但没有Python层的逐桶循环。
+    """
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    starts, ends = edges[:-1], edges[1:]
+    sizes = ends - starts
+    # 各桶补齐为等宽的二维数组，补齐的位置不参与选择
+    columns = starts[:, None] + np.arange(sizes.max())
+    valid = columns < ends[:, None]
+    columns = np.minimum(columns, n - 1)
+    bucket_x, bucket_y = x[columns], y[columns]
+
+    cum_x, cum_y = np.r_[0.0, np.cumsum(x)], np.r_[0.0, np.cumsum(y)]
+    mean_x = (cum_x[ends] - cum_x[starts]) / sizes
+    mean_y = (cum_y[ends] - cum_y[starts]) / sizes
+    # 下一个桶的平均点，最后一个桶的下一个点是序列终点
+    next_x, next_y = np.r_[mean_x[1:], x[-1]][:, None], np.r_[mean_y[1:], y[-1]][:, None]
+    anchor_x, anchor_y = np.r_[x[0], mean_x[:-1]][:, None], np.r_[y[0], mean_y[:-1]][:, None]
+    rows = np.arange(len(starts))
+    for _ in range(passes):
+        area = np.abs((anchor_x - next_x) * (bucket_y - anchor_y) - (anchor_x - bucket_x) * (next_y - anchor_y))
+        area[~valid] = -1.0
+        chosen = columns[rows, area.argmax(axis=1)]
+        anchor_x, anchor_y = np.r_[x[0], x[chosen[:-1]]][:, None], np.r_[y[0], y[chosen[:-1]]][:, None]
+    return np.r_[0, chosen, n - 1]
+
+
+if indicators.HAS_NUMBA:
+    @indicators.njit(cache=True)
+    def _lttb_numba(x, y, threshold):
+        n = len(x)
+        every = (n - 2) / (threshold - 2)
+        selected = np.empty(threshold, dtype=np.int64)
+        selected[0] = 0
+        a = 0
+        for i in range(threshold - 2):
+            start = int(i * every) + 1
+            end = int((i + 1) * every) + 1
+            next_end = min(int((i + 2) * every) + 1, n)
+            avg_x = 0.0
+            avg_y = 0.0
+            for j in range(end, next_end):
+                avg_x += x[j]
+                avg_y += y[j]
+            avg_x /= next_end - end
+            avg_y /= next_end - end
+            best = -1.0
+            best_index = start
+            for j in range(start, end):
+                area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+                if area > best:
+                    best = area
+                    best_index = j
+            a = best_index
+            selected[i + 1] = a
+        selected[-1] = n - 1
+        return selected
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets降采样，返回保留点的下标
+
+    开头的NaN（例如均线尚未形成的部分）不参与降采样，其余点保留形状特征。
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.flatnonzero(~np.isnan(y))
+    if len(finite) == 0:
+        return np.empty(0, dtype=np.int64)
+    first = finite[0]
+    n = len(x) - first
+    if threshold >= n or threshold < 3:
+        return np.arange(first, len(x))
+    x, y = np.ascontiguousarray(x[first:]), np.ascontiguousarray(y[first:])
+    if indicators.USE_NUMBA:
+        return first + _lttb_numba(x, y, threshold)
+    return first + _lttb_numpy(x, y, threshold)
+
+
+class ChartSeries:
+    """一只股票一段周期的图表数据及其多级降采样结果
+
+    价格、均线、MACD在完整序列上计算一次；第 k 级把每条线用LTTB降到
+    原始点数的 1/2^k，K线和MACD柱按 2^k 根一桶聚合。各级结果在第一次
+    用到时计算并缓存，之后缩放和重绘只需按时间切片。
+    """
+
+    def __init__(self, frame):
+        self.index = frame.index
+        self.ns = pd.DatetimeIndex(frame.index).values.astype('datetime64[ns]').astype(np.int64)
+        self.x = self.ns / 1e9
+        self.open = indicators.column(frame, 'Open')
+        self.high = indicators.column(frame, 'High')
+        self.low = indicators.column(frame, 'Low')
+        close = indicators.column(frame, 'Close')
+        macd, signal, hist = indicators.macd(close)
+        self.lines = {
+            'close': close,
+            'ma20': indicators.sma(close, 20),
+            'ma200': indicators.sma(close, 200),
+            'macd': macd,
+            'signal': signal,
+        }
+        self.hist = hist
+        self.levels = max(0, int(np.floor(np.log2(max(1, len(close)) / MIN_POINTS))))
+        self.bar_levels = max(0, int(np.floor(np.log2(max(1, len(close))))))
+        self._line_cache = {}
+        self._bar_cache = {}
+
+    def __len__(self):
+        return len(self.ns)
+
+    def matches(self, frame):
+        """判断数据是否与缓存的一致（长度和最后一根K线相同）"""
+        return len(frame) == len(self) and len(frame) > 0 and \
+            frame.index[-1] == self.index[-1] and indicators.column(frame, 'Close')[-1] == self.lines['close'][-1]
+
+    def _line_indices(self, field, level):
+        key = (field, level)
+        indices = self._line_cache.get(key)
+        if indices is None:
+            if level == 0:
+                indices = np.arange(len(self))
+            else:
+                indices = lttb(self.x, self.lines[field], max(3, len(self) >> level))
+            self._line_cache[key] = indices
+        return indices
+
+    def _bars(self, level):
+        """第 level 级的K线和MACD柱（每 2^level 根聚合为一根）"""
+        bars = self._bar_cache.get(level)
+        if bars is None:
+            starts = np.arange(0, len(self), 1 << level)
+            ends = np.r_[starts[1:], len(self)] - 1
+            hist = self.hist
+            # MACD柱取每桶绝对值最大的一根，保留峰值
+            peak = np.maximum.reduceat(np.abs(np.nan_to_num(hist)), starts)
+            bars = {
+                'ns': self.ns[starts],
+                'open': self.open[starts],
+                'high': np.maximum.reduceat(self.high, starts),
+                'low': np.minimum.reduceat(self.low, starts),
+                'close': self.lines['close'][ends],
+                'hist': np.where(np.maximum.reduceat(np.nan_to_num(hist), starts) >= peak, peak, -peak),
+            }
+            self._bar_cache[level] = bars
+            metrics.increment('chart.levels.built')
+        return bars
+
+    def precompute(self):
+        """预先计算所有级别"""
+        for level in range(self.levels + 1):
+            for field in LINE_FIELDS:
+                self._line_indices(field, level)
+        for level in range(self.bar_levels + 1):
+            self._bars(level)
+
+    def _level_for(self, visible, target, max_level):
+        """选择使可见点数不少于 target 的最粗级别"""
+        if visible <= target or target <= 0:
+            return 0
+        return int(min(max_level, np.floor(np.log2(visible / target))))
+
+    @metrics.timed('chart.view')
+    def view(self, width, start=None, end=None):
+        """按画布宽度（像素）和可见时间范围返回要绘制的数据
+
+        返回字典：lines 为 {名称: (DatetimeIndex, 数值)}，bars 为聚合后的
+        K线/MACD柱数组，bar_seconds 为每根K线代表的秒数。
+        """
+        lo = 0 if start is None else int(np.searchsorted(self.ns, pd.Timestamp(start).value, side='left'))
+        hi = len(self) if end is None else int(np.searchsorted(self.ns, pd.Timestamp(end).value, side='right'))
+        visible = max(0, hi - lo)
+        start_ns, end_ns = (self.ns[lo], self.ns[hi - 1]) if visible else (0, -1)
+
+        line_level = self._level_for(visible, width, self.levels)
+        lines = {}
+        for field in LINE_FIELDS:
+            indices = self._line_indices(field, line_level)
+            indices = indices[(self.ns[indices] >= start_ns) & (self.ns[indices] <= end_ns)]
+            lines[field] = (self.index[indices], self.lines[field][indices])
+
+        bar_level = self._level_for(visible, max(1, width // PIXELS_PER_CANDLE), self.bar_levels)
+        bars = self._bars(bar_level)
+        mask = (bars['ns'] >= start_ns) & (bars['ns'] <= end_ns)
+        bars = {name: values[mask] for name, values in bars.items()}
+
+        spacing = np.median(np.diff(self.ns)) if len(self) > 1 else 86400 * 10**9
+        return {
+            'lines': lines,
+            'bars': bars,
+            'bar_seconds': spacing * (1 << bar_level) / 1e9,
+            'level': (line_level, bar_level),
+        }
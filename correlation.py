@@ -0,0 +1,145 @@
+"""持仓相关性监控：增量更新的指数加权协方差矩阵
+
+按 RiskMetrics 的做法假设日收益率均值为0，协方差矩阵按
+S ← λ·S + (1 - λ)·r·rᵀ 递推，每出现一根新日线只需一次 O(n²) 的外积更新，
+不必重新计算整个历史。持仓变化（增减股票）时才用历史收益率面板重新初始化。
+
+高度相关（相关系数不低于 CORRELATION_THRESHOLD）的股票通过连通分量划分为
+一组，合计仓位超过 CLUSTER_LIMIT 时视为集中度风险：一组走势几乎相同的
+股票相当于一个大持仓。
+
+状态保存在 cache/covariance.npz。
+"""
+import os
+import numpy as np
+from metrics import metrics
+
+COVARIANCE_FILE = os.path.join('cache', 'covariance.npz')
+
+# 衰减系数（RiskMetrics日数据取0.94，约等于有效窗口16天）
+DECAY = 0.94
+
+# 视为高度相关的相关系数
+CORRELATION_THRESHOLD = 0.7
+
+# 一组高度相关股票的合计仓位上限（百分比），与单股上限相同
+CLUSTER_LIMIT = 25.0
+
+
+def connected_groups(adjacency):
+    """由布尔邻接矩阵求连通分量，返回每个节点的组编号（组内最小下标）"""
+    n = len(adjacency)
+    labels = np.arange(n)
+    adjacency = adjacency | np.eye(n, dtype=bool)
+    # 标签传播：每轮取邻居中的最小编号，直到不再变化（轮数不超过图的直径）
+    while True:
+        updated = np.where(adjacency, labels[None, :], n).min(axis=1)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+class EwmaCovariance:
+    """持仓日收益率的指数加权协方差矩阵"""
+
+    def __init__(self, path=COVARIANCE_FILE, decay=DECAY):
+        self.path = path
+        self.decay = decay
+        self.tickers = []
+        self.covariance = np.empty((0, 0))
+        self.last_day = -1        # 最后一次更新使用的日线日期（自然日编号）
+        if path and os.path.exists(path):
+            try:
+                with np.load(path) as data:
+                    self.tickers = [str(ticker) for ticker in data['tickers']]
+                    self.covariance = data['covariance']
+                    self.last_day = int(data['last_day'])
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Error loading covariance: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp.npz'
+        np.savez(tmp, tickers=np.array(self.tickers, dtype=str), covariance=self.covariance,
+                 last_day=np.int64(self.last_day))
+        os.replace(tmp, self.path)
+
+    def initialize(self, tickers, returns, last_day):
+        """用收益率面板 (日期 × 股票) 一次算出加权协方差（权重按衰减系数归一化）"""
+        returns = np.nan_to_num(np.asarray(returns, dtype=float))
+        weights = (1 - self.decay) * self.decay ** np.arange(len(returns))[::-1]
+        if len(weights):
+            weights /= weights.sum()
+        self.tickers = list(tickers)
+        self.covariance = (returns * weights[:, None]).T @ returns
+        self.last_day = last_day
+        metrics.increment('covariance.initialize')
+
+    def update(self, row, day):
+        """加入一天的收益率向量：S ← λS + (1-λ)·r·rᵀ，缺失的收益率按0计"""
+        row = np.nan_to_num(np.asarray(row, dtype=float))
+        self.covariance *= self.decay
+        self.covariance += (1 - self.decay) * np.outer(row, row)
+        self.last_day = day
+        metrics.increment('covariance.update')
+
+    def sync(self, tickers, days, returns):
+        """用收益率面板更新到最新：持仓不变时只追加新日期的行，否则重新初始化
+
+        days 为每行收益率对应的日期编号（升序），返回追加的天数（重新初始化时为 -1）。
+        """
+        tickers = list(tickers)
+        days = np.asarray(days)
+        if not len(days):
+            return 0
+        if tickers != self.tickers or self.covariance.shape != (len(tickers), len(tickers)):
+            self.initialize(tickers, returns, int(days[-1]))
+            self.save()
+            return -1
+        new_rows = np.flatnonzero(days > self.last_day)
+        for i in new_rows:
+            self.update(returns[i], int(days[i]))
+        if len(new_rows):
+            self.save()
+        return len(new_rows)
+
+    def volatility(self):
+        """各股票的加权日波动率"""
+        return np.sqrt(np.maximum(np.diag(self.covariance), 0.0))
+
+    def correlation(self):
+        """相关系数矩阵（波动率为0的股票与其他股票的相关系数为0）"""
+        volatility = self.volatility()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = self.covariance / np.outer(volatility, volatility)
+        correlation = np.clip(np.nan_to_num(correlation), -1.0, 1.0)
+        np.fill_diagonal(correlation, 1.0)
+        return correlation
+
+    def clusters(self, weights, threshold=CORRELATION_THRESHOLD, limit=CLUSTER_LIMIT):
+        """高度相关且合计仓位超过 limit 的股票组
+
+        weights 为与 tickers 对应的仓位百分比。返回列表，每项包含 tickers（按仓位
+        从大到小）、weight（合计仓位）和 correlation（组内平均相关系数）。
+        """
+        weights = np.asarray(weights, dtype=float)
+        if len(weights) < 2:
+            return []
+        correlation = self.correlation()
+        labels = connected_groups(correlation >= threshold)
+        totals = np.bincount(labels, weights=weights, minlength=len(labels))
+        sizes = np.bincount(labels, minlength=len(labels))
+        result = []
+        for label in np.flatnonzero((sizes > 1) & (totals > limit)):
+            members = np.flatnonzero(labels == label)
+            members = members[np.argsort(-weights[members])]
+            block = correlation[np.ix_(members, members)]
+            result.append({
+                'tickers': [self.tickers[i] for i in members],
+                'weight': float(totals[label]),
+                'correlation': float((block.sum() - len(members)) / (len(members) * (len(members) - 1))),
+            })
+        return sorted(result, key=lambda cluster: -cluster['weight'])
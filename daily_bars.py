@@ -0,0 +1,249 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from bars import period_to_days, MARKET_TZ
+import market_calendar
+from metrics import metrics
+
+DAILY_DIR = os.path.join('cache', 'daily')
+
+# 首次下载的历史长度
+HISTORY_PERIOD = '10y'
+
+# 公司行为种类
+SPLIT, DIVIDEND = 0, 1
+
+PRICE_COLUMNS = ('Open', 'High', 'Low', 'Close')
+
+
+def day_number(date):
+    """日期的自然日编号（与 to_days 一致）"""
+    return int(np.datetime64(pd.Timestamp(date).date(), 'D').astype(np.int64))
+
+
+def to_days(index):
+    """把DatetimeIndex转换为纽约时区的自然日编号"""
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert(MARKET_TZ).tz_localize(None)
+    return index.values.astype('datetime64[D]').astype(np.int64)
+
+
+def adjustment_factors(close, split_ratio, dividend):
+    """向量化计算每个交易日的累计复权因子
+
+    split_ratio 和 dividend 为与 close 等长的数组（无事件时分别为1和0），
+    事件发生在当日开盘前。第 t 日的因子为 t 之后所有事件因子的乘积：
+    拆股为 1/比例，分红为 1 - 分红 / 前收盘。原始价格乘以因子得到复权价格；
+    因子只依赖价格比值，对已复权的序列求出的因子与原始序列一致。
+    """
+    close = np.asarray(close, dtype=np.float64)
+    prev_close = np.r_[np.nan, close[:-1]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dividend_factor = np.where((dividend > 0) & (prev_close > 0), 1 - dividend / prev_close, 1.0)
+    events = dividend_factor / split_ratio
+    # 从后往前累乘得到 t 及之后的乘积，再错开一位
+    after = np.cumprod(events[::-1])[::-1]
+    return np.r_[after[1:], 1.0]
+
+
+def _event_arrays(days, action_days, kinds, values):
+    """把公司行为表展开为按交易日对齐的拆股比例和分红数组"""
+    split_ratio = np.ones(len(days))
+    dividend = np.zeros(len(days))
+    # 非交易日的公司行为归到之后的第一个交易日
+    rows = np.searchsorted(days, action_days, side='left')
+    inside = rows < len(days)
+    splits = inside & (kinds == SPLIT)
+    dividends = inside & (kinds == DIVIDEND)
+    np.multiply.at(split_ratio, rows[splits], values[splits])
+    np.add.at(dividend, rows[dividends], values[dividends])
+    return split_ratio, dividend
+
+
+def _column(frame, name, default=0.0):
+    if name not in frame:
+        return np.full(len(frame), default)
+    values = np.asarray(frame[name], dtype=np.float64)
+    return np.nan_to_num(values.reshape(len(frame), -1)[:, 0])
+
+
+class DailyBarCache:
+    """日线缓存：保存原始（未复权）K线和公司行为表
+
+    每只股票一个 .npz 文件，包含交易日编号、原始OHLC和成交量，以及拆股/分红
+    事件表（日期、种类、数值）。读取时用 adjustment_factors 按当前的事件表
+    即时计算复权序列，出现新的拆股或分红时只需追加一行事件，不必重新下载历史。
+
+    数据源返回的是截至下载时已复权的价格（并带有 Dividends / Stock Splits 列），
+    写入前用同一次下载中的事件把它还原为原始价格。
+    """
+
+    def __init__(self, provider, root=DAILY_DIR):
+        self.provider = provider
+        self.root = root
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _path(self, ticker):
+        return os.path.join(self.root, f"{ticker.replace('^', '_')}.npz")
+
+    def _get(self, ticker):
+        """读取某股票的缓存数组（内存中缓存）"""
+        data = self._data.get(ticker)
+        if data is None:
+            path = self._path(ticker)
+            if os.path.exists(path):
+                with np.load(path) as stored:
+                    data = {name: stored[name] for name in stored.files}
+            else:
+                data = {
+                    'days': np.empty(0, dtype=np.int64),
+                    'ohlc': np.empty((0, 4)),
+                    'volume': np.empty(0),
+                    'action_days': np.empty(0, dtype=np.int64),
+                    'action_kinds': np.empty(0, dtype=np.int8),
+                    'action_values': np.empty(0),
+                }
+            self._data[ticker] = data
+        return data
+
+    def is_complete(self, ticker, now=None):
+        """缓存是否已包含最近一个已收盘交易日的完整日线
+
+        最后一根K线是最近的已收盘交易日、且是在该日收盘后下载的，那么在下一个
+        交易日收盘前（周末、节假日、收盘后）不可能出现新数据。交易时段内当天的
+        K线仍在变化，总是返回 False。
+        """
+        if market_calendar.market_open(now):
+            return False
+        data = self._get(ticker)
+        session = day_number(market_calendar.last_session_day(now))
+        return len(data['days']) > 0 and data['days'][-1] >= session and int(data.get('checked', -1)) >= session
+
+    def _save(self, ticker, data):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(ticker)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **data)
+        os.replace(tmp, path)
+        self._data[ticker] = data
+
+    def _merge_actions(self, data, action_days, kinds, values):
+        """合并公司行为（同一天同一种类以新值为准），返回事件表是否有变化"""
+        days = np.concatenate([data['action_days'], action_days])
+        all_kinds = np.concatenate([data['action_kinds'], kinds]).astype(np.int8)
+        all_values = np.concatenate([data['action_values'], values])
+        keys = days * 2 + all_kinds
+        # 保留每个 (日期, 种类) 最后一次出现的记录
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = np.sort(len(keys) - 1 - last)
+        order = keep[np.argsort(days[keep], kind='stable')]
+        changed = len(order) != len(data['action_days']) or not np.array_equal(all_values[order], data['action_values'])
+        data['action_days'], data['action_kinds'], data['action_values'] = days[order], all_kinds[order], all_values[order]
+        return changed
+
+    @metrics.timed('daily_bars.refresh')
+    def refresh(self, ticker):
+        """从最后一个缓存日开始补齐日线，返回新增的公司行为数"""
+        with self._lock:
+            data = dict(self._get(ticker))
+            # 下载前确定的已收盘交易日，下载得到的该日及之前的K线都是完整的
+            session = day_number(market_calendar.last_session_day())
+            if len(data['days']):
+                start = pd.Timestamp(int(data['days'][-1]), unit='D').strftime('%Y-%m-%d')
+                frame = self.provider.history(ticker, start=start)
+            else:
+                frame = self.provider.history(ticker, period=HISTORY_PERIOD)
+            if frame is None or frame.empty:
+                return 0
+
+            days = to_days(frame.index)
+            split_ratio = _column(frame, 'Stock Splits')
+            split_ratio = np.where(split_ratio > 0, split_ratio, 1.0)
+            dividend = _column(frame, 'Dividends')
+
+            # 用本次下载中的事件还原原始价格和成交量
+            adjusted_close = _column(frame, 'Close', np.nan)
+            price_factor = adjustment_factors(adjusted_close, split_ratio, dividend)
+            split_factor = adjustment_factors(adjusted_close, split_ratio, np.zeros(len(frame)))
+            ohlc = np.column_stack([_column(frame, name, np.nan) for name in PRICE_COLUMNS]) / price_factor[:, None]
+            volume = _column(frame, 'Volume') * split_factor
+
+            # 分红金额同样还原为原始口径
+            split_events = split_ratio != 1
+            dividend_events = dividend > 0
+            before = len(data['action_days'])
+            self._merge_actions(
+                data,
+                np.concatenate([days[split_events], days[dividend_events]]),
+                np.r_[np.full(split_events.sum(), SPLIT), np.full(dividend_events.sum(), DIVIDEND)],
+                np.concatenate([split_ratio[split_events], dividend[dividend_events] / split_factor[dividend_events]]),
+            )
+            added = len(data['action_days']) - before
+
+            # 新数据覆盖重叠的交易日
+            keep = data['days'] < days[0]
+            data['days'] = np.concatenate([data['days'][keep], days])
+            data['ohlc'] = np.concatenate([data['ohlc'][keep], ohlc])
+            data['volume'] = np.concatenate([data['volume'][keep], volume])
+            data['checked'] = np.array(session, dtype=np.int64)
+            self._save(ticker, data)
+            return added
+
+    def add_action(self, ticker, date, kind, value):
+        """记录一条公司行为（例如从报价信息中得到的拆股），返回是否为新记录"""
+        with self._lock:
+            data = dict(self._get(ticker))
+            day = to_days([pd.Timestamp(date)])
+            changed = self._merge_actions(data, day, np.array([kind], dtype=np.int8), np.array([float(value)]))
+            if changed:
+                self._save(ticker, data)
+            return changed
+
+    def actions(self, ticker):
+        """返回公司行为表"""
+        data = self._get(ticker)
+        return pd.DataFrame({
+            'date': pd.to_datetime(data['action_days'], unit='D'),
+            'kind': np.where(data['action_kinds'] == SPLIT, 'split', 'dividend'),
+            'value': data['action_values'],
+        })
+
+    def splits_since(self, ticker, date):
+        """返回 date 之后（不含）的拆股 [(日期, 比例)]"""
+        data = self._get(ticker)
+        day = to_days([pd.Timestamp(date)])[0]
+        mask = (data['action_kinds'] == SPLIT) & (data['action_days'] > day)
+        return [(pd.Timestamp(int(d), unit='D'), float(v)) for d, v in zip(data['action_days'][mask], data['action_values'][mask])]
+
+    @metrics.timed('daily_bars.load')
+    def load(self, ticker, period='1y', adjusted=True, refresh=True):
+        """读取最近 period 的日线，默认返回前复权价格
+
+        缓存已完整（见 is_complete）时不请求网络。
+        """
+        if refresh and self.is_complete(ticker):
+            metrics.increment('daily_bars.skipped')
+        elif refresh:
+            try:
+                self.refresh(ticker)
+            except Exception as e:
+                print(f"Error fetching daily bars for {ticker}: {e}")
+        data = self._get(ticker)
+        if not len(data['days']):
+            return pd.DataFrame(columns=PRICE_COLUMNS + ('Volume',))
+        ohlc, volume = data['ohlc'], data['volume']
+        if adjusted and len(data['action_days']):
+            split_ratio, dividend = _event_arrays(data['days'], data['action_days'], data['action_kinds'], data['action_values'])
+            price_factor = adjustment_factors(ohlc[:, 3], split_ratio, dividend)
+            split_factor = adjustment_factors(ohlc[:, 3], split_ratio, np.zeros(len(split_ratio)))
+            ohlc = ohlc * price_factor[:, None]
+            volume = volume / split_factor
+        first_day = data['days'][-1] - period_to_days(period)
+        rows = slice(int(np.searchsorted(data['days'], first_day, side='left')), None)
+        index = pd.DatetimeIndex(data['days'][rows].astype('datetime64[D]')).tz_localize(MARKET_TZ)
+        frame = pd.DataFrame(ohlc[rows], index=index, columns=PRICE_COLUMNS)
+        frame['Volume'] = volume[rows]
+        return frame
@@ -0,0 +1,43 @@
+import time
+import yfinance as yf
+from metrics import metrics
+
+# 请求失败时的重试次数和间隔（秒）
+MAX_RETRIES = 2
+RETRY_DELAY = 1.0
+
+
+class YFinanceProvider:
+    """行情数据源：封装所有对yfinance的调用
+
+    StockProcessor 只通过 history() 和 info() 获取数据，
+    替换为其他实现（例如离线合成数据）即可在无网络环境下运行。
+    """
+
+    def __init__(self, retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def _call(self, func):
+        """执行请求，失败时按设定次数重试"""
+        for attempt in range(self.retries + 1):
+            try:
+                return func()
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                metrics.increment('fetch.retries')
+                time.sleep(self.retry_delay)
+
+    def history(self, ticker, period=None, interval='1d', start=None, end=None):
+        """获取K线数据，返回包含 Open/High/Low/Close/Volume 列的DataFrame"""
+        stock = yf.Ticker(ticker)
+        with metrics.span('fetch.history', ticker=ticker, interval=interval):
+            if start is not None or end is not None:
+                return self._call(lambda: stock.history(start=start, end=end, interval=interval))
+            return self._call(lambda: stock.history(period=period or '1y', interval=interval))
+
+    def info(self, ticker):
+        """获取股票的基本信息和报价字典"""
+        with metrics.span('fetch.info', ticker=ticker):
+            return self._call(lambda: yf.Ticker(ticker).info)
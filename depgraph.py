@@ -0,0 +1,136 @@
+"""按股票分键的依赖计算图
+
+节点分为数据源节点和计算节点。数据源节点的值由外部写入（例如报价、成本价、
+VIX），计算节点由依赖节点的值算出。每个 (节点, 股票) 保存一个版本号：
+值真正发生变化时才分配新的版本号。读取计算节点时先确保依赖是最新的，
+只有依赖的版本号与上次计算时不同才重新计算；重新计算得到相同的值时版本号
+不变，下游节点也就不会被重算。
+
+不分键的节点（keyed=False，例如VIX）所有股票共用一个值。
+"""
+import threading
+import numpy as np
+import pandas as pd
+from metrics import metrics
+
+
+def _same(a, b):
+    """比较两个节点值是否相同（支持DataFrame和NumPy数组）"""
+    if a is b:
+        return True
+    if isinstance(a, (pd.DataFrame, pd.Series)) or isinstance(b, (pd.DataFrame, pd.Series)):
+        return type(a) is type(b) and a.equals(b)
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.array_equal(a, b, equal_nan=True)
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+
+class _Node:
+    def __init__(self, name, func, deps, keyed, default=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.keyed = keyed
+        self.default = default
+
+
+class DependencyGraph:
+    """拉取式的依赖计算图
+
+    source() 注册数据源节点，node() 注册计算节点；计算函数的参数依次为
+    股票代码（仅分键节点）和各依赖节点的值。set() 写入数据源，get() 读取
+    节点值（必要时沿依赖链重新计算）。
+    """
+
+    def __init__(self):
+        self._nodes = {}
+        self._state = {}    # (节点, 键) -> [值, 版本号, 依赖版本号]
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    def source(self, name, keyed=True, default=None):
+        """注册数据源节点，未写入过的键读取到 default"""
+        self._nodes[name] = _Node(name, None, (), keyed, default)
+
+    def node(self, name, func, deps, keyed=True):
+        """注册计算节点，依赖必须已经注册"""
+        for dep in deps:
+            if dep not in self._nodes:
+                raise KeyError(f"未注册的依赖节点: {dep}")
+            if self._nodes[dep].keyed and not keyed:
+                raise ValueError(f"不分键的节点 {name} 不能依赖分键节点 {dep}")
+        self._nodes[name] = _Node(name, func, deps, keyed)
+
+    def _key(self, node, key):
+        return (node.name, key if node.keyed else None)
+
+    def set(self, name, key=None, value=None):
+        """写入数据源节点的值，返回值是否发生变化"""
+        node = self._nodes[name]
+        if node.func is not None:
+            raise ValueError(f"{name} 是计算节点，不能直接写入")
+        state_key = self._key(node, key)
+        with self._lock:
+            state = self._state.get(state_key)
+            if state is not None and _same(state[0], value):
+                return False
+            self._clock += 1
+            self._state[state_key] = [value, self._clock, None]
+            return True
+
+    def version(self, name, key=None):
+        """节点当前的版本号，从未计算或写入过时为0"""
+        state = self._state.get(self._key(self._nodes[name], key))
+        return 0 if state is None else state[1]
+
+    def get(self, name, key=None):
+        """读取节点的值，依赖有变化时重新计算"""
+        return self._ensure(self._nodes[name], key)[0]
+
+    def _ensure(self, node, key):
+        """返回 (值, 版本号)，必要时先递归更新依赖"""
+        state_key = self._key(node, key)
+        if node.func is None:
+            state = self._state.get(state_key)
+            return (node.default, 0) if state is None else (state[0], state[1])
+
+        inputs = [self._ensure(self._nodes[dep], key) for dep in node.deps]
+        dep_versions = tuple(version for _, version in inputs)
+        state = self._state.get(state_key)
+        if state is not None and state[2] == dep_versions:
+            metrics.increment('graph.hit')
+            return state[0], state[1]
+
+        # 计算在锁外进行（可能访问网络），同一节点偶尔被并发重复计算不影响结果
+        args = [value for value, _ in inputs]
+        with metrics.span('graph.compute', node=node.name, ticker=key):
+            value = node.func(key, *args) if node.keyed else node.func(*args)
+        with self._lock:
+            current = self._state.get(state_key)
+            if current is not None and _same(current[0], value):
+                current[2] = dep_versions
+                return current[0], current[1]
+            self._clock += 1
+            self._state[state_key] = [value, self._clock, dep_versions]
+            return value, self._clock
+
+    def invalidate(self, name, key=None):
+        """强制计算节点下次读取时重新计算"""
+        with self._lock:
+            state = self._state.get(self._key(self._nodes[name], key))
+            if state is not None:
+                state[2] = None
+
+    def discard(self, key):
+        """删除某只股票的全部节点状态（例如移除持仓后）"""
+        with self._lock:
+            for state_key in [state_key for state_key in self._state if state_key[1] == key and key is not None]:
+                del self._state[state_key]
+
+    def keys(self, name):
+        """已有状态的键"""
+        with self._lock:
+            return [key for node, key in self._state if node == name]
@@ -0,0 +1,267 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+from metrics import metrics
+
+EQUITY_DIR = os.path.join('cache', 'equity')
+
+# 汇总级别（秒），每个时间桶保留最后一个快照
+ROLLUPS = {
+    '1h': 60 * 60,
+    '1d': 24 * 60 * 60,
+}
+
+# 加载净值曲线时默认的最大点数，超过时改用更粗的汇总级别
+MAX_POINTS = 2000
+
+
+def _to_seconds(value):
+    """把时间转换为Unix秒，数字视为已是秒"""
+    if value is None or isinstance(value, (int, float, np.integer)):
+        return value
+    return int(pd.Timestamp(value).timestamp())
+
+
+class _Series:
+    """只追加的列式时间序列
+
+    时间戳以相邻快照的秒数差（uint32）存储，基准时间保存在 meta.json；
+    数值列为 float32，每列一个文件，追加时只写文件末尾。
+    """
+
+    def __init__(self, root, columns):
+        self.root = root
+        self.columns = columns
+        self.base = None
+        self.last_ts = None
+        self.count = 0
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def open(self):
+        meta_path = self._path('meta.json')
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, 'r') as f:
+            self.base = json.load(f)['base']
+        deltas = np.fromfile(self._path('ts.u32'), dtype=np.uint32)
+        # 以最短的文件为准，忽略写入中断留下的不完整记录
+        sizes = [len(deltas)] + [os.path.getsize(self._path(f"{name}.f32")) // 4 for name in self.columns]
+        self.count = min(sizes)
+        self.last_ts = self.base + int(deltas[:self.count].sum(dtype=np.int64))
+
+    def append(self, ts, values):
+        """追加一行，ts为Unix秒"""
+        if self.base is None:
+            os.makedirs(self.root, exist_ok=True)
+            self.base = self.last_ts = ts
+            with open(self._path('meta.json'), 'w') as f:
+                json.dump({'base': ts, 'columns': list(self.columns)}, f)
+        delta = max(0, ts - self.last_ts)
+        with open(self._path('ts.u32'), 'ab') as f:
+            f.write(np.uint32(delta).tobytes())
+        for name in self.columns:
+            with open(self._path(f"{name}.f32"), 'ab') as f:
+                f.write(np.float32(values[name]).tobytes())
+        self.last_ts += delta
+        self.count += 1
+
+    def read(self, start=None, end=None):
+        """读取 [start, end] 范围内的行，返回 (ts, {列名: 数组})"""
+        if not self.count:
+            return np.empty(0, dtype=np.int64), {name: np.empty(0, dtype=np.float32) for name in self.columns}
+        deltas = np.fromfile(self._path('ts.u32'), dtype=np.uint32, count=self.count)
+        ts = self.base + np.cumsum(deltas, dtype=np.int64)
+        lo = 0 if start is None else np.searchsorted(ts, start, side='left')
+        hi = self.count if end is None else np.searchsorted(ts, end, side='right')
+        values = {}
+        for name in self.columns:
+            column = np.memmap(self._path(f"{name}.f32"), dtype=np.float32, mode='r', shape=(self.count,))
+            values[name] = np.array(column[lo:hi])
+        return ts[lo:hi], values
+
+
+class EquityStore:
+    """投资组合净值快照存储
+
+    每次刷新记录现金、总价值和各持仓市值。现金和总价值同时写入按小时、
+    按天的汇总序列（每个时间桶保留最后一个快照），长时间范围直接读取汇总，
+    多年的五分钟快照也能即时加载。
+
+    各持仓市值只在变化时记录：每个快照在 position_offsets.i64 中写一个偏移量
+    （此前的记录条数，8字节），市值与上一次记录不同（按float32比较）或持仓被
+    清空（记为0）的股票在 position_ids.u32 / position_values.f32 中各写一条
+    （共8字节），读取时向后沿用每只股票最近一次的市值。例如50只持仓、开盘期间
+    每5分钟刷新一次（每天78个快照，报价都有变化）每天约 78 × (8 + 50 × 8) ≈ 32KB，
+    一年约8MB；休市期间的快照每个只占偏移量的8字节。
+    """
+
+    def __init__(self, root=EQUITY_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self.raw = _Series(os.path.join(root, 'raw'), ('cash', 'total'))
+        self.rollups = {level: _Series(os.path.join(root, level), ('cash', 'total')) for level in ROLLUPS}
+        self.tickers = []
+        self._ticker_ids = {}
+        self._pending = {}        # 每个汇总级别当前未结束的时间桶：(桶, ts, 数值)
+        self._entries = 0         # 已写入的持仓记录条数
+        self._last_values = {}    # 股票编号 -> 最近一次记录的市值（float32）
+        self.open()
+
+    def _read_positions(self):
+        """读取持仓记录，返回 (每个快照的起始偏移量, 股票编号, 市值)，以最短的文件为准"""
+        def load(name, dtype):
+            path = os.path.join(self.root, name)
+            return np.fromfile(path, dtype=dtype) if os.path.exists(path) else np.empty(0, dtype=dtype)
+
+        offsets = load('position_offsets.i64', np.int64)
+        ids = load('position_ids.u32', np.uint32)
+        values = load('position_values.f32', np.float32)
+        count = min(len(ids), len(values))
+        return np.minimum(offsets[:self.raw.count], count), ids[:count], values[:count]
+
+    @staticmethod
+    def _latest(ids, values):
+        """每只股票最后一条记录的 {编号: 市值}"""
+        reversed_ids = ids[::-1]
+        unique, first = np.unique(reversed_ids, return_index=True)
+        return dict(zip(unique.tolist(), values[::-1][first].tolist()))
+
+    def open(self):
+        """打开已有的存储"""
+        with self._lock:
+            self.raw.open()
+            for series in self.rollups.values():
+                series.open()
+            tickers_path = os.path.join(self.root, 'tickers.json')
+            if os.path.exists(tickers_path):
+                with open(tickers_path, 'r') as f:
+                    self.tickers = json.load(f)
+            self._ticker_ids = {ticker: i for i, ticker in enumerate(self.tickers)}
+            offsets, ids, values = self._read_positions()
+            self._entries = len(ids)
+            self._last_values = {i: v for i, v in self._latest(ids, values).items() if v != 0}
+            # 写入中断时缺少偏移量的快照视为没有变化，补齐后与快照行号对齐
+            if len(offsets) < self.raw.count:
+                with open(os.path.join(self.root, 'position_offsets.i64'), 'ab') as f:
+                    f.write(np.full(self.raw.count - len(offsets), self._entries, dtype=np.int64).tobytes())
+            # 最后一个快照所在的时间桶尚未结束，汇总行在桶结束时写入
+            self._pending = {}
+            if self.raw.count:
+                ts, values = self.raw.read(start=self.raw.last_ts)
+                row = {name: float(column[-1]) for name, column in values.items()}
+                for level, seconds in ROLLUPS.items():
+                    self._pending[level] = (int(ts[-1]) // seconds, int(ts[-1]), row)
+
+    def _ticker_id(self, ticker):
+        ticker_id = self._ticker_ids.get(ticker)
+        if ticker_id is None:
+            ticker_id = self._ticker_ids[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+        return ticker_id
+
+    @metrics.timed('equity.record')
+    def record(self, portfolio, ts=None):
+        """记录一次投资组合快照，ts为Unix秒（默认当前时间）"""
+        ts = int(pd.Timestamp.now(tz='UTC').timestamp()) if ts is None else int(ts)
+        row = {'cash': portfolio['cash'], 'total': portfolio['total_value']}
+        with self._lock:
+            if self.raw.count and ts < self.raw.last_ts:
+                return
+            self.raw.append(ts, row)
+
+            known = len(self.tickers)
+            current = {self._ticker_id(stock['ticker']): float(np.float32(stock.get('value', 0.0)))
+                       for stock in portfolio['stocks']}
+            # 有新股票时整个快照只写一次股票列表
+            if len(self.tickers) > known:
+                with open(os.path.join(self.root, 'tickers.json'), 'w') as f:
+                    json.dump(self.tickers, f)
+            # 只记录市值变化的持仓，清空的持仓记为0
+            changed = {i: v for i, v in current.items() if self._last_values.get(i, 0.0) != v}
+            changed.update({i: 0.0 for i in self._last_values if i not in current})
+            with open(os.path.join(self.root, 'position_offsets.i64'), 'ab') as f:
+                f.write(np.int64(self._entries).tobytes())
+            if changed:
+                with open(os.path.join(self.root, 'position_ids.u32'), 'ab') as f:
+                    f.write(np.fromiter(changed, dtype=np.uint32, count=len(changed)).tobytes())
+                with open(os.path.join(self.root, 'position_values.f32'), 'ab') as f:
+                    f.write(np.fromiter(changed.values(), dtype=np.float32, count=len(changed)).tobytes())
+                self._entries += len(changed)
+            self._last_values = {i: v for i, v in current.items() if v != 0}
+
+            # 进入新的时间桶时，把上一个桶的最后一个快照写入汇总
+            for level, seconds in ROLLUPS.items():
+                bucket = ts // seconds
+                pending = self._pending.get(level)
+                if pending is not None and pending[0] != bucket:
+                    self.rollups[level].append(pending[1], pending[2])
+                self._pending[level] = (bucket, ts, row)
+
+    def _choose_level(self, start, end, max_points):
+        """选择范围内点数不超过 max_points 的最细级别"""
+        first = self.raw.base if start is None else max(start, self.raw.base)
+        last = self.raw.last_ts if end is None else min(end, self.raw.last_ts)
+        span = max(0, last - first)
+        if self.raw.count and span / max(1, self.raw.last_ts - self.raw.base) * self.raw.count <= max_points:
+            return 'raw'
+        for level, seconds in ROLLUPS.items():
+            if span / seconds <= max_points:
+                return level
+        return list(ROLLUPS)[-1]
+
+    @metrics.timed('equity.load')
+    def load(self, start=None, end=None, max_points=MAX_POINTS, level=None):
+        """读取净值曲线，返回以时间为索引、包含 cash/total 列的DataFrame
+
+        start/end 为Unix秒或可被 pd.Timestamp 解析的时间；level 为 'raw'、'1h' 或 '1d'，
+        未指定时按范围自动选择。
+        """
+        start, end = _to_seconds(start), _to_seconds(end)
+        with self._lock:
+            if not self.raw.count:
+                return pd.DataFrame(columns=['cash', 'total'])
+            level = level if level is not None else self._choose_level(start, end, max_points)
+            if level == 'raw':
+                ts, values = self.raw.read(start, end)
+            else:
+                ts, values = self.rollups[level].read(start, end)
+                # 附上当前未结束时间桶的最新快照
+                _, last_ts, row = self._pending[level]
+                if (start is None or last_ts >= start) and (end is None or last_ts <= end):
+                    ts = np.append(ts, last_ts)
+                    values = {name: np.append(column, np.float32(row[name])) for name, column in values.items()}
+        index = pd.to_datetime(ts, unit='s', utc=True)
+        return pd.DataFrame(values, index=index)
+
+    def positions(self, start=None, end=None):
+        """读取各持仓市值的原始快照，返回以时间为索引、每只股票一列的DataFrame"""
+        start, end = _to_seconds(start), _to_seconds(end)
+        with self._lock:
+            if not self.raw.count:
+                return pd.DataFrame()
+            ts, _ = self.raw.read()
+            offsets, ids, values = self._read_positions()
+            tickers = list(self.tickers)
+        ts = ts[:len(offsets)]
+        # 每条记录所属的快照行号
+        rows = np.repeat(np.arange(len(offsets)), np.diff(np.append(offsets, len(ids))))
+        lo = 0 if start is None else np.searchsorted(ts, start, side='left')
+        hi = len(ts) if end is None else np.searchsorted(ts, end, side='right')
+        # 变化记录展开为 行 × 股票 的矩阵：窗口开始时的市值取之前最后一条记录，之后向后沿用
+        matrix = np.full((hi - lo, len(tickers)), np.nan, dtype=np.float32)
+        mask = (rows >= lo) & (rows < hi)
+        matrix[rows[mask] - lo, ids[mask]] = values[mask]
+        if hi > lo:
+            before = rows < lo
+            initial = np.zeros(len(tickers), dtype=np.float32)
+            for ticker_id, value in self._latest(ids[before], values[before]).items():
+                initial[ticker_id] = value
+            matrix[0] = np.where(np.isnan(matrix[0]), initial, matrix[0])
+            last = np.where(~np.isnan(matrix), np.arange(hi - lo)[:, None], 0)
+            np.maximum.accumulate(last, axis=0, out=last)
+            matrix = np.take_along_axis(matrix, last, axis=0)
+        return pd.DataFrame(matrix, index=pd.to_datetime(ts[lo:hi], unit='s', utc=True), columns=tickers)
@@ -0,0 +1,69 @@
+"""从券商导出的CSV批量导入持仓
+
+read_positions() 一次性读入整张表，用向量化操作完成列名识别、数值解析和校验，
+同一股票的多行按股数加权合并为一条持仓。校验失败的行连同原因单独返回，
+不影响其余行的导入。
+"""
+import numpy as np
+import pandas as pd
+
+# 各字段可接受的列名（不区分大小写）
+COLUMN_ALIASES = {
+    'ticker': ('ticker', 'symbol', 'code', '股票代码', '代码'),
+    'shares': ('shares', 'quantity', 'qty', 'position', '持股数', '数量'),
+    'price': ('price', 'avg_price', 'average cost', 'avg cost', 'cost', 'cost basis', 'cost/share',
+              '成本价', '平均成本', '价格'),
+}
+
+# 股票代码：字母数字开头，可包含 . - ^ =（例如 BRK.B、^VIX）
+TICKER_PATTERN = r'^[A-Z0-9^][A-Z0-9.\-=^]{0,14}$'
+
+
+def _find_column(columns, field):
+    names = {str(column).strip().lower(): column for column in columns}
+    for alias in COLUMN_ALIASES[field]:
+        if alias in names:
+            return names[alias]
+    raise ValueError(f"CSV缺少 {field} 列（可用列名: {', '.join(COLUMN_ALIASES[field])}）")
+
+
+def _to_number(values):
+    """解析数值列，去掉千分位逗号和货币符号，无法解析的为NaN"""
+    text = values.astype(str).str.replace(r'[,$\s]', '', regex=True)
+    return pd.to_numeric(text, errors='coerce').to_numpy(dtype=float)
+
+
+def read_positions(source):
+    """读取并校验持仓表
+
+    source 为CSV路径、文件对象或DataFrame。返回 (positions, rejected)：
+    positions 列为 ticker / shares / price（合并后的加权成本），
+    rejected 列为 row（原表行号，从1开始不含表头）/ ticker / reason。
+    """
+    frame = source if isinstance(source, pd.DataFrame) else pd.read_csv(source, dtype=str, skipinitialspace=True)
+    tickers = frame[_find_column(frame.columns, 'ticker')].fillna('').astype(str).str.strip().str.upper()
+    shares = _to_number(frame[_find_column(frame.columns, 'shares')])
+    prices = _to_number(frame[_find_column(frame.columns, 'price')])
+
+    bad_ticker = ~tickers.str.match(TICKER_PATTERN).to_numpy()
+    bad_shares = ~(shares > 0)
+    bad_price = ~(prices > 0)
+    reasons = np.select([bad_ticker, bad_shares, bad_price], ['无效的股票代码', '持股数必须为正数', '成本价必须为正数'],
+                        default='')
+    valid = reasons == ''
+
+    rejected = pd.DataFrame({
+        'row': np.flatnonzero(~valid) + 1,
+        'ticker': tickers.to_numpy()[~valid],
+        'reason': reasons[~valid],
+    })
+
+    # 同一股票的多行合并：股数相加，成本按股数加权
+    rows = pd.DataFrame({'ticker': tickers.to_numpy()[valid], 'shares': shares[valid], 'cost': shares[valid] * prices[valid]})
+    grouped = rows.groupby('ticker', sort=False, as_index=False).sum()
+    positions = pd.DataFrame({
+        'ticker': grouped['ticker'],
+        'shares': grouped['shares'],
+        'price': grouped['cost'] / grouped['shares'],
+    })
+    return positions, rejected
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+from metrics import metrics
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# 可以手动关闭Numba加速（例如用于对比测试）
+USE_NUMBA = HAS_NUMBA
+
+
+def _as_2d(values):
+    """把一维或二维输入转换为 (时间 × 股票) 的float64数组，返回数组和是否需要压回一维"""
+    x = np.asarray(values, dtype=np.float64)
+    if x.ndim == 1:
+        return x.reshape(-1, 1), True
+    return x, False
+
+
+def _restore(x, squeeze):
+    return x[:, 0] if squeeze else x
+
+
+def column(frame, name):
+    """从DataFrame取出一维float数组，兼容yfinance返回的多级列"""
+    values = np.asarray(frame[name], dtype=np.float64)
+    return values.reshape(len(frame), -1)[:, 0]
+
+
+# 分块递推时块内缩放系数 (1 - alpha)^-k 的上限，保证块内累加的相对误差在1e-12左右
+EMA_MAX_SCALE = 1e4
+
+
+def _ema_pandas(x, alpha):
+    """pandas ewm 的C实现，用于中间有缺失值的列（缺失值的权重规则难以向量化）"""
+    return pd.DataFrame(x, copy=False).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+def _ema_blocks(x, alpha, start, out):
+    """无缺失值的面板按块做向量化递推
+
+    y[t] = (1-α)·y[t-1] + α·x[t] 在长度为 k 的块内展开为
+    y[s+i] = (1-α)^(i+1) · (y[s-1] + α·Σ_{j≤i} (1-α)^-(j+1)·x[s+j])，
+    块内是一次 cumsum，块之间只传递最后一行。块长使 (1-α)^-k 不超过 EMA_MAX_SCALE。
+    start 为每列的初值（第一行之前的 y），结果写入 out。
+    """
+    rows = len(x)
+    decay = 1.0 - alpha
+    block = max(1, int(np.log(EMA_MAX_SCALE) / -np.log(decay)))
+    k = np.arange(1, min(block, rows) + 1, dtype=np.float64)
+    weight = (alpha * decay ** -k)[:, None]
+    shrink = (decay ** k)[:, None]
+    carry = start
+    for s in range(0, rows, block):
+        chunk = out[s:s + block]
+        n = len(chunk)
+        np.multiply(x[s:s + n], weight[:n], out=chunk)
+        np.cumsum(chunk, axis=0, out=chunk)
+        chunk += carry
+        chunk *= shrink[:n]
+        carry = chunk[-1]
+    return out
+
+
+def _ema_numpy(x, alpha):
+    """没有Numba时的EMA：开头的缺失值按第一天的价格递推后再还原为NaN（结果与
+    pandas 相同），中间有缺失值的列交给 pandas"""
+    rows, cols = x.shape
+    out = np.empty_like(x)
+    if not rows or not cols:
+        return out
+    if alpha >= 1:
+        return _ema_pandas(x, alpha)
+    missing = np.isnan(x)
+    if not missing.any():
+        return _ema_blocks(x, alpha, x[0], out)
+    # 每列第一个有效值的位置；之后仍有缺失值（或整列缺失）的列不能分块递推
+    first = missing.argmin(axis=0)
+    gaps = np.count_nonzero(missing, axis=0) != first
+    gaps |= missing.all(axis=0)
+    if gaps.any():
+        out[:, gaps] = _ema_pandas(x[:, gaps], alpha)
+    clean = ~gaps
+    if not clean.any():
+        return out
+    lead = int(first[clean].max())
+    xs = x[:, clean] if gaps.any() else x.copy()
+    start = xs[first[clean], np.arange(xs.shape[1])]
+    xs[:lead] = np.where(missing[:lead][:, clean], start, xs[:lead])
+    result = _ema_blocks(xs, alpha, start, np.empty_like(xs))
+    result[:lead][np.arange(lead)[:, None] < first[clean]] = np.nan
+    out[:, clean] = result
+    return out
+
+
+if HAS_NUMBA:
+    @njit(cache=True)
+    def _ema_numba(x, alpha):
+        rows, cols = x.shape
+        out = np.empty_like(x)
+        for j in range(cols):
+            weighted = np.nan
+            old_wt = 1.0
+            for t in range(rows):
+                cur = x[t, j]
+                if weighted == weighted:
+                    old_wt *= 1 - alpha
+                    if cur == cur:
+                        weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                        old_wt = 1.0
+                elif cur == cur:
+                    weighted = cur
+                out[t, j] = weighted
+        return out
+
+
+@metrics.timed('indicators.ema')
+def ema(values, span):
+    """指数移动平均，与 pandas ewm(span=span, adjust=False).mean() 结果一致"""
+    x, squeeze = _as_2d(values)
+    alpha = 2.0 / (span + 1.0)
+    if USE_NUMBA:
+        out = _ema_numba(np.ascontiguousarray(x), alpha)
+    else:
+        out = _ema_numpy(x, alpha)
+    return _restore(out, squeeze)
+
+
+@metrics.timed('indicators.sma')
+def sma(values, window):
+    """简单移动平均，与 pandas rolling(window).mean() 结果一致（窗口内有NaN时结果为NaN）"""
+    x, squeeze = _as_2d(values)
+    out = np.full_like(x, np.nan)
+    if len(x) >= window:
+        missing = np.isnan(x)
+        has_missing = missing.any()
+        # 累加和之差即窗口和，直接写入结果数组；没有缺失值时不需要计数
+        sums = np.cumsum(np.where(missing, 0.0, x) if has_missing else x, axis=0)
+        result = out[window - 1:]
+        result[0] = sums[window - 1]
+        np.subtract(sums[window:], sums[:-window], out=result[1:])
+        result /= window
+        if has_missing:
+            counts = np.cumsum(missing, axis=0, dtype=np.int32)
+            window_missing = counts[window - 1:].copy()
+            window_missing[1:] -= counts[:-window]
+            result[window_missing > 0] = np.nan
+    return _restore(out, squeeze)
+
+
+# 成交量均量等滚动均值与SMA相同
+rolling_mean = sma
+
+
+@metrics.timed('indicators.rolling_max')
+def rolling_max(values, window):
+    """滚动最大值，与 pandas rolling(window).max() 结果一致"""
+    x, squeeze = _as_2d(values)
+    out = np.full_like(x, np.nan)
+    if len(x) >= window:
+        windows = np.lib.stride_tricks.sliding_window_view(x, window, axis=0)
+        out[window - 1:] = windows.max(axis=-1)
+    return _restore(out, squeeze)
+
+
+@metrics.timed('indicators.macd')
+def macd(close, fast=12, slow=26, signal=9):
+    """计算MACD，返回 (macd, signal, histogram)"""
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def crossover(a, b):
+    """检测上穿（金叉）：前一根 a < b 且当前 a > b，第一根始终为False"""
+    a, b = np.broadcast_arrays(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+    out = np.zeros(a.shape, dtype=bool)
+    out[1:] = (a[:-1] < b[:-1]) & (a[1:] > b[1:])
+    return out
+
+
+def crossunder(a, b):
+    """检测下穿（死叉）"""
+    return crossover(b, a)
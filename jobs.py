@@ -0,0 +1,196 @@
+"""后台任务调度
+
+界面中耗时的操作（网络请求、批量计算）交给 JobScheduler 在工作线程中执行，
+Tk 主线程只负责提交任务和处理回调，界面不会卡住。
+
+- 优先级队列：数值越小越先执行，同优先级按提交顺序
+- 去重：带 key 的任务在排队期间再次提交时返回已有的任务（优先级取较高者）
+- 取消：排队中的任务直接丢弃；运行中的任务通过 job.cancelled 协作式结束
+- 回调：进度、结果和错误回调通过 dispatch（界面中为 root.after）送回主线程
+"""
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+from metrics import metrics
+
+# 优先级：用户正在等待的操作 < 普通操作 < 后台刷新
+HIGH, NORMAL, LOW = 0, 10, 20
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = 'pending', 'running', 'done', 'failed', 'cancelled'
+
+# 默认工作线程数
+JOB_WORKERS = 4
+
+
+class Job:
+    """一个后台任务；future 可用于在非界面线程中等待结果"""
+
+    def __init__(self, scheduler, func, args, kwargs, priority, key, name,
+                 on_result, on_error, on_progress, pass_job):
+        self.scheduler = scheduler
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.key = key
+        self.name = name or getattr(func, '__name__', 'job')
+        self.on_result = on_result
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.pass_job = pass_job
+        self.status = PENDING
+        self.future = Future()
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        """是否已请求取消（运行中的任务应定期检查）"""
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """取消任务，返回是否在开始运行前被取消"""
+        return self.scheduler.cancel(self)
+
+    def report(self, done, total=None, message=None):
+        """报告进度，回调在主线程中执行"""
+        if self.on_progress is not None:
+            self.scheduler.dispatch(lambda: self.on_progress(done, total, message))
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class JobScheduler:
+    """带优先级、去重和取消的工作线程池"""
+
+    def __init__(self, workers=JOB_WORKERS, dispatch=None):
+        self.dispatch = dispatch or (lambda callback: callback())
+        self._heap = []
+        self._pending = {}          # key -> 排队中的任务
+        self._running = set()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, func, *args, priority=NORMAL, key=None, name=None,
+               on_result=None, on_error=None, on_progress=None, pass_job=False, **kwargs):
+        """提交任务并返回 Job
+
+        pass_job=True 时任务函数的第一个参数为 Job 本身，可用于 report() 和检查 cancelled。
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("任务调度器已关闭")
+            if key is not None and key in self._pending:
+                job = self._pending[key]
+                metrics.increment('jobs.deduplicated')
+                if priority < job.priority:
+                    job.priority = priority
+                    heapq.heappush(self._heap, (priority, next(self._sequence), job))
+                return job
+            job = Job(self, func, args, kwargs, priority, key, name, on_result, on_error, on_progress, pass_job)
+            if key is not None:
+                self._pending[key] = job
+            heapq.heappush(self._heap, (priority, next(self._sequence), job))
+            self._condition.notify()
+            return job
+
+    def cancel(self, job):
+        """取消任务：排队中的直接丢弃，运行中的设置取消标志"""
+        with self._condition:
+            job._cancel.set()
+            if job.status != PENDING:
+                return False
+            job.status = CANCELLED
+            if job.key is not None and self._pending.get(job.key) is job:
+                del self._pending[job.key]
+        job.future.cancel()
+        metrics.increment('jobs.cancelled')
+        return True
+
+    def cancel_key(self, key):
+        """取消某个 key 排队中和运行中的任务，返回取消的任务数"""
+        with self._condition:
+            jobs = [job for job in self._running if job.key == key]
+            if key in self._pending:
+                jobs.append(self._pending[key])
+        for job in jobs:
+            self.cancel(job)
+        return len(jobs)
+
+    def cancel_all(self):
+        """取消所有排队中和运行中的任务"""
+        with self._condition:
+            jobs = [job for _, _, job in self._heap] + list(self._running)
+        for job in jobs:
+            self.cancel(job)
+
+    def pending(self):
+        """排队中的任务数"""
+        with self._condition:
+            return sum(1 for priority, _, job in self._heap if job.status == PENDING and priority == job.priority)
+
+    def running(self):
+        """运行中的任务列表"""
+        with self._condition:
+            return list(self._running)
+
+    def _next(self):
+        with self._condition:
+            while True:
+                while self._heap:
+                    priority, _, job = heapq.heappop(self._heap)
+                    # 跳过已取消的任务和提高优先级后留下的旧条目
+                    if job.status != PENDING or priority != job.priority:
+                        continue
+                    job.status = RUNNING
+                    if job.key is not None and self._pending.get(job.key) is job:
+                        del self._pending[job.key]
+                    self._running.add(job)
+                    return job
+                if self._closed:
+                    return None
+                self._condition.wait()
+
+    def _worker(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                with metrics.span('jobs.run', job=job.name):
+                    args = (job,) + job.args if job.pass_job else job.args
+                    result = job.func(*args, **job.kwargs)
+            except BaseException as e:
+                job.status = FAILED
+                job.future.set_exception(e)
+                if job.on_error is not None:
+                    self.dispatch(lambda job=job, e=e: job.on_error(e))
+                else:
+                    print(f"Error in background job {job.name}: {e}")
+            else:
+                job.status = CANCELLED if job.cancelled else DONE
+                job.future.set_result(result)
+                if job.on_result is not None and not job.cancelled:
+                    self.dispatch(lambda job=job, result=result: job.on_result(result))
+            finally:
+                with self._condition:
+                    self._running.discard(job)
+
+    def shutdown(self, wait=True, cancel=False):
+        """停止接收新任务；cancel=True 时先取消全部任务"""
+        if cancel:
+            self.cancel_all()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
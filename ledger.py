@@ -0,0 +1,238 @@
+import os
+import json
+import bisect
+import datetime
+from collections import deque
+
+TRADES_FILE = 'trades.jsonl'
+
+# 每隔多少笔交易保存一次持仓检查点，用于快速重建任意日期的持仓
+CHECKPOINT_INTERVAL = 500
+
+# 交易类型
+BUY, SELL, ADJUST, DEPOSIT, WITHDRAW, SPLIT = 'buy', 'sell', 'adjust', 'deposit', 'withdraw', 'split'
+
+
+class Position:
+    """单只股票的持仓状态，同时维护先进先出批次和平均成本两种成本口径"""
+
+    __slots__ = ('shares', 'lots', 'avg_cost', 'realized_fifo', 'realized_avg')
+
+    def __init__(self):
+        self.shares = 0.0
+        self.lots = deque()       # [股数, 单价]，按买入顺序排列
+        self.avg_cost = 0.0
+        self.realized_fifo = 0.0
+        self.realized_avg = 0.0
+
+    def copy(self):
+        position = Position()
+        position.shares = self.shares
+        position.lots = deque([lot[0], lot[1]] for lot in self.lots)
+        position.avg_cost = self.avg_cost
+        position.realized_fifo = self.realized_fifo
+        position.realized_avg = self.realized_avg
+        return position
+
+    def buy(self, shares, price):
+        total = self.shares + shares
+        self.avg_cost = (self.avg_cost * self.shares + price * shares) / total if total else 0.0
+        self.shares = total
+        self.lots.append([shares, price])
+
+    def sell(self, shares, price):
+        shares = min(shares, self.shares)
+        self.realized_avg += (price - self.avg_cost) * shares
+        remaining = shares
+        # 先进先出消耗批次，只触及被卖出的批次
+        while remaining > 1e-12 and self.lots:
+            lot = self.lots[0]
+            used = min(lot[0], remaining)
+            self.realized_fifo += (price - lot[1]) * used
+            lot[0] -= used
+            remaining -= used
+            if lot[0] <= 1e-12:
+                self.lots.popleft()
+        self.shares -= shares
+        if self.shares <= 1e-12:
+            self.shares = 0.0
+            self.avg_cost = 0.0
+            self.lots.clear()
+
+    def adjust(self, avg_price):
+        """手动修改成本价：平均成本直接替换，各批次按比例缩放"""
+        if self.avg_cost > 0:
+            ratio = avg_price / self.avg_cost
+            for lot in self.lots:
+                lot[1] *= ratio
+        elif self.lots:
+            for lot in self.lots:
+                lot[1] = avg_price
+        self.avg_cost = avg_price
+
+    def split(self, ratio):
+        """拆股：股数乘以比例，成本价除以比例，总成本不变"""
+        self.shares *= ratio
+        self.avg_cost /= ratio
+        for lot in self.lots:
+            lot[0] *= ratio
+            lot[1] /= ratio
+
+    def fifo_cost(self):
+        """先进先出口径下剩余持仓的总成本"""
+        return sum(shares * price for shares, price in self.lots)
+
+    def summary(self, price=None):
+        """返回持仓汇总，提供当前价时同时计算未实现盈亏"""
+        result = {
+            'shares': self.shares,
+            'avg_cost': self.avg_cost,
+            'fifo_cost': self.fifo_cost(),
+            'realized_fifo': self.realized_fifo,
+            'realized_avg': self.realized_avg,
+        }
+        if price is not None:
+            result['unrealized_avg'] = (price - self.avg_cost) * self.shares
+            result['unrealized_fifo'] = price * self.shares - result['fifo_cost']
+        return result
+
+
+def apply_trade(positions, trade):
+    """把一笔股票交易应用到 {ticker: Position} 字典"""
+    position = positions.get(trade['ticker'])
+    if position is None:
+        position = positions[trade['ticker']] = Position()
+    if trade['type'] == BUY:
+        position.buy(trade['shares'], trade['price'])
+    elif trade['type'] == SELL:
+        position.sell(trade['shares'], trade['price'])
+    elif trade['type'] == ADJUST:
+        position.adjust(trade['price'])
+    elif trade['type'] == SPLIT:
+        position.split(trade['ratio'])
+
+
+class TradeLedger:
+    """只追加的交易流水
+
+    每笔交易追加一行JSON到流水文件，同时增量更新内存中的持仓和已实现盈亏，
+    不需要每次从头重算。每 CHECKPOINT_INTERVAL 笔交易保存一次持仓检查点，
+    重建任意日期的持仓时从最近的检查点开始回放。
+    """
+
+    def __init__(self, path=TRADES_FILE, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.trades = []
+        self.positions = {}
+        self.cash_flow = 0.0
+        self.checkpoints = []        # [(交易序号, 日期, 持仓副本, 现金流)]
+        self.checkpoint_dates = []
+        self.load()
+
+    def load(self):
+        """从流水文件回放所有交易"""
+        self.trades = []
+        self.positions = {}
+        self.cash_flow = 0.0
+        self.checkpoints = []
+        self.checkpoint_dates = []
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    self._apply(json.loads(line))
+
+    def _apply(self, trade):
+        """把一笔交易应用到内存状态"""
+        if self.trades and len(self.trades) % self.checkpoint_interval == 0:
+            self._checkpoint()
+        self.trades.append(trade)
+        kind = trade['type']
+        if kind in (DEPOSIT, WITHDRAW):
+            self.cash_flow += trade['amount'] if kind == DEPOSIT else -trade['amount']
+            return
+        apply_trade(self.positions, trade)
+
+    def _checkpoint(self):
+        """保存当前持仓的检查点"""
+        date = self.trades[-1]['date']
+        positions = {ticker: position.copy() for ticker, position in self.positions.items()}
+        self.checkpoints.append((len(self.trades), date, positions, self.cash_flow))
+        self.checkpoint_dates.append(date)
+
+    def record(self, kind, ticker=None, shares=0, price=0.0, amount=0.0, ratio=1.0, date=None):
+        """追加一笔交易并增量更新持仓，返回交易记录"""
+        return self.record_many([dict(kind=kind, ticker=ticker, shares=shares, price=price,
+                                      amount=amount, ratio=ratio, date=date)])[0]
+
+    def record_many(self, entries):
+        """一次追加多笔交易（只写一次文件），entries 为 record() 参数字典的列表，返回交易记录"""
+        trades = []
+        for entry in entries:
+            trades.append(self._make_trade(len(self.trades) + len(trades) + 1, **entry))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(trade) + '\n' for trade in trades))
+        for trade in trades:
+            self._apply(trade)
+        return trades
+
+    @staticmethod
+    def _make_trade(trade_id, kind, ticker=None, shares=0, price=0.0, amount=0.0, ratio=1.0, date=None):
+        trade = {
+            'id': trade_id,
+            'date': date or datetime.datetime.now().isoformat(timespec='seconds'),
+            'type': kind,
+        }
+        if kind in (DEPOSIT, WITHDRAW):
+            trade['amount'] = float(amount)
+        elif kind == SPLIT:
+            trade.update({'ticker': ticker, 'ratio': float(ratio)})
+        else:
+            trade.update({'ticker': ticker, 'shares': float(shares), 'price': float(price)})
+        return trade
+
+    def bootstrap(self, portfolio):
+        """流水为空时，用现有投资组合生成期初持仓和现金记录"""
+        if self.trades:
+            return
+        self.record(DEPOSIT, amount=portfolio['cash'])
+        for stock in portfolio['stocks']:
+            if stock['shares'] > 0:
+                self.record(BUY, stock['ticker'], stock['shares'], stock['avg_price'])
+
+    def position(self, ticker, price=None):
+        """返回某只股票的持仓汇总"""
+        position = self.positions.get(ticker)
+        if position is None:
+            return Position().summary(price)
+        return position.summary(price)
+
+    def realized_pnl(self, method='fifo'):
+        """所有股票的已实现盈亏合计"""
+        attr = 'realized_fifo' if method == 'fifo' else 'realized_avg'
+        return sum(getattr(position, attr) for position in self.positions.values())
+
+    def positions_at(self, date):
+        """重建指定日期（含当日）结束时的持仓，返回 {ticker: 汇总}"""
+        date = date if isinstance(date, str) else date.isoformat()
+        if len(date) == 10:
+            date += 'T23:59:59'
+        # 找到该日期之前最近的检查点，再回放其后的交易
+        i = bisect.bisect_right(self.checkpoint_dates, date)
+        if i == 0:
+            start, positions = 0, {}
+        else:
+            start, _, saved, _ = self.checkpoints[i - 1]
+            positions = {ticker: position.copy() for ticker, position in saved.items()}
+        for trade in self.trades[start:]:
+            if trade['date'] > date:
+                break
+            if trade['type'] not in (DEPOSIT, WITHDRAW):
+                apply_trade(positions, trade)
+        return {ticker: position.summary() for ticker, position in positions.items() if position.shares > 0}
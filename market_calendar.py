@@ -0,0 +1,187 @@
+"""纽约证券交易所交易日历（离线，按规则推算）
+
+休市日按交易所规则计算：元旦、马丁·路德·金纪念日、总统日、耶稣受难日、
+阵亡将士纪念日、六月节（2022年起）、独立日、劳动节、感恩节和圣诞节，
+周六的节日提前到周五、周日的节日顺延到周一（周六的元旦不补休）。
+独立日前一天、感恩节次日和平安夜在13:00提前收盘。无法按规则推算的临时
+休市（国丧日、飓风等）列在 SPECIAL_CLOSURES 中。
+
+数据层用 last_session_day() 判断缓存的日线是否已经完整：周末、节假日和
+收盘后都不可能出现新的日线，不必请求网络。
+"""
+import datetime
+import functools
+import numpy as np
+import pandas as pd
+
+MARKET_TZ = 'America/New_York'
+
+# 常规开盘、收盘时间和提前收盘时间（纽约时间）
+OPEN_TIME = pd.Timedelta(hours=9, minutes=30)
+CLOSE_TIME = pd.Timedelta(hours=16)
+EARLY_CLOSE_TIME = pd.Timedelta(hours=13)
+
+# 临时休市日
+SPECIAL_CLOSURES = (
+    '2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14',    # 9·11事件
+    '2004-06-11',   # 里根国丧日
+    '2007-01-02',   # 福特国丧日
+    '2012-10-29', '2012-10-30',     # 飓风桑迪
+    '2018-12-05',   # 老布什国丧日
+    '2025-01-09',   # 卡特国丧日
+)
+
+
+def _nth_weekday(year, month, weekday, n):
+    """某月第 n 个星期几（n 为 -1 时为最后一个）"""
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    """复活节日期（格里高利历，匿名算法）"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return datetime.date(year, month, day + 1)
+
+
+def _observed(day):
+    """周六的节日提前到周五，周日的节日顺延到周一"""
+    if day.weekday() == 5:
+        return day - datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + datetime.timedelta(days=1)
+    return day
+
+
+@functools.lru_cache(maxsize=None)
+def holidays(year):
+    """某年的全部休市日（不含周末），按日期排序"""
+    days = set()
+    new_year = datetime.date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.add(_observed(new_year))
+    if year >= 1998:
+        days.add(_nth_weekday(year, 1, 0, 3))
+    days.add(_nth_weekday(year, 2, 0, 3))
+    days.add(_easter(year) - datetime.timedelta(days=2))
+    days.add(_nth_weekday(year, 5, 0, -1))
+    if year >= 2022:
+        days.add(_observed(datetime.date(year, 6, 19)))
+    days.add(_observed(datetime.date(year, 7, 4)))
+    days.add(_nth_weekday(year, 9, 0, 1))
+    days.add(_nth_weekday(year, 11, 3, 4))
+    days.add(_observed(datetime.date(year, 12, 25)))
+    days.update(day for day in map(datetime.date.fromisoformat, SPECIAL_CLOSURES) if day.year == year)
+    return tuple(sorted(day for day in days if day.year == year and day.weekday() < 5))
+
+
+@functools.lru_cache(maxsize=None)
+def early_closes(year):
+    """某年13:00提前收盘的交易日"""
+    days = []
+    independence = datetime.date(year, 7, 4)
+    # 独立日在周二至周五时，前一天提前收盘
+    if 1 <= independence.weekday() <= 4:
+        days.append(independence - datetime.timedelta(days=1))
+    days.append(_nth_weekday(year, 11, 3, 4) + datetime.timedelta(days=1))
+    christmas_eve = datetime.date(year, 12, 24)
+    if christmas_eve.weekday() <= 3:
+        days.append(christmas_eve)
+    closed = set(holidays(year))
+    return tuple(day for day in days if day not in closed)
+
+
+@functools.lru_cache(maxsize=64)
+def _holiday_array(first_year, last_year):
+    """供 numpy 工作日函数使用的休市日数组"""
+    return np.array([day for year in range(first_year, last_year + 1) for day in holidays(year)],
+                    dtype='datetime64[D]')
+
+
+def _busday_holidays(*days):
+    """覆盖给定日期前后各一年的休市日数组"""
+    years = [pd.Timestamp(day).year for day in days]
+    return _holiday_array(min(years) - 1, max(years) + 1)
+
+
+def is_session(day):
+    """某天是否为交易日"""
+    day = np.datetime64(pd.Timestamp(day).date(), 'D')
+    return bool(np.is_busday(day, holidays=_busday_holidays(day)))
+
+
+def sessions(start, end):
+    """start 到 end（含）之间的全部交易日（向量化计算）"""
+    start, end = pd.Timestamp(start).date(), pd.Timestamp(end).date()
+    days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+    mask = np.is_busday(days, holidays=_busday_holidays(start, end))
+    return pd.DatetimeIndex(days[mask])
+
+
+def previous_session(day):
+    """day 当天（如果是交易日）或之前最近的交易日"""
+    day = np.datetime64(pd.Timestamp(day).date(), 'D')
+    return pd.Timestamp(np.busday_offset(day, 0, roll='backward', holidays=_busday_holidays(day))).date()
+
+
+def next_session(day):
+    """day 当天（如果是交易日）或之后最近的交易日"""
+    day = np.datetime64(pd.Timestamp(day).date(), 'D')
+    return pd.Timestamp(np.busday_offset(day, 0, roll='forward', holidays=_busday_holidays(day))).date()
+
+
+def close_time(day):
+    """某个交易日收盘时间距当天零点的时长"""
+    day = pd.Timestamp(day).date()
+    return EARLY_CLOSE_TIME if day in early_closes(day.year) else CLOSE_TIME
+
+
+def market_now(now=None):
+    """把 now（默认当前时间，无时区时视为纽约时间）转换为纽约时区的Timestamp"""
+    now = pd.Timestamp.now(tz=MARKET_TZ) if now is None else pd.Timestamp(now)
+    if now.tz is None:
+        now = now.tz_localize(MARKET_TZ)
+    return now.tz_convert(MARKET_TZ)
+
+
+def last_session_day(now=None):
+    """最近一个已收盘交易日的日期
+
+    当天是交易日且已收盘（含提前收盘）时返回当天，否则返回之前最近的交易日；
+    用作"是否可能有新日线"的版本戳。
+    """
+    now = market_now(now)
+    today = now.date()
+    if is_session(today) and now - now.normalize() >= close_time(today):
+        return today
+    return previous_session(today - datetime.timedelta(days=1))
+
+
+def market_open(now=None):
+    """当前是否在常规交易时段内"""
+    now = market_now(now)
+    today = now.date()
+    offset = now - now.normalize()
+    return is_session(today) and OPEN_TIME <= offset < close_time(today)
+
+
+def seconds_until_open(now=None):
+    """距离下一次开盘的秒数，交易时段内为0"""
+    now = market_now(now)
+    if market_open(now):
+        return 0.0
+    today = now.date()
+    day = today if now - now.normalize() < OPEN_TIME else today + datetime.timedelta(days=1)
+    opening = pd.Timestamp(next_session(day)).tz_localize(MARKET_TZ) + OPEN_TIME
+    return (opening - now).total_seconds()
@@ -0,0 +1,175 @@
+"""股票基本信息缓存
+
+数据源的 info() 返回一个很大的字典，请求很慢，而程序只用到其中少数字段。
+MetadataCache 按股票保存这些字段及各自的获取时间，每个字段有自己的有效期：
+名称、行业、交易所等静态字段保存数天，报价字段只保存几十秒。只有请求的
+字段中有过期或缺失的才重新请求 info()，一次请求会刷新该股票的全部字段。
+
+缓存保存在 cache/metadata.json；load_file() 可以从JSON或CSV文件批量预热。
+"""
+import os
+import csv
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+METADATA_FILE = os.path.join('cache', 'metadata.json')
+
+DAY = 24 * 3600
+
+# 各字段的有效期（秒），不在表中的字段不缓存
+FIELD_TTLS = {
+    'longName': 7 * DAY,
+    'shortName': 7 * DAY,
+    'sector': 7 * DAY,
+    'industry': 7 * DAY,
+    'exchange': 7 * DAY,
+    'currency': 7 * DAY,
+    'quoteType': 7 * DAY,
+    'lastSplitDate': DAY,
+    'lastSplitFactor': DAY,
+    'regularMarketPrice': 15,
+    'previousClose': 15,
+}
+
+QUOTE_FIELDS = ('regularMarketPrice', 'previousClose')
+SPLIT_FIELDS = ('lastSplitDate', 'lastSplitFactor')
+STATIC_FIELDS = ('longName', 'shortName', 'sector', 'industry', 'exchange', 'currency', 'quoteType')
+
+# 并行预热的线程数
+WARM_WORKERS = 8
+
+
+def _parse(value):
+    """CSV中的数字列转换为float，其余保持字符串"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class MetadataCache:
+    """按股票、按字段设置有效期的 info() 缓存
+
+    entries 的结构为 {股票: {字段: [值, 获取时间]}}。get() 在请求的字段都未过期时
+    直接返回缓存，否则请求一次 info() 并更新该股票的所有字段。
+    """
+
+    def __init__(self, provider, path=METADATA_FILE, ttls=None):
+        self.provider = provider
+        self.path = path
+        self.ttls = dict(FIELD_TTLS if ttls is None else ttls)
+        self.entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error loading metadata cache: {e}")
+
+    def save(self):
+        """有未保存的修改时写入临时文件后原子替换"""
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    def _stale(self, ticker, fields, now):
+        entry = self.entries.get(ticker, {})
+        for field in fields:
+            cached = entry.get(field)
+            if cached is None or now - cached[1] > self.ttls.get(field, 0):
+                return True
+        return False
+
+    def store(self, ticker, info, fetched_at=None):
+        """写入一只股票的字段（只保存设置了有效期的字段，缺失的字段记为None）"""
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self._lock:
+            entry = self.entries.setdefault(ticker, {})
+            for field in self.ttls:
+                entry[field] = [info.get(field), fetched_at]
+            self._dirty = True
+
+    def _fetch(self, ticker):
+        metrics.increment('metadata.miss')
+        info = self.provider.info(ticker)
+        self.store(ticker, info)
+        return info
+
+    def get(self, ticker, fields, save=True):
+        """返回 {字段: 值}，有字段过期或缺失时请求一次 info()"""
+        if self._stale(ticker, fields, time.time()):
+            self._fetch(ticker)
+            if save:
+                self.save()
+        else:
+            metrics.increment('metadata.hit')
+        entry = self.entries.get(ticker, {})
+        return {field: entry[field][0] if field in entry else None for field in fields}
+
+    def info(self, ticker):
+        """与数据源 info() 相同的接口，返回所有缓存字段（按需刷新）"""
+        return self.get(ticker, tuple(self.ttls))
+
+    def invalidate(self, ticker, fields=None):
+        """使某只股票的部分（默认全部）字段过期"""
+        with self._lock:
+            entry = self.entries.get(ticker, {})
+            for field in list(entry) if fields is None else fields:
+                if field in entry:
+                    entry[field][1] = 0
+            self._dirty = True
+
+    @metrics.timed('metadata.warm')
+    def warm(self, tickers, fields=STATIC_FIELDS, max_workers=WARM_WORKERS):
+        """并行刷新 fields 中有过期字段的股票，全部完成后保存一次，返回刷新的股票"""
+        now = time.time()
+        stale = [ticker for ticker in dict.fromkeys(tickers) if self._stale(ticker, fields, now)]
+
+        def fetch(ticker):
+            try:
+                self._fetch(ticker)
+                return ticker
+            except Exception as e:
+                print(f"Error fetching info for {ticker}: {e}")
+                return None
+
+        if stale:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+                stale = [ticker for ticker in pool.map(fetch, stale) if ticker is not None]
+            self.save()
+        return stale
+
+    def load_file(self, path, fetched_at=None):
+        """从文件批量预热，返回写入的股票数
+
+        支持 {股票: {字段: 值}} 格式的JSON，或带 ticker 列的CSV（其余列为字段）。
+        文件中的值按 fetched_at（默认当前时间）计算有效期。
+        """
+        if path.lower().endswith('.csv'):
+            with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+                rows = {row.pop('ticker').strip().upper(): {field: _parse(value) for field, value in row.items()}
+                        for row in csv.DictReader(f) if row.get('ticker')}
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self._lock:
+            for ticker, values in rows.items():
+                entry = self.entries.setdefault(ticker, {})
+                for field, value in values.items():
+                    if field in self.ttls and value not in (None, ''):
+                        entry[field] = [value, fetched_at]
+            self._dirty = True
+        self.save()
+        return len(rows)
@@ -0,0 +1,244 @@
+import os
+import io
+import json
+import time
+import threading
+import functools
+import contextlib
+
+METRICS_FILE = os.path.join('cache', 'metrics.jsonl')
+PROMETHEUS_FILE = os.path.join('cache', 'metrics.prom')
+
+
+class Exporter:
+    """指标导出器基类：on_span 在每个计时区间结束时调用，flush 导出汇总"""
+
+    def on_span(self, record):
+        pass
+
+    def flush(self, snapshot):
+        pass
+
+
+class LogExporter(Exporter):
+    """把汇总结果打印到控制台"""
+
+    def __init__(self, spans=False):
+        self.spans = spans
+
+    def on_span(self, record):
+        if self.spans:
+            print(f"[metrics] {record['name']} {record['duration'] * 1000:.2f} ms {record['labels']}")
+
+    def flush(self, snapshot):
+        for name, stats in sorted(snapshot['spans'].items()):
+            print(f"[metrics] {name}: {stats['count']} 次, 共 {stats['total'] * 1000:.1f} ms, 最长 {stats['max'] * 1000:.1f} ms")
+        for name, value in sorted(snapshot['counters'].items()):
+            print(f"[metrics] {name}: {value}")
+
+
+class JsonLinesExporter(Exporter):
+    """每个计时区间写一行JSON"""
+
+    def __init__(self, path=METRICS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def on_span(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+
+class PrometheusExporter(Exporter):
+    """把汇总结果写成Prometheus文本格式文件（供node_exporter textfile采集）"""
+
+    def __init__(self, path=PROMETHEUS_FILE, prefix='stock_manager'):
+        self.path = path
+        self.prefix = prefix
+
+    def flush(self, snapshot):
+        lines = [
+            f"# TYPE {self.prefix}_span_seconds_total counter",
+            f"# TYPE {self.prefix}_span_count counter",
+        ]
+        for name, stats in sorted(snapshot['spans'].items()):
+            lines.append(f'{self.prefix}_span_seconds_total{{span="{name}"}} {stats["total"]:.6f}')
+            lines.append(f'{self.prefix}_span_count{{span="{name}"}} {stats["count"]}')
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = f"{self.prefix}_{name.replace('.', '_')}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, self.path)
+
+
+class _NullSpan:
+    """关闭监控时使用的空计时区间"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('metrics', 'name', 'labels', 'start')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics._record(self.name, time.perf_counter() - self.start, self.labels, exc_type is not None)
+        return False
+
+
+class Metrics:
+    """性能监控：计时区间、计数器和可插拔的导出器
+
+    默认关闭，此时 span() 返回共享的空对象、increment() 直接返回，
+    对热点路径几乎没有额外开销。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.exporters = []
+        self.lock = threading.Lock()
+        self.spans = {}
+        self.counters = {}
+
+    def enable(self, exporters=None):
+        """开启监控"""
+        self.exporters = list(exporters) if exporters is not None else [LogExporter()]
+        self.enabled = True
+
+    def disable(self):
+        """关闭监控并导出已收集的数据"""
+        self.flush()
+        self.enabled = False
+
+    def reset(self):
+        """清空已收集的数据"""
+        with self.lock:
+            self.spans = {}
+            self.counters = {}
+
+    def span(self, name, **labels):
+        """计时区间上下文管理器"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, labels)
+
+    def timed(self, name):
+        """函数计时装饰器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, name, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def increment(self, name, value=1):
+        """计数器加一"""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def _record(self, name, duration, labels, failed):
+        with self.lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'errors': 0}
+            stats['count'] += 1
+            stats['total'] += duration
+            stats['max'] = max(stats['max'], duration)
+            if failed:
+                stats['errors'] += 1
+        record = {'name': name, 'duration': duration, 'labels': labels, 'time': time.time(), 'error': failed}
+        for exporter in self.exporters:
+            exporter.on_span(record)
+
+    def snapshot(self):
+        """返回当前汇总数据的副本"""
+        with self.lock:
+            return {
+                'spans': {name: dict(stats) for name, stats in self.spans.items()},
+                'counters': dict(self.counters),
+            }
+
+    def flush(self):
+        """把汇总数据交给所有导出器"""
+        if not self.enabled:
+            return
+        snapshot = self.snapshot()
+        for exporter in self.exporters:
+            exporter.flush(snapshot)
+
+    @contextlib.contextmanager
+    def profile(self, output=None, engine='cprofile'):
+        """在代码块内采集函数级性能剖析（cProfile或pyinstrument）"""
+        if engine == 'pyinstrument':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield profiler
+            finally:
+                profiler.stop()
+                if output:
+                    with open(output, 'w') as f:
+                        f.write(profiler.output_html())
+                else:
+                    print(profiler.output_text())
+        else:
+            import cProfile
+            import pstats
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield profiler
+            finally:
+                profiler.disable()
+                if output:
+                    profiler.dump_stats(output)
+                else:
+                    stream = io.StringIO()
+                    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+                    print(stream.getvalue())
+
+
+def configure_from_env(metrics):
+    """根据环境变量 STOCK_METRICS（例如 "log,jsonl,prom"）开启监控"""
+    names = [name.strip() for name in os.environ.get('STOCK_METRICS', '').split(',') if name.strip()]
+    if not names:
+        return
+    factories = {'log': LogExporter, 'jsonl': JsonLinesExporter, 'prom': PrometheusExporter}
+    metrics.enable([factories[name]() for name in names if name in factories])
+
+
+# 全局监控实例
+metrics = Metrics()
+configure_from_env(metrics)
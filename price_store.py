@@ -0,0 +1,146 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from metrics import metrics
+
+PRICE_STORE_DIR = os.path.join('cache', 'prices')
+
+# OHLC列在 ohlc.f32 中的顺序
+FIELDS = ('Open', 'High', 'Low', 'Close')
+
+
+class PriceStore:
+    """基于内存映射文件的列式行情存储
+
+    所有股票的K线按股票连续存放在三个文件中：
+    ts.i64（int64 UTC纳秒时间戳）、ohlc.f32（float32, N×4）、volume.i64（int64），
+    index.json 记录每个股票的起始行和行数。读取时直接切片内存映射数组，
+    不复制数据，多个进程打开同一目录时共享操作系统的页缓存。
+    """
+
+    def __init__(self, root=PRICE_STORE_DIR):
+        self.root = root
+        self.index = {}
+        self.ts = None
+        self.ohlc = None
+        self.volume = None
+        if os.path.exists(self._path('index.json')):
+            self.open()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def open(self):
+        """以只读方式映射存储文件"""
+        with open(self._path('index.json'), 'r') as f:
+            self.index = {ticker: tuple(span) for ticker, span in json.load(f).items()}
+        rows = sum(length for _, length in self.index.values())
+        if rows == 0:
+            self.ts = np.empty(0, dtype=np.int64)
+            self.ohlc = np.empty((0, 4), dtype=np.float32)
+            self.volume = np.empty(0, dtype=np.int64)
+            return
+        self.ts = np.memmap(self._path('ts.i64'), dtype=np.int64, mode='r', shape=(rows,))
+        self.ohlc = np.memmap(self._path('ohlc.f32'), dtype=np.float32, mode='r', shape=(rows, 4))
+        self.volume = np.memmap(self._path('volume.i64'), dtype=np.int64, mode='r', shape=(rows,))
+
+    def close(self):
+        """释放内存映射"""
+        self.ts = self.ohlc = self.volume = None
+
+    def build(self, frames):
+        """用 {ticker: DataFrame} 重建整个存储，写入临时文件后原子替换"""
+        os.makedirs(self.root, exist_ok=True)
+        frames = {ticker: frame for ticker, frame in frames.items() if frame is not None and not frame.empty}
+        rows = sum(len(frame) for frame in frames.values())
+
+        tmp = {name: self._path(name + '.tmp') for name in ('ts.i64', 'ohlc.f32', 'volume.i64')}
+        index = {}
+        if rows:
+            ts = np.memmap(tmp['ts.i64'], dtype=np.int64, mode='w+', shape=(rows,))
+            ohlc = np.memmap(tmp['ohlc.f32'], dtype=np.float32, mode='w+', shape=(rows, 4))
+            volume = np.memmap(tmp['volume.i64'], dtype=np.int64, mode='w+', shape=(rows,))
+            offset = 0
+            for ticker, frame in frames.items():
+                frame = frame.sort_index()
+                n = len(frame)
+                frame_index = frame.index if frame.index.tz is not None else frame.index.tz_localize('UTC')
+                # 索引可能是秒或毫秒精度，统一按纳秒保存
+                ts[offset:offset + n] = frame_index.tz_convert('UTC').as_unit('ns').asi8
+                for i, field in enumerate(FIELDS):
+                    ohlc[offset:offset + n, i] = _column(frame, field)
+                volume[offset:offset + n] = np.nan_to_num(_column(frame, 'Volume')).astype(np.int64)
+                index[ticker] = (offset, n)
+                offset += n
+            for array in (ts, ohlc, volume):
+                array.flush()
+            del ts, ohlc, volume
+
+        self.close()
+        for name, path in tmp.items():
+            if os.path.exists(path):
+                os.replace(path, self._path(name))
+        with open(self._path('index.json.tmp'), 'w') as f:
+            json.dump(index, f)
+        os.replace(self._path('index.json.tmp'), self._path('index.json'))
+        self.open()
+
+    def tickers(self):
+        """返回存储中的股票列表"""
+        return list(self.index)
+
+    def window(self, ticker, start=None, end=None):
+        """零拷贝读取某股票在 [start, end] 时间窗口内的数据，返回数组视图字典"""
+        if ticker not in self.index:
+            metrics.increment('cache.price_store.miss')
+            return None
+        metrics.increment('cache.price_store.hit')
+        offset, length = self.index[ticker]
+        ts = self.ts[offset:offset + length]
+        lo = 0 if start is None else int(np.searchsorted(ts, _to_ns(start), side='left'))
+        hi = length if end is None else int(np.searchsorted(ts, _to_ns(end), side='right'))
+        rows = slice(offset + lo, offset + hi)
+        return {
+            'ts': self.ts[rows],
+            'Open': self.ohlc[rows, 0],
+            'High': self.ohlc[rows, 1],
+            'Low': self.ohlc[rows, 2],
+            'Close': self.ohlc[rows, 3],
+            'Volume': self.volume[rows],
+        }
+
+    def frame(self, ticker, start=None, end=None):
+        """以yfinance风格的DataFrame返回某股票的时间窗口"""
+        window = self.window(ticker, start, end)
+        if window is None:
+            return pd.DataFrame()
+        index = pd.DatetimeIndex(np.asarray(window.pop('ts')).astype('datetime64[ns]')).tz_localize('UTC')
+        return pd.DataFrame(window, index=index, copy=False)
+
+    def panel(self, tickers, field='Close', start=None, end=None):
+        """把多个股票的某一列按时间对齐为 (时间 × 股票) 的二维数组"""
+        windows = [self.window(ticker, start, end) for ticker in tickers]
+        stamps = [w['ts'] for w in windows if w is not None]
+        if not stamps:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(tickers)), dtype=np.float32)
+        dates = np.unique(np.concatenate(stamps))
+        values = np.full((len(dates), len(tickers)), np.nan, dtype=np.float32)
+        for j, window in enumerate(windows):
+            if window is not None:
+                values[np.searchsorted(dates, window['ts']), j] = window[field]
+        return dates, values
+
+
+def _column(frame, name):
+    """取出一维列，兼容yfinance返回的多级列"""
+    values = np.asarray(frame[name], dtype=float)
+    return values.reshape(len(frame), -1)[:, 0]
+
+
+def _to_ns(value):
+    """把日期、字符串或时间戳转换为UTC纳秒"""
+    stamp = pd.Timestamp(value)
+    if stamp.tz is None:
+        stamp = stamp.tz_localize('UTC')
+    return stamp.as_unit('ns').value
@@ -1,27 +1,367 @@
 import json
-import yfinance as yf
+import os
+import queue
+import time
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from types import MappingProxyType
 import pandas as pd
 import numpy as np
-# 设置matplotlib后端
+# 设置matplotlib后端（可用MPLBACKEND环境变量覆盖，例如在无界面环境下运行性能测试）
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 # matplotlib相关导入
 import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import datetime
-import os
+from replay import provider_from_env
+from alerts import AlertEngine, risk_rules, active_alerts
+from bars import BarStore, INTRADAY_INTERVALS
+from price_store import PriceStore
+import indicators
+from metrics import metrics
+from equity import EquityStore
+from ledger import TradeLedger, TRADES_FILE, BUY, SELL, ADJUST, DEPOSIT, WITHDRAW, SPLIT
+from daily_bars import DailyBarCache
+from chart_data import ChartSeries
+from depgraph import DependencyGraph
+from metadata import MetadataCache, QUOTE_FIELDS, SPLIT_FIELDS
+from refresh import RefreshScheduler, daily_volatility, DEFAULT_VOLATILITY
+from correlation import EwmaCovariance
+from sectors import Classification
+from bars import period_to_days
+import daily_bars
+import market_calendar
+import importer
+import rebalance
+import risk
+import rules
+import sectors
+import vix
 
 PORTFOLIO_FILE = 'portfolio.json'
 
+# 并行获取报价的线程数
+FETCH_WORKERS = 8
+
+# 批量导入后补齐数据时，每完成这么多只股票写入一次
+ENRICH_BATCH = 25
+
+# 相关性监控最多跟踪的股票数（按持仓市值取最大的部分），协方差矩阵大小为其平方
+COVARIANCE_MAX_TICKERS = 2000
+
+
+def command(func):
+    """修改投资组合的方法，交给写线程串行执行"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        return self.execute(func, self, *args, **kwargs)
+    return wrapper
+
+
 class StockProcessor:
-    def __init__(self):
+    """投资组合处理器
+
+    并发模型：self.portfolio 只由写线程修改，所有修改操作（带 @command 的方法）
+    通过命令队列串行执行；读取方使用 snapshot() 返回的只读快照，
+    每条命令完成后发布新快照。网络请求在调用方线程中完成，可以并行。
+    """
+
+    def __init__(self, portfolio_file=PORTFOLIO_FILE, provider=None):
+        self.portfolio_file = portfolio_file
+        self.provider = provider or provider_from_env()
+        self.metadata = MetadataCache(self.provider)
+        self.rules = self._load_rules()
+        # 预警、刷新频率和调仓使用与 risk_action 规则相同的阈值和减仓比例
+        self.risk_params = self.rules['risk_action'].params
+        self.alert_engine = AlertEngine(self.risk_params)
+        self.risk_alerts = []
+        self.refresh = RefreshScheduler(params=self.risk_params)
+        self.covariance = EwmaCovariance()
+        self.classification = Classification()
+        self._covariance_lock = threading.Lock()
+        self.bar_store = BarStore(fetch=self._fetch_minute_bars)
+        self.price_store = PriceStore()
+        self.daily_bars = DailyBarCache(self.provider)
+        self._chart_series = {}
+        self.equity = EquityStore()
+        self.vix = vix.VixHistory(self.provider)
+        self.ledger = TradeLedger(os.path.join(os.path.dirname(portfolio_file), TRADES_FILE))
+        self.graph = self._build_graph()
+        self.portfolio = {'cash': 0, 'stocks': [], 'total_value': 0}
+        self._snapshot = None
+        self._active_alerts = ()
+        self._commands = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name='portfolio-writer', daemon=True)
+        self._writer.start()
         self.load_portfolio()
+    
+    def _writer_loop(self):
+        """写线程：依次执行命令队列中的操作，每条命令完成后发布新的只读快照"""
+        while True:
+            item = self._commands.get()
+            if item is None:
+                break
+            future, func, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                self._publish()
+                future.set_exception(e)
+            else:
+                self._publish()
+                future.set_result(result)
+    
+    def _publish(self):
+        """发布当前投资组合的只读快照"""
+        portfolio = dict(self.portfolio)
+        portfolio['stocks'] = tuple(MappingProxyType(dict(stock)) for stock in self.portfolio['stocks'])
+        self._snapshot = MappingProxyType(portfolio)
+        # 当前的风险信号随快照一起发布，界面重绘时直接读取，不经过写线程，也不改变预警引擎的穿越状态
+        self._active_alerts = tuple(active_alerts(self.portfolio['stocks'], self.risk_params))
+        self._sync_graph()
+    
+    def _sync_graph(self):
+        """把持仓数据写入依赖图的数据源节点（在写线程中执行），值没有变化的节点版本号不变"""
+        cash, total_value = self.portfolio['cash'], self.portfolio['total_value']
+        tickers = set()
+        for stock in self.portfolio['stocks']:
+            ticker = stock['ticker']
+            tickers.add(ticker)
+            self.graph.set('quote', ticker, (stock.get('current_price', stock['avg_price']), stock.get('daily_change', 0)))
+            self.graph.set('avg_price', ticker, stock['avg_price'])
+            self.graph.set('sentiment_label', ticker, stock.get('sentiment'))
+            self.graph.set('split_basis', ticker, stock.get('split_basis'))
+            self.graph.set('allocation', ticker, (stock['value'], cash, total_value))
+        self.graph.set('sectors', value=self._sector_breaches(self.portfolio['stocks'], total_value))
+        # 已移除的持仓不再保留计算结果
+        for ticker in set(self.graph.keys('quote')) - tickers:
+            self.graph.discard(ticker)
+    
+    def _build_graph(self):
+        """建立仓位建议的依赖图：日线 → 指标/情绪 → 凯利/均线/MACD → 风险 → 建议
+        
+        报价、成本价、情绪等数据源由 _sync_graph 在每条命令后写入，交易日和VIX
+        由 _refresh_market_sources 写入。价格变化只会重算均线仓位、风险和建议，
+        修改成本价只重算该股票的风险和建议，VIX变化只在区间改变时重算凯利仓位；
+        日线只在出现新的已收盘交易日（或拆股调整）时重新读取。
+        """
+        graph = DependencyGraph()
+        graph.source('session', keyed=False)
+        graph.source('vix', keyed=False, default=vix.DEFAULT_VIX)
+        graph.source('quote')               # (现价, 当日涨跌幅)
+        graph.source('avg_price')
+        graph.source('sentiment_label')     # 持仓中保存的市场情绪
+        graph.source('split_basis')
+        graph.source('allocation')          # (持仓市值, 现金, 总资产)
+        graph.source('clusters', keyed=False, default={})   # {股票: (同组股票, 合计仓位)}
+        graph.source('sectors', keyed=False, default={})    # {股票: (行业, 合计仓位)}，只含超限的行业
+        
+        graph.node('bars', self._graph_bars, ['session', 'split_basis'])
+        graph.node('indicators', self._graph_indicators, ['bars'])
+        graph.node('sentiment', self._graph_sentiment, ['bars'])
+        graph.node('volatility', self._graph_volatility, ['bars'])
+        graph.node('vix_coefficient', lambda value: float(vix.regime(value)), ['vix'], keyed=False)
+        graph.node('kelly', self._graph_kelly, ['sentiment_label', 'vix_coefficient'])
+        graph.node('ma', self._graph_ma, ['indicators', 'quote'])
+        graph.node('macd', lambda ticker, values: values['macd_adjustment'], ['indicators'])
+        graph.node('risk', self._graph_risk, ['quote', 'avg_price'])
+        graph.node('limits', self._graph_limits, ['allocation'])
+        graph.node('cluster', lambda ticker, clusters: clusters.get(ticker), ['clusters'])
+        graph.node('sector', lambda ticker, breaches: breaches.get(ticker), ['sectors'])
+        graph.node('advice', self._graph_advice, ['kelly', 'ma', 'macd', 'risk', 'limits', 'cluster', 'sector'])
+        return graph
+    
+    def _refresh_market_sources(self):
+        """写入最近的已收盘交易日和最新VIX（VIX缓存未过期时不请求网络）"""
+        self.graph.set('session', value=market_calendar.last_session_day())
+        try:
+            self.graph.set('vix', value=self.vix.latest())
+        except Exception as e:
+            print(f"Error fetching VIX: {e}")
+    
+    def _graph_bars(self, ticker, session, split_basis):
+        return self.daily_bars.load(ticker, period='1y')
+    
+    def _graph_indicators(self, ticker, bars):
+        """由一年日线算出的最新一天的全部规则指标列，以及MACD加仓比例"""
+        if len(bars):
+            columns = self._latest_columns(indicators.column(bars, 'Close'), indicators.column(bars, 'High'),
+                                           indicators.column(bars, 'Volume'))
+        else:
+            columns = self._latest_columns(np.empty(0))
+        columns['macd_adjustment'] = self.rules.scalar('macd_adjustment', **columns)
+        return columns
+    
+    def _load_rules(self):
+        """读取投资组合文件同目录下的规则文件（JSON或YAML），没有或出错时使用内置规则"""
+        folder = os.path.dirname(self.portfolio_file)
+        for name in rules.RULES_FILES:
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                try:
+                    return rules.load_rules(path)
+                except (OSError, ValueError) as e:
+                    print(f"Error loading rules from {path}: {e}")
+                    break
+        return rules.RuleBook()
+    
+    @staticmethod
+    def _latest_columns(close, high=None, volume=None):
+        """最新一天的规则指标列 {列名: 标量}，没有数据时各列为NaN、count为0"""
+        if not len(close):
+            close = np.full(1, np.nan)
+            high = volume = None
+        columns = rules.panel_columns(close, high, volume)
+        return {name: values[-1].item() for name, values in columns.items()}
+    
+    def _graph_sentiment(self, ticker, bars):
+        """由最近3个月的日线判断市场情绪，返回 (情绪, 判断原因)"""
+        try:
+            if len(bars):
+                bars = bars[bars.index >= bars.index[-1] - pd.Timedelta(days=period_to_days('3mo'))]
+            return self._detect_sentiment(bars)
+        except Exception as e:
+            print(f"Error detecting sentiment for {ticker}: {e}")
+            return "横盘震荡", None
+    
+    @staticmethod
+    def _graph_volatility(ticker, bars):
+        """最近20个交易日的日收益率标准差，用于安排刷新间隔"""
+        return daily_volatility(indicators.column(bars, 'Close')) if len(bars) else DEFAULT_VOLATILITY
+    
+    def _graph_kelly(self, ticker, sentiment, vix_coefficient):
+        # 凯利公式: (上涨概率感官值 * 0.5) / 当前VIX波动率系数
+        return float(vix.kelly(self.get_sentiment_probability(sentiment), vix_coefficient))
+    
+    def _graph_ma(self, ticker, values, quote):
+        """按均线仓位规则计算最新价对应的仓位，价格变化时不必重新计算均线"""
+        price = quote[0] if quote is not None and quote[0] else values['close']
+        return self.rules.scalar('ma_position', **dict(values, close=price))
+    
+    def _graph_risk(self, ticker, quote, avg_price):
+        if quote is None or not avg_price:
+            return {'action': 'hold', 'percent': 0, 'reason': '无风险控制信号'}
+        return self._risk_control(quote[0], avg_price, quote[1])
+    
+    @staticmethod
+    def _graph_limits(ticker, allocation):
+        """(现金比例低于30%, 单股仓位超过25%)"""
+        if allocation is None or not allocation[2]:
+            return False, False
+        value, cash, total_value = allocation
+        return cash / total_value * 100 < 30, value / total_value * 100 > 25
+    
+    @staticmethod
+    def _graph_advice(ticker, kelly_position, ma_position, macd_adjustment, risk_control, limits, cluster, sector):
+        cash_low, overweight = limits
+        # 基础建议
+        advice = f"凯利公式建议仓位: {kelly_position:.1f}%, 均线建议仓位: {ma_position:.1f}%\n"
+        
+        # 风险控制建议
+        if risk_control['action'] != 'hold':
+            advice += f"风险控制: {risk_control['reason']}, 建议{risk_control['action'] == 'reduce' and '减仓' or risk_control['action'] == 'sell_all' and '清仓' or '止盈'} {risk_control['percent']}%\n"
+        
+        # MACD信号
+        if macd_adjustment > 0:
+            advice += f"MACD金叉信号: 建议加仓 {macd_adjustment}%\n"
+        
+        # 现金比例检查
+        if cash_low:
+            advice += "警告: 现金比例低于30%，建议保持足够的现金\n"
+        
+        # 单股仓位检查
+        if overweight:
+            advice += "警告: 单股仓位超过25%，建议分散投资\n"
         
+        # 高度相关股票组的合计仓位检查
+        if cluster is not None:
+            peers, weight = cluster
+            advice += f"警告: 与 {'、'.join(peers)} 走势高度相关，合计仓位 {weight:.1f}% 超过25%，建议分散投资\n"
+        
+        # 行业合计仓位检查
+        if sector is not None:
+            name, weight = sector
+            advice += f"警告: 所属行业 {name} 合计仓位 {weight:.1f}% 超过{rebalance.MAX_SECTOR:.0f}%，建议分散投资\n"
+        return advice
+    
+    def _sector_breaches(self, stocks, total_value):
+        """合计仓位超过行业上限的持仓 {股票: (行业, 合计仓位)}（向量化按行业汇总）"""
+        if not stocks or not total_value:
+            return {}
+        tickers = [stock['ticker'] for stock in stocks]
+        names, codes = self.classification.codes(tickers)
+        values = np.array([stock.get('value', 0) for stock in stocks], dtype=float)
+        weights = np.bincount(codes, weights=values, minlength=len(names)) / total_value * 100
+        breached = sectors.over_limit(dict(zip(names, weights)))
+        if not breached:
+            return {}
+        return {ticker: (names[code], breached[names[code]]) for ticker, code in zip(tickers, codes)
+                if names[code] in breached}
+    
+    def _write_changed(self, updates):
+        """把 {股票: {字段: 值}} 中与快照不同的字段一次写入并保存，返回实际变化的部分"""
+        changed = {}
+        for ticker, fields in updates.items():
+            stock = self._find_stock(ticker)
+            if stock is None:
+                continue
+            diff = {name: value for name, value in fields.items() if stock.get(name) != value}
+            if diff:
+                changed[ticker] = diff
+        if changed:
+            self.execute(self._apply_fields, changed)
+        return changed
+    
+    def _apply_fields(self, updates):
+        """写入多只股票的字段并保存一次（在写线程中执行）"""
+        for stock in self.portfolio['stocks']:
+            fields = updates.get(stock['ticker'])
+            if fields:
+                stock.update(fields)
+        self.save_portfolio()
+    
+    def execute(self, func, *args, **kwargs):
+        """在写线程中执行修改操作并等待结果；写线程内部的嵌套调用直接执行"""
+        if threading.current_thread() is self._writer:
+            return func(*args, **kwargs)
+        future = Future()
+        self._commands.put((future, func, args, kwargs))
+        return future.result()
+    
+    def submit(self, func, *args, **kwargs):
+        """把修改操作加入命令队列，不等待结果，返回Future"""
+        future = Future()
+        self._commands.put((future, func, args, kwargs))
+        return future
+    
+    def snapshot(self):
+        """返回投资组合的只读快照，可在任意线程中安全读取"""
+        return self._snapshot
+    
+    def close(self):
+        """停止写线程（已排队的命令会先执行完）"""
+        self._commands.put(None)
+        self._writer.join()
+    
+    def _find_stock(self, ticker, portfolio=None):
+        """在投资组合（默认为当前快照）中查找股票"""
+        portfolio = self.snapshot() if portfolio is None else portfolio
+        for stock in portfolio['stocks']:
+            if stock['ticker'] == ticker:
+                return stock
+        return None
+        
+    @metrics.timed('portfolio.load')
+    @command
     def load_portfolio(self):
         """加载投资组合数据"""
-        if os.path.exists(PORTFOLIO_FILE):
-            with open(PORTFOLIO_FILE, 'r') as f:
+        if os.path.exists(self.portfolio_file):
+            with open(self.portfolio_file, 'r') as f:
                 self.portfolio = json.load(f)
         else:
             self.portfolio = {
@@ -30,17 +370,22 @@ class StockProcessor:
                 'total_value': 10000
             }
             self.save_portfolio()
+        # 旧版本没有交易流水，用现有持仓作为期初记录
+        self.ledger.bootstrap(self.portfolio)
+        self.alert_engine.rebuild(self.portfolio['stocks'])
     
+    @metrics.timed('portfolio.save')
+    @command
     def save_portfolio(self):
         """保存投资组合数据"""
-        with open(PORTFOLIO_FILE, 'w') as f:
+        with open(self.portfolio_file, 'w') as f:
             json.dump(self.portfolio, f, indent=4)
     
     def add_stock(self, ticker, shares, price, sentiment=None):
         """添加股票到投资组合"""
-        # 检查股票代码是否有效
+        # 检查股票代码是否有效（报价有效期内直接使用缓存）
         try:
-            stock_info = yf.Ticker(ticker).info
+            stock_info = self.metadata.get(ticker, QUOTE_FIELDS)
             current_price = stock_info.get('regularMarketPrice', price)
             if current_price is None:
                 current_price = price
@@ -51,6 +396,12 @@ class StockProcessor:
         if sentiment is None:
             sentiment = self.auto_detect_sentiment(ticker)
         
+        return self.execute(self._add_stock, ticker, shares, price, current_price, sentiment)
+    
+    def _add_stock(self, ticker, shares, price, current_price, sentiment):
+        """写入新增持仓（在写线程中执行）"""
+        self.ledger.record(BUY, ticker, shares, price)
+        
         # 检查是否已存在该股票
         for stock in self.portfolio['stocks']:
             if stock['ticker'] == ticker:
@@ -77,7 +428,8 @@ class StockProcessor:
             'kelly_position': 0,
             'ma_position': 0,
             'position_advice': '',
-            'daily_change': 0
+            'daily_change': 0,
+            'split_basis': datetime.date.today().isoformat()
         }
         
         self.portfolio['stocks'].append(new_stock)
@@ -85,10 +437,116 @@ class StockProcessor:
         self.save_portfolio()
         return True
     
+    @metrics.timed('portfolio.import')
+    def import_positions(self, source):
+        """从CSV（路径、文件对象或DataFrame）批量导入持仓，一次写入并保存
+        
+        现价暂用成本价、情绪暂为默认值，之后由 enrich_positions 在后台补齐。
+        返回 (导入的股票代码列表, 被拒绝的行DataFrame)。
+        """
+        positions, rejected = importer.read_positions(source)
+        if len(positions):
+            self.execute(self._import_positions, positions)
+        return list(positions['ticker']), rejected
+    
+    def _import_positions(self, positions):
+        """写入批量导入的持仓（在写线程中执行），已有的股票按股数加权合并成本"""
+        existing = {stock['ticker']: stock for stock in self.portfolio['stocks']}
+        today = datetime.date.today().isoformat()
+        for ticker, shares, price in zip(positions['ticker'], positions['shares'].tolist(), positions['price'].tolist()):
+            stock = existing.get(ticker)
+            if stock is not None:
+                stock['avg_price'] = (stock['avg_price'] * stock['shares'] + price * shares) / (stock['shares'] + shares)
+                stock['shares'] += shares
+                stock['value'] = stock['shares'] * stock['current_price']
+                stock['profit_loss'] = (stock['current_price'] - stock['avg_price']) * stock['shares']
+                stock['profit_loss_percent'] = (stock['current_price'] - stock['avg_price']) / stock['avg_price'] * 100
+                continue
+            stock = {
+                'ticker': ticker,
+                'shares': shares,
+                'avg_price': price,
+                'current_price': price,
+                'value': shares * price,
+                'sentiment': '横盘震荡',
+                'profit_loss': 0,
+                'profit_loss_percent': 0,
+                'kelly_position': 0,
+                'ma_position': 0,
+                'position_advice': '',
+                'daily_change': 0,
+                'split_basis': today
+            }
+            self.portfolio['stocks'].append(stock)
+            existing[ticker] = stock
+        self.ledger.record_many([dict(kind=BUY, ticker=ticker, shares=shares, price=price) for ticker, shares, price
+                                 in zip(positions['ticker'], positions['shares'].tolist(), positions['price'].tolist())])
+        self.update_portfolio_value()
+        self.save_portfolio()
+    
+    def enrich_positions(self, tickers, progress=None, cancelled=None, max_workers=FETCH_WORKERS, batch=ENRICH_BATCH):
+        """并行补齐报价和市场情绪，返回成功的股票数（耗时较长，应在后台任务中调用）
+        
+        每完成一只股票调用 progress(股票, 是否成功, 已完成数, 总数)（在调用线程中调用）；
+        结果每 batch 只写入一次，避免逐只保存。cancelled() 返回True时丢弃尚未开始的股票，
+        已完成的部分照常写入。
+        """
+        tickers = list(tickers)
+        self._refresh_market_sources()
+        quotes, fields, finished = {}, {}, []
+        succeeded = 0
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            futures = {pool.submit(self._enrich_one, ticker): ticker for ticker in tickers}
+            for done, future in enumerate(as_completed(futures), 1):
+                ticker = futures[future]
+                try:
+                    quote, sentiment, reason = future.result()
+                except Exception as e:
+                    print(f"Error enriching {ticker}: {e}")
+                    quote = None
+                finished.append((ticker, quote is not None))
+                if quote is not None:
+                    succeeded += 1
+                    quotes[ticker] = quote
+                    fields[ticker] = {'sentiment': sentiment}
+                    if reason is not None:
+                        fields[ticker]['sentiment_reason'] = reason
+                stop = cancelled is not None and cancelled()
+                if stop:
+                    for pending in futures:
+                        pending.cancel()
+                elif len(quotes) < batch and done < len(tickers):
+                    continue
+                # 写入后再报告进度，界面刷新时读到的已是补齐后的数据
+                self.execute(self._apply_enrichment, quotes, fields, stop or done == len(tickers))
+                if progress is not None:
+                    for count, (name, ok) in enumerate(finished, done - len(finished) + 1):
+                        progress(name, ok, count, len(tickers))
+                quotes, fields, finished = {}, {}, []
+                if stop:
+                    break
+        self.metadata.save()
+        return succeeded
+    
+    def _enrich_one(self, ticker):
+        quote = self._fetch_quote(ticker)
+        sentiment, reason = self.graph.get('sentiment', ticker)
+        return quote, sentiment, reason
+    
+    def _apply_enrichment(self, quotes, fields, final):
+        """写入一批补齐的报价和情绪（在写线程中执行），最后一批记录净值快照"""
+        for stock in self.portfolio['stocks']:
+            updates = fields.get(stock['ticker'])
+            if updates:
+                stock.update(updates)
+        self._apply_quotes(quotes, record_equity=final)
+    
+    @command
     def remove_stock(self, ticker):
         """从投资组合中移除股票"""
         for i, stock in enumerate(self.portfolio['stocks']):
             if stock['ticker'] == ticker:
+                self.ledger.record(SELL, ticker, stock['shares'], stock['current_price'])
                 self.portfolio['cash'] += stock['shares'] * stock['current_price']
                 self.portfolio['stocks'].pop(i)
                 self.update_portfolio_value()
@@ -96,6 +554,7 @@ class StockProcessor:
                 return True
         return False
     
+    @command
     def update_shares(self, ticker, new_shares):
         """更新股票持仓数量"""
         for stock in self.portfolio['stocks']:
@@ -104,6 +563,13 @@ class StockProcessor:
                 if price_diff > self.portfolio['cash'] and new_shares > stock['shares']:
                     return False  # 现金不足
                 
+                # 按当前价在流水中记录买入或卖出，更新已实现盈亏；
+                # 修改股数不改变成本价（与之前一致），成本价只通过 update_avg_price 修改
+                delta = new_shares - stock['shares']
+                if delta:
+                    self.ledger.record(BUY if delta > 0 else SELL, ticker, abs(delta), stock['current_price'])
+                    stock['realized_pnl'] = self.ledger.position(ticker)['realized_fifo']
+                
                 self.portfolio['cash'] -= price_diff
                 stock['shares'] = new_shares
                 stock['value'] = stock['shares'] * stock['current_price']
@@ -114,10 +580,12 @@ class StockProcessor:
                 return True
         return False
         
+    @command
     def update_avg_price(self, ticker, new_avg_price):
         """更新股票的平均价格"""
         for stock in self.portfolio['stocks']:
             if stock['ticker'] == ticker:
+                self.ledger.record(ADJUST, ticker, price=new_avg_price)
                 stock['avg_price'] = new_avg_price
                 stock['profit_loss'] = (stock['current_price'] - stock['avg_price']) * stock['shares']
                 stock['profit_loss_percent'] = (stock['current_price'] - stock['avg_price']) / stock['avg_price'] * 100
@@ -126,220 +594,72 @@ class StockProcessor:
                 return True
         return False
     
+    @command
+    def update_cash(self, new_cash):
+        """更新现金余额"""
+        difference = new_cash - self.portfolio['cash']
+        if difference:
+            self.ledger.record(DEPOSIT if difference > 0 else WITHDRAW, amount=abs(difference))
+        self.portfolio['cash'] = new_cash
+        self.update_portfolio_value()
+        self.save_portfolio()
+        return True
+    
+    @command
+    def update_stock_fields(self, ticker, save=True, **fields):
+        """更新某只股票的若干字段"""
+        stock = self._find_stock(ticker, self.portfolio)
+        if stock is None:
+            return False
+        stock.update(fields)
+        if save:
+            self.save_portfolio()
+        return True
+    
     def update_sentiment(self, ticker, sentiment=None):
         """更新股票的市场情绪，如果不提供sentiment参数，则自动判断"""
-        for stock in self.portfolio['stocks']:
-            if stock['ticker'] == ticker:
-                if sentiment is None:
-                    # 自动判断市场情绪
-                    sentiment = self.auto_detect_sentiment(ticker)
-                stock['sentiment'] = sentiment
-                self.save_portfolio()
-                return True
-        return False
-        
-    def get_stock_data(self, ticker, period='1y'):
-        """获取股票历史数据"""
-        try:
-            stock = yf.Ticker(ticker)
-            data = stock.history(period=period)
-            
-            # 确保当前价格信息被正确获取和更新
-            if not data.empty:
-                # 更新股票的当前价格
-                for stock_item in self.portfolio['stocks']:
-                    if stock_item['ticker'] == ticker:
-                        # 获取最新收盘价作为当前价格
-                        current_price = data['Close'].iloc[-1]
-                        if not pd.isna(current_price):
-                            stock_item['current_price'] = current_price
-                            # 更新相关计算
-                            stock_item['value'] = stock_item['shares'] * current_price
-                            stock_item['profit_loss'] = (current_price - stock_item['avg_price']) * stock_item['shares']
-                            stock_item['profit_loss_percent'] = (current_price - stock_item['avg_price']) / stock_item['avg_price'] * 100
-                        break
-                # 保存更新后的投资组合
-                self.save_portfolio()
-            
-            return data
-        except Exception as e:
-            print(f"Error getting data for {ticker}: {e}")
-            return pd.DataFrame()
-            
-    def plot_stock_chart(self, ticker, figure=None, period='1y'):
-        """绘制股票价格图表和MACD指标"""
-        data = self.get_stock_data(ticker, period=period)
-        
-        if data.empty:
-            return None
-        
-        # 计算MACD
-        exp1 = data['Close'].ewm(span=12, adjust=False).mean()
-        exp2 = data['Close'].ewm(span=26, adjust=False).mean()
-        macd = exp1 - exp2
-        signal = macd.ewm(span=9, adjust=False).mean()
-        histogram = macd - signal
-        
-        # 计算均线
-        data['MA20'] = data['Close'].rolling(window=20).mean()
-        data['MA200'] = data['Close'].rolling(window=200).mean()
-        
-        if figure is None:
-            fig = Figure(figsize=(10, 8))
-        else:
-            fig = figure
-            # 确保完全清除之前的图表
-            fig.clear()
-        
-        # 调整子图比例，价格图占更多空间，MACD图放在下方
-        gs = fig.add_gridspec(2, 1, height_ratios=[2, 1])
-        
-        # 价格子图
-        ax1 = fig.add_subplot(gs[0])
-        ax1.plot(data.index, data['Close'], label='Close', linewidth=1.5)
-        ax1.plot(data.index, data['MA20'], label='MA20', linewidth=1.5, color='orange')
-        ax1.plot(data.index, data['MA200'], label='MA200', linewidth=1.5, color='purple')
-        
-        # 标记当前股价
-        current_price = data['Close'].iloc[-1]
-        # 确保current_price是标量值而不是Series
-        if isinstance(current_price, pd.Series):
-            current_price = float(current_price.iloc[-1])
-        
-        ax1.scatter(data.index[-1], current_price, color='red', s=50, zorder=5)
-        ax1.annotate(f'${current_price:.2f}', 
-                    xy=(data.index[-1], current_price),
-                    xytext=(10, 10),
-                    textcoords='offset points',
-                    fontweight='bold',
-                    color='red')
-        
-        # 标记MA20当前值
-        ma20_value = data['MA20'].iloc[-1]
-        if not np.isnan(ma20_value):  # 确保MA20值不是NaN
-            # 确保ma20_value是标量值
-            if isinstance(ma20_value, pd.Series):
-                ma20_value = float(ma20_value.iloc[-1])
-                
-            ax1.annotate(f'MA20: ${ma20_value:.2f}',
-                        xy=(data.index[-1], ma20_value),
-                        xytext=(10, -40),  # 将y方向的偏移从-20改为-40
-                        textcoords='offset points',
-                        fontweight='bold',
-                        color='orange')
-            
-        # 标记MA200当前值
-        ma200_value = data['MA200'].iloc[-1]
-        if not np.isnan(ma200_value):  # 确保MA200值不是NaN
-            if isinstance(ma200_value, pd.Series):
-                ma200_value = float(ma200_value.iloc[-1])
-                
-            ax1.annotate(f'MA200: ${ma200_value:.2f}',
-                        xy=(data.index[-1], ma200_value),
-                        xytext=(10, -70),  # 在MA20下方显示
-                        textcoords='offset points',
-                        fontweight='bold',
-                        color='purple')
-        
-        ax1.set_title(f'{ticker} Price Trend')
-        ax1.set_ylabel('Price')
-        ax1.legend(loc='upper left')
-        ax1.grid(True)
-        
-        # MACD子图 - 放在下方
-        ax2 = fig.add_subplot(gs[1], sharex=ax1)
-        ax2.plot(data.index, macd, label='MACD', color='blue', linewidth=1.2)
-        ax2.plot(data.index, signal, label='Signal', color='red', linewidth=1.2)
-        
-        # 绘制MACD直方图
-        # 确保数据是一维数组
-        if isinstance(histogram, pd.Series):
-            histogram = histogram.values
-        
-        # 创建正值和负值掩码
-        positive_mask = histogram >= 0
-        negative_mask = histogram < 0
-        
-        # 使用掩码创建正值和负值数组
-        zeros = np.zeros_like(histogram)
-        positive_values = np.where(positive_mask, histogram, zeros)
-        negative_values = np.where(negative_mask, histogram, zeros)
+        if self._find_stock(ticker) is None:
+            return False
+        if sentiment is None:
+            # 自动判断市场情绪（没有新日线时直接使用上次的判断结果）
+            self.refresh_sentiments([ticker])
+            return True
+        return self.update_stock_fields(ticker, sentiment=sentiment)
+    
+    @metrics.timed('sentiment.refresh')
+    def refresh_sentiments(self, tickers=None, max_workers=FETCH_WORKERS):
+        """重新判断多只股票（默认全部持仓）的市场情绪，返回发生变化的字段
         
-        # 绘制直方图
-        ax2.bar(data.index[positive_mask], positive_values[positive_mask], 
-                color='green', alpha=0.5, label='Histogram+')
-        ax2.bar(data.index[negative_mask], negative_values[negative_mask], 
-                color='red', alpha=0.5, label='Histogram-')
+        情绪只依赖日线，没有新的已收盘交易日时直接使用依赖图中缓存的结果；
+        需要读取日线的股票并行处理，结果一次写入。
+        """
+        if tickers is None:
+            tickers = [stock['ticker'] for stock in self.snapshot()['stocks']]
+        self._refresh_market_sources()
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            results = list(pool.map(lambda ticker: self.graph.get('sentiment', ticker), tickers))
+        updates = {}
+        for ticker, (sentiment, reason) in zip(tickers, results):
+            updates[ticker] = {'sentiment': sentiment}
+            if reason is not None:
+                updates[ticker]['sentiment_reason'] = reason
+        return self._write_changed(updates)
         
-        ax2.axhline(y=0, color='black', linestyle='-')
-        ax2.set_title('MACD')
-        ax2.set_ylabel('MACD Value')
-        ax2.set_xlabel('Date')
-        ax2.legend(loc='upper left')
-        ax2.grid(True)
-        
-        fig.tight_layout()
-        return fig
-            
-    def auto_detect_sentiment(self, ticker):
+    @metrics.timed('sentiment.detect')
+    def auto_detect_sentiment(self, ticker, interval='1d'):
         """自动判断市场情绪（突破前高+放量、横盘震荡、放量破位）"""
         try:
             # 获取股票历史数据
-            data = self.get_stock_data(ticker, period='3mo')  # 获取3个月数据
-            
-            if data.empty or len(data) < 20:
-                return "横盘震荡"  # 数据不足时默认为横盘震荡
-            
-            # 计算20日最高价
-            data['High_20d'] = data['High'].rolling(window=20).max()
-            
-            # 获取最近的价格和成交量数据
-            current_price = data['Close'].iloc[-1]
-            prev_price = data['Close'].iloc[-2]
-            current_volume = data['Volume'].iloc[-1]
-            
-            # 计算20日平均成交量
-            avg_volume_20d = data['Volume'].rolling(window=20).mean().iloc[-1]
-            
-            # 计算价格变动百分比
-            price_change = (current_price - prev_price) / prev_price * 100
-            
-            # 判断是否放量（当日成交量超过20日平均成交量的1.5倍）
-            is_high_volume = current_volume > avg_volume_20d * 1.5
-            
-            # 判断是否突破前高（当前价格超过20日最高价）
-            is_breakout = current_price > data['High_20d'].iloc[-2]
-            
-            # 判断是否横盘震荡（最近5天价格波动小于3%）
-            recent_prices = data['Close'].iloc[-5:]
-            price_range = (recent_prices.max() - recent_prices.min()) / recent_prices.min() * 100
-            is_consolidation = price_range < 3
-            
-            # 判断是否放量破位（放量且价格下跌超过2%）
-            is_breakdown = is_high_volume and price_change < -2
-            
-            # 根据条件判断市场情绪
-            sentiment = ""
-            sentiment_reason = ""
-            
-            if is_breakout and is_high_volume:
-                sentiment = "突破前高+放量"
-                sentiment_reason = f"当前价格(${current_price:.2f})突破了20日最高价(${data['High_20d'].iloc[-2]:.2f})，且成交量(${current_volume:.0f})是20日均量(${avg_volume_20d:.0f})的{current_volume/avg_volume_20d:.1f}倍"
-            elif is_breakdown:
-                sentiment = "放量破位"
-                sentiment_reason = f"股价下跌{abs(price_change):.2f}%，且成交量(${current_volume:.0f})是20日均量(${avg_volume_20d:.0f})的{current_volume/avg_volume_20d:.1f}倍"
-            elif is_consolidation:
-                sentiment = "横盘震荡"
-                sentiment_reason = f"最近5天价格波动仅{price_range:.2f}%，处于盘整状态"
+            if interval in INTRADAY_INTERVALS:
+                data = self.get_stock_data(ticker, period='5d', interval=interval)
             else:
-                sentiment = "横盘震荡"
-                sentiment_reason = "未满足其他情绪条件，默认为横盘震荡"
+                data = self.get_stock_data(ticker, period='3mo')  # 获取3个月数据
+            
+            sentiment, sentiment_reason = self._detect_sentiment(data)
             
             # 保存情绪判断原因
-            for stock in self.portfolio['stocks']:
-                if stock['ticker'] == ticker:
-                    stock['sentiment_reason'] = sentiment_reason
-                    break
+            if sentiment_reason is not None:
+                self.update_stock_fields(ticker, save=False, sentiment_reason=sentiment_reason)
             
             return sentiment
             
@@ -347,18 +667,119 @@ class StockProcessor:
             print(f"Error detecting sentiment for {ticker}: {e}")
             return "横盘震荡"  # 出错时默认为横盘震荡
     
+    def _detect_sentiment(self, data):
+        """按情绪规则判断市场情绪，返回 (情绪, 判断原因)；数据不足时原因为None"""
+        if data.empty or len(data) < 20:
+            return "横盘震荡", None  # 数据不足时默认为横盘震荡
+        
+        close = indicators.column(data, 'Close')
+        volume = indicators.column(data, 'Volume')
+        values = self._latest_columns(close, indicators.column(data, 'High'), volume)
+        
+        # 按规则匹配情绪（默认：突破前高+放量、放量破位、横盘震荡）
+        label = self.rules.scalar('sentiment', **values)
+        rule_set = self.rules['sentiment']
+        sentiment = rule_set.texts[rule_set.names.index(label)]
+        
+        current_price = values['close']
+        current_volume = values['volume']
+        avg_volume_20d = values['avg_volume_20d']
+        
+        if label == 'breakout':
+            sentiment_reason = f"当前价格(${current_price:.2f})突破了20日最高价(${values['high_20d_prev']:.2f})，且成交量(${current_volume:.0f})是20日均量(${avg_volume_20d:.0f})的{current_volume/avg_volume_20d:.1f}倍"
+        elif label == 'breakdown':
+            sentiment_reason = f"股价下跌{abs(values['price_change']):.2f}%，且成交量(${current_volume:.0f})是20日均量(${avg_volume_20d:.0f})的{current_volume/avg_volume_20d:.1f}倍"
+        elif label == 'consolidation':
+            sentiment_reason = f"最近5天价格波动仅{values['range_5d']:.2f}%，处于盘整状态"
+        elif label == 'sideways':
+            sentiment_reason = "未满足其他情绪条件，默认为横盘震荡"
+        else:
+            sentiment_reason = f"满足情绪规则: {label}"
+        
+        return sentiment, sentiment_reason
+    
+    @command
     def update_portfolio_value(self):
         """更新投资组合总价值"""
         total_stock_value = sum(stock['value'] for stock in self.portfolio['stocks'])
         self.portfolio['total_value'] = self.portfolio['cash'] + total_stock_value
+        # 持仓或价格变化后重建风险触发价
+        self.alert_engine.rebuild(self.portfolio['stocks'])
     
-    def update_stock_prices(self):
-        """更新所有股票的当前价格"""
+    def _fetch_quote(self, ticker):
+        """获取单只股票的最新价和前收盘价，失败时返回None（报价有效期内使用缓存）"""
+        try:
+            info = self.metadata.get(ticker, QUOTE_FIELDS + SPLIT_FIELDS, save=False)
+            split = None
+            if info.get('lastSplitDate') and info.get('lastSplitFactor'):
+                split = (info['lastSplitDate'], info['lastSplitFactor'])
+            return info.get('regularMarketPrice'), info.get('previousClose'), split
+        except Exception as e:
+            print(f"Error updating {ticker}: {e}")
+            return None
+    
+    @metrics.timed('update_stock_prices')
+    def update_stock_prices(self, max_workers=FETCH_WORKERS, tickers=None):
+        """更新股票的当前价格（默认全部持仓；报价并行获取，结果由写线程统一写入）"""
+        if tickers is None:
+            tickers = [stock['ticker'] for stock in self.snapshot()['stocks']]
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            quotes = dict(zip(tickers, pool.map(self._fetch_quote, tickers)))
+        self.metadata.save()
+        self.execute(self._apply_quotes, quotes)
+    
+    def refresh_due_prices(self, now=None):
+        """只更新刷新间隔已到期的股票，返回更新的股票列表
+        
+        每只股票的间隔由 RefreshScheduler 按现价到风险触发价的距离和近期波动率计算，
+        休市期间推迟到下一次开盘。更新后按新价格重新安排间隔。
+        """
+        now = time.time() if now is None else now
+        if not self.refresh.intervals:
+            self.plan_refresh(now)
+        due = self.refresh.due(now)
+        if due:
+            self.update_stock_prices(tickers=due)
+            self.refresh.mark(due, now)
+        self.plan_refresh(now)
+        return due
+    
+    def plan_refresh(self, now=None):
+        """按当前快照重新计算所有股票的刷新间隔，返回 {股票: 间隔秒数}"""
+        stocks = self.snapshot()['stocks']
+        volatility = {}
+        for stock in stocks:
+            try:
+                volatility[stock['ticker']] = self.graph.get('volatility', stock['ticker'])
+            except Exception as e:
+                print(f"Error computing volatility for {stock['ticker']}: {e}")
+        return self.refresh.plan(stocks, volatility, now)
+    
+    def warm_metadata(self, path=None, tickers=None):
+        """预热股票信息缓存：指定 path 时从JSON/CSV文件读取，否则并行请求所有持仓中已过期的静态字段"""
+        if path is not None:
+            return self.metadata.load_file(path)
+        if tickers is None:
+            tickers = [stock['ticker'] for stock in self.snapshot()['stocks']]
+        return len(self.metadata.warm(tickers))
+    
+    def _apply_quotes(self, quotes, record_equity=True):
+        """把获取到的报价写入投资组合（在写线程中执行）"""
+        # 先按拆股调整持仓口径，避免拆股被当作暴跌触发止损和熔断
+        for stock in self.portfolio['stocks']:
+            quote = quotes.get(stock['ticker'])
+            if quote is not None and quote[2] is not None:
+                self._record_split(stock['ticker'], *quote[2])
+            self._apply_splits(stock)
+        
+        previous_prices = {stock['ticker']: stock.get('current_price') for stock in self.portfolio['stocks']}
+        prices = {}
         for stock in self.portfolio['stocks']:
+            quote = quotes.get(stock['ticker'])
+            if quote is None:
+                continue
             try:
-                ticker_data = yf.Ticker(stock['ticker'])
-                current_price = ticker_data.info.get('regularMarketPrice')
-                prev_close = ticker_data.info.get('previousClose')
+                current_price, prev_close, _ = quote
                 
                 # 确保current_price有值，如果API返回None，则使用现有价格或平均成本价
                 if current_price is None:
@@ -374,24 +795,51 @@ class StockProcessor:
                 stock['profit_loss'] = (current_price - stock['avg_price']) * stock['shares']
                 stock['profit_loss_percent'] = (current_price - stock['avg_price']) / stock['avg_price'] * 100
                 stock['daily_change'] = (current_price - prev_close) / prev_close * 100
+                stock['prev_close'] = prev_close
+                prices[stock['ticker']] = current_price
             except Exception as e:
                 print(f"Error updating {stock['ticker']}: {e}")
         
+        # 以更新前的价格为基准批量检测风险信号
+        self.alert_engine.rebuild(self.portfolio['stocks'], baseline=previous_prices)
+        self.risk_alerts = self.alert_engine.evaluate(prices)
         self.update_portfolio_value()
         self.save_portfolio()
+        # 每次刷新记录一次净值快照
+        if record_equity:
+            self.equity.record(self.portfolio)
+    
+    def _record_split(self, ticker, split_date, split_factor):
+        """把报价信息中的最近一次拆股（时间戳, "2:1"）记入日线缓存的公司行为表"""
+        try:
+            new, old = (float(part) for part in str(split_factor).split(':'))
+            date = pd.Timestamp(split_date, unit='s') if isinstance(split_date, (int, float)) else pd.Timestamp(split_date)
+            self.daily_bars.add_action(ticker, date, daily_bars.SPLIT, new / old)
+        except Exception as e:
+            print(f"Error recording split for {ticker}: {e}")
+    
+    def _apply_splits(self, stock):
+        """按成本基准日之后的拆股调整持股数和成本价（在写线程中执行）
+        
+        没有 split_basis 的旧持仓以首次检查的日期为基准，认为当时的成本价已是拆股后的口径。
+        """
+        basis = stock.get('split_basis')
+        if basis is None:
+            stock['split_basis'] = datetime.date.today().isoformat()
+            return
+        for date, ratio in self.daily_bars.splits_since(stock['ticker'], basis):
+            stock['shares'] *= ratio
+            stock['avg_price'] /= ratio
+            for field in ('current_price', 'prev_close'):
+                if stock.get(field):
+                    stock[field] /= ratio
+            self.ledger.record(SPLIT, stock['ticker'], ratio=ratio)
+            stock['split_basis'] = date.date().isoformat()
     
     def get_vix_coefficient(self):
-        """获取VIX波动率系数"""
+        """获取VIX波动率系数（读取本地缓存的VIX日线，缓存过期才请求网络）"""
         try:
-            vix = yf.Ticker('^VIX')
-            vix_value = vix.info.get('regularMarketPrice', 15)  # 默认值15
-            
-            if vix_value < 20:
-                return 1.0
-            elif 20 <= vix_value <= 30:
-                return 1.5
-            else:  # vix > 30
-                return 2.0
+            return float(vix.regime(self.vix.latest()))
         except:
             return 1.0  # 默认值
     
@@ -406,184 +854,443 @@ class StockProcessor:
     
     def calculate_kelly_position(self, ticker):
         """计算凯利公式推荐的仓位比例"""
-        for stock in self.portfolio['stocks']:
-            if stock['ticker'] == ticker:
-                sentiment_prob = self.get_sentiment_probability(stock['sentiment'])
-                vix_coef = self.get_vix_coefficient()
-                
-                # 凯利公式: (上涨概率感官值 * 0.5) / 当前VIX波动率系数
-                kelly_position = (sentiment_prob * 0.5) / vix_coef
-                
-                # 转换为百分比并限制在0-100%之间
-                kelly_position = max(0, min(1, kelly_position)) * 100
-                
-                stock['kelly_position'] = kelly_position
-                self.save_portfolio()
-                return kelly_position
-        return 0
+        stock = self._find_stock(ticker)
+        if stock is None:
+            return 0
+        sentiment_prob = self.get_sentiment_probability(stock['sentiment'])
+        vix_coef = self.get_vix_coefficient()
+        
+        # 凯利公式: (上涨概率感官值 * 0.5) / 当前VIX波动率系数
+        kelly_position = (sentiment_prob * 0.5) / vix_coef
+        
+        # 转换为百分比并限制在0-100%之间
+        kelly_position = max(0, min(1, kelly_position)) * 100
+        
+        self.update_stock_fields(ticker, kelly_position=kelly_position)
+        return kelly_position
+    
+    def calculate_kelly_history(self, dates, tickers=None):
+        """按每个历史日期的VIX计算凯利仓位，返回 (日期 × 股票) 的DataFrame
+        
+        dates 可以是 DatetimeIndex 或 price_store.panel 返回的时间戳数组；
+        上涨概率使用各股票当前的市场情绪。
+        """
+        stocks = self.snapshot()['stocks']
+        if tickers is not None:
+            stocks = [stock for stock in stocks if stock['ticker'] in set(tickers)]
+        probabilities = np.array([self.get_sentiment_probability(stock['sentiment']) for stock in stocks])
+        coefficients = self.vix.coefficients(dates)
+        index = pd.DatetimeIndex(dates.astype('datetime64[ns]')).tz_localize('UTC') \
+            if isinstance(dates, np.ndarray) and dates.dtype == np.int64 \
+            else pd.DatetimeIndex(dates)
+        return pd.DataFrame(vix.kelly(probabilities, coefficients[:, None]), index=index,
+                            columns=[stock['ticker'] for stock in stocks])
     
-    def calculate_ma_position(self, ticker):
+    def calculate_ma_position(self, ticker, interval='1d'):
         """计算基于均线的仓位建议"""
         try:
             # 获取股票历史数据
-            end_date = datetime.datetime.now()
-            start_date = end_date - datetime.timedelta(days=365)  # 获取一年的数据
-            
-            stock_data = yf.download(ticker, start=start_date, end=end_date)
+            if interval in INTRADAY_INTERVALS:
+                stock_data = self.get_stock_data(ticker, period='1mo', interval=interval)
+            else:
+                stock_data = self.daily_bars.load(ticker, period='1y')  # 获取一年的复权日线
             
             if len(stock_data) < 200:  # 确保有足够的数据计算200日均线
                 return 0
             
-            # 计算20日和200日均线
-            stock_data['MA20'] = stock_data['Close'].rolling(window=20).mean()
-            stock_data['MA200'] = stock_data['Close'].rolling(window=200).mean()
-            
-            # 获取最新价格和均线值
-            latest_price = stock_data['Close'].iloc[-1]
-            latest_ma20 = stock_data['MA20'].iloc[-1]
-            latest_ma200 = stock_data['MA200'].iloc[-1]
-            
-            # 根据均线位置确定仓位
-            if latest_price < latest_ma200:  # 价格在200日均线下方
-                ma_position = 0
-            elif latest_price < latest_ma20:  # 价格在20日均线下方
-                ma_position = 5
-            else:  # 价格在20日均线上方
-                ma_position = 15
+            ma_position = self._ma_position(indicators.column(stock_data, 'Close'))
             
             # 更新股票信息
-            for stock in self.portfolio['stocks']:
-                if stock['ticker'] == ticker:
-                    stock['ma_position'] = ma_position
-                    self.save_portfolio()
-                    break
+            self.update_stock_fields(ticker, ma_position=ma_position)
             
             return ma_position
         except Exception as e:
             print(f"Error calculating MA position for {ticker}: {e}")
             return 0
     
-    def check_macd_signal(self, ticker):
+    def check_macd_signal(self, ticker, interval='1d'):
         """检查MACD信号"""
         try:
             # 获取股票历史数据
-            end_date = datetime.datetime.now()
-            start_date = end_date - datetime.timedelta(days=365)  # 获取一年的数据
-            
-            stock_data = yf.download(ticker, start=start_date, end=end_date)
+            if interval in INTRADAY_INTERVALS:
+                stock_data = self.get_stock_data(ticker, period='1mo', interval=interval)
+            else:
+                stock_data = self.daily_bars.load(ticker, period='1y')  # 获取一年的复权日线
             
             if len(stock_data) < 26:  # 确保有足够的数据计算MACD
                 return 0
             
-            # 计算MACD
-            exp1 = stock_data['Close'].ewm(span=12, adjust=False).mean()
-            exp2 = stock_data['Close'].ewm(span=26, adjust=False).mean()
-            macd = exp1 - exp2
-            signal = macd.ewm(span=9, adjust=False).mean()
-            
-            # 检查是否金叉，使用.item()方法将Series转换为标量值再进行比较
-            is_golden_cross = (macd.iloc[-2].item() < signal.iloc[-2].item()) and (macd.iloc[-1].item() > signal.iloc[-1].item())
-            
-            if not is_golden_cross:
-                return 0
-            
-            # 检查是否在零轴上方
-            if macd.iloc[-1] > 0:  # 零轴上方金叉
-                return 5  # 加仓5%
-            else:  # 零轴下方金叉
-                return 3  # 加仓3%
+            return self._macd_adjustment(indicators.column(stock_data, 'Close'))
         except Exception as e:
             print(f"Error checking MACD for {ticker}: {e}")
             return 0
     
+    def _ma_position(self, close):
+        """按均线仓位规则（默认：200日均线下方0%，20日均线下方5%，其余15%）确定仓位"""
+        return self.rules.scalar('ma_position', **self._latest_columns(close))
+    
+    def _macd_adjustment(self, close):
+        """按MACD规则（默认：金叉时零轴上方加仓5%，零轴下方3%）确定加仓比例"""
+        return self.rules.scalar('macd_adjustment', **self._latest_columns(close))
+    
+    def _fetch_signals(self, ticker):
+        """从依赖图读取 (均线仓位, MACD加仓比例)，没有新日线时不重新读取和计算"""
+        try:
+            return self.graph.get('ma', ticker), self.graph.get('macd', ticker)
+        except Exception as e:
+            print(f"Error fetching signals for {ticker}: {e}")
+            return 0, 0
+    
+    @metrics.timed('rebalance')
+    def generate_rebalance_orders(self, lot_size=1, tolerance=rebalance.DEFAULT_TOLERANCE,
+                                  max_workers=FETCH_WORKERS):
+        """合成凯利、均线、MACD和风险控制信号，生成整个组合的调仓订单
+        
+        每只股票只获取一次日线（并行），目标仓位和订单由向量化计算得到，
+        并满足单股25%、单个行业40%、现金30%的限制。
+        """
+        portfolio = self.snapshot()
+        stocks = portfolio['stocks']
+        if not stocks:
+            return []
+        tickers = [stock['ticker'] for stock in stocks]
+        self._refresh_market_sources()
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            signals = np.array(list(pool.map(self._fetch_signals, tickers)), dtype=float).reshape(-1, 2)
+        weights, shares, prices = self._target_weights(stocks, signals, portfolio['total_value'])
+        return rebalance.rebalance_orders(tickers, shares, prices, weights, portfolio['total_value'],
+                                          lot_size=lot_size, tolerance=tolerance)
+    
+    def _target_weights(self, stocks, signals, total_value):
+        """由 (均线仓位, MACD加仓比例) 信号矩阵计算目标仓位，返回 (目标仓位, 股数, 价格)"""
+        # 凯利公式: (上涨概率感官值 * 0.5) / 当前VIX波动率系数
+        probabilities = np.array([self.get_sentiment_probability(stock['sentiment']) for stock in stocks])
+        kelly = vix.kelly(probabilities, self.get_vix_coefficient())
+        
+        shares = np.array([stock['shares'] for stock in stocks], dtype=float)
+        prices = np.array([stock.get('current_price', stock['avg_price']) for stock in stocks], dtype=float)
+        avg_prices = np.array([stock['avg_price'] for stock in stocks], dtype=float)
+        daily_change = np.array([stock.get('daily_change', 0) for stock in stocks], dtype=float)
+        current_weights = shares * prices / total_value * 100 if total_value else np.zeros_like(shares)
+        
+        actions = self._risk_actions(prices, avg_prices, daily_change)
+        names, codes = self.classification.codes([stock['ticker'] for stock in stocks])
+        groups = np.where(names[codes] == sectors.UNCLASSIFIED, -1, codes) if len(codes) else codes
+        weights = rebalance.target_weights(kelly, signals[:, 0], signals[:, 1], actions, current_weights, groups=groups,
+                                           risk_params=self.risk_params)
+        return weights, shares, prices
+    
+    def target_shares(self, ticker, close):
+        """根据已有的日线收盘价计算单只股票的目标股数（与调仓订单使用相同规则）"""
+        stock = self._find_stock(ticker)
+        total_value = self.snapshot()['total_value']
+        if stock is None or not total_value:
+            return 0
+        signals = np.array([[self._ma_position(close), self._macd_adjustment(close)]], dtype=float)
+        weights, _, prices = self._target_weights([stock], signals, total_value)
+        return int(weights[0] / 100 * total_value // prices[0]) if prices[0] > 0 else 0
+    
     def check_risk_control(self, ticker):
         """检查风险控制信号"""
-        for stock in self.portfolio['stocks']:
+        for stock in self.snapshot()['stocks']:
             if stock['ticker'] == ticker:
-                # 检查单日波动
-                if abs(stock['daily_change']) > 5:  # 单日波动大于5%
-                    return {'action': 'reduce', 'percent': 50, 'reason': '单日波动大于5%（黑天鹅融断机制）'}
-                
-                # 检查止损
-                if stock['current_price'] < stock['avg_price'] * 0.97:  # 跌破买入价3%
-                    return {'action': 'sell_all', 'percent': 100, 'reason': '跌破买入价3%（止损机制）'}
-                
-                # 检查止盈
-                if stock['profit_loss_percent'] > 15:  # 盈利达到15%
-                    return {'action': 'take_profit', 'percent': 33, 'reason': '盈利达到15%（止盈机制）'}
-                
-                return {'action': 'hold', 'percent': 0, 'reason': '无风险控制信号'}
+                return self._risk_control(stock['current_price'], stock['avg_price'], stock['daily_change'])
         return {'action': 'hold', 'percent': 0, 'reason': '无风险控制信号'}
     
-    def generate_position_advice(self, ticker):
-        """生成仓位建议"""
-        # 计算凯利公式仓位
-        kelly_position = self.calculate_kelly_position(ticker)
+    def _risk_control(self, current_price, avg_price, daily_change):
+        """按风险控制规则（默认：单日波动>5%减仓，跌破成本3%清仓，盈利15%止盈）判断动作"""
+        action = self.rules.scalar('risk_action', price=current_price, avg_price=avg_price, daily_change=daily_change)
+        rules_by_action = risk_rules(self.risk_params)
+        if action in rules_by_action:
+            return dict(rules_by_action[action])
+        if action == 'hold':
+            return {'action': 'hold', 'percent': 0, 'reason': '无风险控制信号'}
+        return {'action': action, 'percent': 0, 'reason': f'满足风险规则: {action}'}
+    
+    def _risk_actions(self, prices, avg_prices, daily_change):
+        """向量化计算每个持仓的风险控制动作编号（rebalance 中的 HOLD/REDUCE/SELL_ALL/TAKE_PROFIT）"""
+        rule_set = self.rules['risk_action']
+        codes = rule_set.evaluate({'price': prices, 'avg_price': avg_prices, 'daily_change': daily_change})
+        # 自定义的动作名称不在调仓引擎的动作中时按持有处理
+        mapping = np.array([rebalance.RISK_ACTIONS.index(name) if name in rebalance.RISK_ACTIONS else rebalance.HOLD
+                            for name in rule_set.names], dtype=int)
+        return mapping[codes]
+    
+    def check_all_risk_controls(self):
+        """所有持仓当前的风险控制信号（随快照发布，可在任意线程中读取）"""
+        return self._active_alerts
+    
+    def close_panel(self, tickers=None, max_workers=FETCH_WORKERS):
+        """一年复权收盘价按日期对齐的面板（DataFrame，日期 × 股票），缺失的日期沿用前一天的价格
         
-        # 计算均线仓位
-        ma_position = self.calculate_ma_position(ticker)
+        日线来自依赖图的 bars 节点，没有新的已收盘交易日时不重新读取。
+        """
+        return self.bar_panels(tickers, ('Close',), max_workers)['Close']
+    
+    def bar_panels(self, tickers=None, fields=('Close', 'High', 'Volume'), max_workers=FETCH_WORKERS):
+        """一年日线各字段按日期对齐的面板 {字段: DataFrame（日期 × 股票）}
         
-        # 检查MACD信号
-        macd_adjustment = self.check_macd_signal(ticker)
+        价格缺失的日期沿用前一天的价格，成交量缺失时保留NaN。
+        """
+        if tickers is None:
+            tickers = [stock['ticker'] for stock in self.snapshot()['stocks']]
+        self._refresh_market_sources()
         
-        # 检查风险控制
-        risk_control = self.check_risk_control(ticker)
+        def load(ticker):
+            try:
+                bars = self.graph.get('bars', ticker)
+                return bars if len(bars) else None
+            except Exception as e:
+                print(f"Error getting daily bars for {ticker}: {e}")
+                return None
         
-        # 生成建议
-        for stock in self.portfolio['stocks']:
-            if stock['ticker'] == ticker:
-                # 基础建议
-                advice = f"凯利公式建议仓位: {kelly_position:.1f}%, 均线建议仓位: {ma_position:.1f}%\n"
-                
-                # 风险控制建议
-                if risk_control['action'] != 'hold':
-                    advice += f"风险控制: {risk_control['reason']}, 建议{risk_control['action'] == 'reduce' and '减仓' or risk_control['action'] == 'sell_all' and '清仓' or '止盈'} {risk_control['percent']}%\n"
-                
-                # MACD信号
-                if macd_adjustment > 0:
-                    advice += f"MACD金叉信号: 建议加仓 {macd_adjustment}%\n"
-                
-                # 现金比例检查
-                cash_ratio = self.portfolio['cash'] / self.portfolio['total_value'] * 100
-                if cash_ratio < 30:
-                    advice += "警告: 现金比例低于30%，建议保持足够的现金\n"
-                
-                # 单股仓位检查
-                stock_ratio = stock['value'] / self.portfolio['total_value'] * 100
-                if stock_ratio > 25:
-                    advice += "警告: 单股仓位超过25%，建议分散投资\n"
-                
-                stock['position_advice'] = advice
-                self.save_portfolio()
-                return advice
-        return ""
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            frames = {ticker: bars for ticker, bars in zip(tickers, pool.map(load, tickers)) if bars is not None}
+        panels = {}
+        for field in fields:
+            panel = pd.DataFrame({ticker: bars[field] for ticker, bars in frames.items()})
+            panel = panel.reindex(columns=tickers).sort_index()
+            panels[field] = panel if field == 'Volume' else panel.ffill()
+        return panels
     
-    def get_stock_data(self, ticker, period='1y'):
-        """获取股票历史数据用于绘图"""
+    @metrics.timed('rules.portfolio')
+    def evaluate_rules(self, names=None):
+        """用规则引擎一次评估全部持仓的全部规则组
+        
+        指标列由整个日线面板 (日期 × 股票) 向量化算出，再加上持仓的现价、成本价和
+        当日涨跌幅（price、avg_price、daily_change）。返回 DataFrame，每行一只股票，
+        每列为一个规则组在最新日期的结果（有 labels 的规则组为显示文字）。
+        """
+        stocks = self.snapshot()['stocks']
+        tickers = [stock['ticker'] for stock in stocks]
+        if not tickers:
+            return pd.DataFrame()
+        panels = self.bar_panels(tickers)
+        if panels['Close'].empty:
+            close = high = volume = np.full((1, len(tickers)), np.nan)
+        else:
+            close, high, volume = (panels[field].to_numpy(dtype=float) for field in ('Close', 'High', 'Volume'))
+        columns = rules.panel_columns(close, high, volume)
+        prices = np.array([stock.get('current_price', stock['avg_price']) for stock in stocks], dtype=float)
+        columns.update({
+            'price': np.broadcast_to(prices, close.shape),
+            'avg_price': np.broadcast_to(np.array([stock['avg_price'] for stock in stocks], dtype=float), close.shape),
+            'daily_change': np.broadcast_to(np.array([stock.get('daily_change', 0) for stock in stocks], dtype=float),
+                                            close.shape),
+        })
+        results = {}
+        for name, values in self.rules.evaluate_all(columns, names).items():
+            latest = values[-1]
+            rule_set = self.rules[name]
+            results[name] = rule_set.label(latest) if rule_set.names else latest
+        return pd.DataFrame(results, index=pd.Index(tickers, name='ticker'))
+    
+    @metrics.timed('covariance.sync')
+    def update_covariance(self):
+        """把持仓收益率的指数加权协方差更新到最新日线，并重新检查高度相关股票组的合计仓位
+        
+        持仓不变时只把新增日线逐日递推进协方差矩阵（每天 O(n²)），持仓变化时才用
+        一年的收益率面板重新初始化。超过合计仓位上限的股票组写入依赖图，
+        仓位建议中会给出警告。返回超限的股票组列表。
+        """
+        stocks = sorted(self.snapshot()['stocks'], key=lambda stock: -stock.get('value', 0))[:COVARIANCE_MAX_TICKERS]
+        tickers = sorted(stock['ticker'] for stock in stocks)
+        session = daily_bars.day_number(market_calendar.last_session_day())
+        with self._covariance_lock:
+            if tickers != self.covariance.tickers or self.covariance.last_day < session:
+                panel = self.close_panel(tickers)
+                if len(panel) > 1:
+                    self.covariance.sync(tickers, daily_bars.to_days(panel.index[1:]), risk.returns(panel.to_numpy()))
+            clusters = self.correlation_clusters()
+        
+        flagged = {}
+        for cluster in clusters:
+            for ticker in cluster['tickers']:
+                flagged[ticker] = (tuple(peer for peer in cluster['tickers'] if peer != ticker), round(cluster['weight'], 1))
+        self.graph.set('clusters', value=flagged)
+        return clusters
+    
+    def correlation_clusters(self):
+        """按最近一次更新的协方差矩阵和当前仓位，返回合计仓位超限的高度相关股票组"""
+        portfolio = self.snapshot()
+        values = {stock['ticker']: stock.get('value', 0) for stock in portfolio['stocks']}
+        if not portfolio['total_value'] or set(self.covariance.tickers) - set(values):
+            return []
+        weights = [values[ticker] / portfolio['total_value'] * 100 for ticker in self.covariance.tickers]
+        return self.covariance.clusters(weights)
+    
+    def correlation_report(self, max_tickers=40):
+        """相关性热力图数据：仓位最大的 max_tickers 只股票的相关系数矩阵和超限的股票组"""
+        clusters = self.update_covariance()
+        values = {stock['ticker']: stock.get('value', 0) for stock in self.snapshot()['stocks']}
+        tickers = self.covariance.tickers
+        order = sorted(range(len(tickers)), key=lambda i: -values.get(tickers[i], 0))[:max_tickers]
+        correlation = self.covariance.correlation()
+        return {
+            'tickers': [tickers[i] for i in order],
+            'correlation': correlation[np.ix_(order, order)],
+            'clusters': clusters,
+        }
+    
+    def classify_holdings(self, path=None):
+        """补齐持仓的行业分类：指定 path 时从CSV/JSON文件导入，否则只为分类表中没有的股票请求股票信息
+        
+        分类变化后重新检查行业合计仓位。返回写入的股票数。
+        """
+        version = self.classification.version
+        if path is not None:
+            count = self.classification.load_file(path)
+        else:
+            count = self.classification.fill(self.metadata, [stock['ticker'] for stock in self.snapshot()['stocks']])
+        if self.classification.version != version:
+            self.execute(self._sync_graph)
+        return count
+    
+    def sector_exposure(self, level='sector'):
+        """按行业（level='industry' 时按细分行业）汇总持仓数、市值、成本、盈亏和仓位"""
+        portfolio = self.snapshot()
+        stocks = portfolio['stocks']
+        names, codes = self.classification.codes([stock['ticker'] for stock in stocks], level)
+        values = [stock.get('value', 0) for stock in stocks]
+        costs = [stock['shares'] * stock['avg_price'] for stock in stocks]
+        return sectors.exposure(names, codes, values, costs, portfolio['total_value'])
+    
+    def sector_rollup(self):
+        """行业 → 细分行业两级汇总和超过行业上限的行业，缺少分类的持仓先补齐分类"""
+        self.classify_holdings()
+        portfolio = self.snapshot()
+        stocks = portfolio['stocks']
+        table = sectors.rollup(self.classification, [stock['ticker'] for stock in stocks],
+                               [stock.get('value', 0) for stock in stocks],
+                               [stock['shares'] * stock['avg_price'] for stock in stocks], portfolio['total_value'])
+        totals = table.xs('', level='industry')['weight'] if len(table) else {}
+        return {
+            'rollup': table,
+            'breaches': sectors.over_limit(totals),
+            'limit': rebalance.MAX_SECTOR,
+        }
+    
+    @metrics.timed('risk.portfolio')
+    def portfolio_risk(self, confidence=risk.DEFAULT_CONFIDENCE, horizon=1, scenarios=risk.DEFAULT_SCENARIOS):
+        """组合层面的风险：历史模拟法和参数法的 VaR/CVaR，以及压力情景下的盈亏
+        
+        返回字典：historical / parametric 为 (VaR, CVaR) 金额，scenarios 为各情景的
+        盈亏、占总资产比例、VIX波动率系数和凯利仓位缩放比例，betas 为各股票的β。
+        """
+        portfolio = self.snapshot()
+        stocks = portfolio['stocks']
+        tickers = [stock['ticker'] for stock in stocks]
+        exposures = np.array([stock.get('value', stock['shares'] * stock.get('current_price', stock['avg_price']))
+                              for stock in stocks], dtype=float)
+        daily = risk.returns(self.close_panel(tickers).to_numpy()) if tickers else np.empty((0, 0))
+        pnl = risk.horizon_returns(daily, horizon) @ exposures if len(daily) else np.empty(0)
+        beta = risk.betas(daily) if len(daily) else np.ones(len(tickers))
+        
+        shocks, levels = risk.scenario_matrix(scenarios, tickers, beta)
+        current_vix = self.graph.get('vix')
+        stressed = risk.stress(shocks, exposures, levels, current_vix, portfolio['total_value'])
+        return {
+            'confidence': confidence,
+            'horizon': horizon,
+            'days': len(daily),
+            'total_value': portfolio['total_value'],
+            'vix': current_vix,
+            'historical': risk.historical_var(pnl, confidence),
+            'parametric': risk.parametric_var(daily, exposures, confidence, horizon),
+            'scenarios': [
+                {
+                    'name': scenario['name'],
+                    'pnl': float(stressed['pnl'][i]),
+                    'pnl_percent': float(stressed['pnl_percent'][i]),
+                    'vix_coefficient': float(stressed['vix_coefficient'][i]),
+                    'kelly_scale': float(stressed['kelly_scale'][i]),
+                }
+                for i, scenario in enumerate(scenarios)
+            ],
+            'betas': dict(zip(tickers, map(float, beta))),
+        }
+    
+    @metrics.timed('advice.generate')
+    def generate_position_advice(self, ticker):
+        """生成仓位建议
+        
+        各项信号从依赖图读取，只有输入发生变化的环节才重新计算：
+        价格变化不会重新读取日线或重算均线，修改成本价只重算风险控制和建议文本。
+        """
+        if self._find_stock(ticker) is None:
+            return ""
+        self._refresh_market_sources()
+        advice = self.graph.get('advice', ticker)
+        self._write_changed({ticker: {
+            'kelly_position': self.graph.get('kelly', ticker),
+            'ma_position': self.graph.get('ma', ticker),
+            'position_advice': advice,
+        }})
+        return advice
+    
+    def _fetch_minute_bars(self, ticker, start=None, period='7d'):
+        """通过数据源获取一分钟K线，供本地K线缓存补齐数据"""
+        if start is not None:
+            return self.provider.history(ticker, interval='1m', start=start)
+        return self.provider.history(ticker, period=period, interval='1m')
+    
+    def get_stock_data(self, ticker, period='1y', interval='1d'):
+        """获取股票历史数据用于绘图，分钟级周期从本地一分钟K线缓存重采样"""
         try:
-            data = yf.download(ticker, period=period)
+            if interval in INTRADAY_INTERVALS:
+                return self.bar_store.load(ticker, period=period, interval=interval)
+            if interval == '1d':
+                return self.daily_bars.load(ticker, period=period)
+            data = self.provider.history(ticker, period=period, interval=interval)
             return data
         except Exception as e:
             print(f"Error getting data for {ticker}: {e}")
             return pd.DataFrame()
     
-    def plot_stock_chart(self, ticker, figure=None, period='1y'):
-        """绘制股票走势图和MACD图"""
-        data = self.get_stock_data(ticker, period=period)
+    def build_price_store(self, tickers=None, period='5y', max_workers=FETCH_WORKERS):
+        """并行下载多只股票的历史K线并写入内存映射行情存储（walkforward.py 从中读取）"""
+        if tickers is None:
+            tickers = [stock['ticker'] for stock in self.snapshot()['stocks']]
         
-        if data.empty:
-            return None
+        def fetch(ticker):
+            try:
+                return self.provider.history(ticker, period=period)
+            except Exception as e:
+                print(f"Error getting data for {ticker}: {e}")
+                return None
         
-        # 计算MACD
-        exp1 = data['Close'].ewm(span=12, adjust=False).mean()
-        exp2 = data['Close'].ewm(span=26, adjust=False).mean()
-        macd = exp1 - exp2
-        signal = macd.ewm(span=9, adjust=False).mean()
-        histogram = macd - signal
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            frames = dict(zip(tickers, pool.map(fetch, tickers)))
+        self.price_store.build(frames)
+        return self.price_store.tickers()
+    
+    def get_chart_series(self, ticker, period='1y', interval='1d', refresh=True):
+        """返回带多级降采样缓存的图表数据，数据没有变化时复用已计算的结果
         
-        # 计算均线
-        data['MA20'] = data['Close'].rolling(window=20).mean()
-        data['MA200'] = data['Close'].rolling(window=200).mean()
+        refresh=False 时直接使用已缓存的数据（例如缩放图表时），不重新获取K线。
+        """
+        key = (ticker, period, interval)
+        series = self._chart_series.get(key)
+        if series is not None and not refresh:
+            return series
+        data = self.get_stock_data(ticker, period=period, interval=interval)
+        if data.empty:
+            return series
+        if series is None or not series.matches(data):
+            series = self._chart_series[key] = ChartSeries(data)
+        return series
+    
+    def get_price_window(self, ticker, start=None, end=None):
+        """从行情存储中零拷贝读取某股票的时间窗口，未收录时返回None"""
+        return self.price_store.window(ticker, start, end)
+    
+    @metrics.timed('chart.render')
+    def plot_stock_chart(self, ticker, figure=None, period='1y', interval='1d'):
+        """绘制股票走势图和MACD图（按画布宽度使用降采样后的数据）"""
+        series = self.get_chart_series(ticker, period=period, interval=interval)
+        
+        if series is None:
+            return None
         
         if figure is None:
             fig = Figure(figsize=(10, 8))
@@ -591,23 +1298,29 @@ class StockProcessor:
             fig = figure
             fig.clear()
         
+        view = series.view(int(fig.get_figwidth() * fig.dpi))
+        lines = view['lines']
+        bars = view['bars']
+        bar_dates = pd.DatetimeIndex(bars['ns']).tz_localize('UTC').tz_convert(series.index.tz) \
+            if series.index.tz is not None else pd.DatetimeIndex(bars['ns'])
+        histogram = bars['hist']
+        current_price = series.lines['close'][-1]
+        ma20_value = series.lines['ma20'][-1]
+        last_date = series.index[-1]
+        
         # 调整子图比例，价格图占更多空间，MACD图放在下方
         gs = fig.add_gridspec(2, 1, height_ratios=[2, 1])
         
         # 价格子图
         ax1 = fig.add_subplot(gs[0])
-        ax1.plot(data.index, data['Close'], label='Close', linewidth=1.5)
-        ax1.plot(data.index, data['MA20'], label='MA20', linewidth=1.5, color='orange')
-        ax1.plot(data.index, data['MA200'], label='MA200', linewidth=1.5, color='purple')
-        
-        # 标记当前股价和MA20
-        current_price = float(data['Close'].iloc[-1]) if isinstance(data['Close'].iloc[-1], pd.Series) else data['Close'].iloc[-1]
-        ma20_value = float(data['MA20'].iloc[-1]) if isinstance(data['MA20'].iloc[-1], pd.Series) else data['MA20'].iloc[-1]
+        ax1.plot(*lines['close'], label='Close', linewidth=1.5)
+        ax1.plot(*lines['ma20'], label='MA20', linewidth=1.5, color='orange')
+        ax1.plot(*lines['ma200'], label='MA200', linewidth=1.5, color='purple')
         
         # 绘制标记点和标注
-        ax1.scatter(data.index[-1], current_price, color='red', s=50, zorder=5)
+        ax1.scatter(last_date, current_price, color='red', s=50, zorder=5)
         ax1.annotate(f'${current_price:.2f}', 
-                    xy=(data.index[-1], current_price),
+                    xy=(last_date, current_price),
                     xytext=(10, 20),
                     textcoords='offset points',
                     fontweight='bold',
@@ -615,7 +1328,7 @@ class StockProcessor:
         
         if not np.isnan(ma20_value):
             ax1.annotate(f'MA20: ${ma20_value:.2f}',
-                        xy=(data.index[-1], ma20_value),
+                        xy=(last_date, ma20_value),
                         xytext=(10, -10),
                         textcoords='offset points',
                         fontweight='bold',
@@ -628,14 +1341,10 @@ class StockProcessor:
         
         # MACD子图 - 放在下方
         ax2 = fig.add_subplot(gs[1], sharex=ax1)
-        ax2.plot(data.index, macd, label='MACD', color='blue', linewidth=1.2)
-        ax2.plot(data.index, signal, label='Signal', color='red', linewidth=1.2)
+        ax2.plot(*lines['macd'], label='MACD', color='blue', linewidth=1.2)
+        ax2.plot(*lines['signal'], label='Signal', color='red', linewidth=1.2)
         
         # 绘制MACD直方图
-        # 确保数据是一维数组
-        if isinstance(histogram, pd.Series):
-            histogram = histogram.values
-        
         # 创建正值和负值掩码
         positive_mask = histogram >= 0
         negative_mask = histogram < 0
@@ -646,9 +1355,9 @@ class StockProcessor:
         negative_values = np.where(negative_mask, histogram, zeros)
         
         # 绘制直方图
-        ax2.bar(data.index[positive_mask], positive_values[positive_mask], 
+        ax2.bar(bar_dates[positive_mask], positive_values[positive_mask], 
                 color='green', alpha=0.5, label='Histogram+')
-        ax2.bar(data.index[negative_mask], negative_values[negative_mask], 
+        ax2.bar(bar_dates[negative_mask], negative_values[negative_mask], 
                 color='red', alpha=0.5, label='Histogram-')
         
         ax2.axhline(y=0, color='black', linestyle='-')
@@ -0,0 +1,99 @@
+import numpy as np
+from alerts import risk_rules
+from metrics import metrics
+
+# 组合约束（百分比）
+MAX_POSITION = 25.0     # 单股仓位上限
+MAX_SECTOR = 40.0       # 单个行业的合计仓位上限
+MIN_CASH = 30.0         # 现金下限
+
+# 目标仓位与当前仓位相差不足该百分比时不调仓，避免频繁的小额交易
+DEFAULT_TOLERANCE = 1.0
+
+# 风险控制动作编号
+HOLD, REDUCE, SELL_ALL, TAKE_PROFIT = range(4)
+RISK_ACTIONS = ('hold', 'reduce', 'sell_all', 'take_profit')
+
+
+def target_weights(kelly, ma, macd, actions, current_weights,
+                   max_position=MAX_POSITION, min_cash=MIN_CASH, groups=None, max_group=MAX_SECTOR,
+                   risk_params=None):
+    """把各项信号合成为目标仓位（百分比）
+
+    凯利仓位受均线仓位封顶，均线允许持仓时再叠加MACD加仓；风险控制动作
+    在当前仓位基础上按 risk_params（规则组 risk_action 的参数，默认为内置规则）
+    中的比例减仓、清仓或止盈；最后限制单股上限，groups（每只股票的
+    行业编号，负数表示未分类）合计超过 max_group 的行业按比例缩减，并在股票
+    总仓位超过 100 - min_cash 时按比例缩减。
+    """
+    kelly = np.asarray(kelly, dtype=float)
+    ma = np.asarray(ma, dtype=float)
+    macd = np.asarray(macd, dtype=float)
+    actions = np.asarray(actions)
+    current_weights = np.asarray(current_weights, dtype=float)
+
+    weights = np.where(ma > 0, np.minimum(kelly, ma) + macd, 0.0)
+
+    cuts = risk_rules(risk_params)
+    reduce_ratio = np.select(
+        [actions == REDUCE, actions == SELL_ALL, actions == TAKE_PROFIT],
+        [1 - cuts['reduce']['percent'] / 100,
+         1 - cuts['sell_all']['percent'] / 100,
+         1 - cuts['take_profit']['percent'] / 100],
+        default=1.0,
+    )
+    weights = np.where(actions == HOLD, weights, np.minimum(weights, current_weights * reduce_ratio))
+    weights = np.clip(weights, 0.0, max_position)
+
+    if groups is not None and len(weights):
+        groups = np.asarray(groups, dtype=int)
+        classified = groups >= 0
+        codes = np.where(classified, groups, 0)
+        totals = np.bincount(codes[classified], weights=weights[classified], minlength=codes.max() + 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(totals > max_group, max_group / totals, 1.0)
+        weights = np.where(classified, weights * scale[codes], weights)
+
+    invested = weights.sum()
+    limit = 100.0 - min_cash
+    if invested > limit:
+        weights *= limit / invested
+    return weights
+
+
+@metrics.timed('rebalance.orders')
+def rebalance_orders(tickers, shares, prices, weights, total_value,
+                     lot_size=1, tolerance=DEFAULT_TOLERANCE):
+    """根据目标仓位生成调仓订单列表
+
+    目标股数向下取整到整手，因此买入不会挤占现金下限；目标与当前仓位
+    相差不足 tolerance 个百分点的股票不下单。返回按卖出在前排列的
+    [{'ticker', 'side', 'shares', 'price', 'value', 'target_weight'}]，先卖后买保证现金充足。
+    """
+    shares = np.asarray(shares, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    lot_size = np.broadcast_to(np.asarray(lot_size, dtype=float), shares.shape)
+
+    valid = (prices > 0) & (total_value > 0)
+    safe_prices = np.where(valid, prices, 1.0)
+    target_shares = np.floor(weights / 100 * total_value / safe_prices / lot_size) * lot_size
+    target_shares = np.where(valid, target_shares, shares)
+    delta = target_shares - shares
+
+    drift = np.abs(delta) * safe_prices / total_value * 100 if total_value > 0 else np.zeros_like(delta)
+    # 清仓信号不受容差限制
+    selected = np.flatnonzero((delta != 0) & ((drift >= tolerance) | (target_shares == 0)))
+    # 卖出在前，同方向按金额从大到小
+    order = np.lexsort((-np.abs(delta[selected]) * prices[selected], delta[selected] > 0))
+    orders = []
+    for i in selected[order]:
+        orders.append({
+            'ticker': tickers[i],
+            'side': 'buy' if delta[i] > 0 else 'sell',
+            'shares': float(abs(delta[i])),
+            'price': float(prices[i]),
+            'value': float(abs(delta[i]) * prices[i]),
+            'target_weight': float(weights[i]),
+        })
+    return orders
@@ -0,0 +1,131 @@
+"""按风险远近自适应的行情刷新调度
+
+固定间隔刷新全部持仓时，离止损价只差几分钱的股票和风平浪静的股票用同样的
+频率请求报价。RefreshScheduler 为每只股票单独计算刷新间隔：
+
+- 距离：现价到最近一个风险触发价（止损、止盈、前收盘±5%，阈值取自规则组
+  risk_action 的参数，与 check_risk_control 一致）的对数距离 d
+- 波动率：最近20个交易日的日收益率标准差 σ
+- 按随机游走估计，t 秒内价格变动的标准差约为 σ·sqrt(t / 一个交易日的秒数)，
+  取使 Z_SCORE 倍标准差恰好等于 d 的 t 作为间隔，再限制在
+  [MIN_INTERVAL, MAX_INTERVAL] 之间
+
+休市时所有股票都推迟到下一次开盘，每次最多刷新 MAX_BATCH 只最逾期的股票。
+"""
+import time
+import numpy as np
+import pandas as pd
+from alerts import trigger_levels
+import market_calendar
+
+# 开盘期间的最短/最长刷新间隔（秒）
+MIN_INTERVAL = 5
+MAX_INTERVAL = 30 * 60
+
+# 估计触发前的时间时使用的标准差倍数，越大越保守（刷新越频繁）
+Z_SCORE = 4.0
+
+# 一个常规交易日的秒数（9:30-16:00）
+SESSION_SECONDS = 6.5 * 3600
+
+# 计算波动率使用的交易日数，数据不足时的默认日波动率
+VOLATILITY_WINDOW = 20
+DEFAULT_VOLATILITY = 0.02
+
+# 每次最多刷新的股票数
+MAX_BATCH = 50
+
+# 调度循环两次检查之间最长的等待（秒），休市期间也能及时发现新增的持仓
+MAX_SLEEP = 15 * 60
+
+
+def daily_volatility(close, window=VOLATILITY_WINDOW):
+    """最近 window 个交易日对数收益率的标准差，数据不足时返回 DEFAULT_VOLATILITY"""
+    close = np.asarray(close, dtype=float)[-(window + 1):]
+    close = close[close > 0]
+    if len(close) < 3:
+        return DEFAULT_VOLATILITY
+    volatility = float(np.std(np.diff(np.log(close)), ddof=1))
+    return volatility if volatility > 0 else DEFAULT_VOLATILITY
+
+
+def trigger_distance(prices, levels):
+    """现价到最近触发价的对数距离（向量化），levels 为 trigger_levels() 的返回值"""
+    prices = np.asarray(prices, dtype=float)
+    levels = np.column_stack(levels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance = np.abs(np.log(levels / prices[:, None]))
+    return np.nanmin(np.where(np.isfinite(distance), distance, np.inf), axis=1)
+
+
+def refresh_intervals(distance, volatility, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+    """由触发距离和日波动率计算开盘期间的刷新间隔（秒）"""
+    volatility = np.maximum(np.asarray(volatility, dtype=float), 1e-6)
+    seconds = SESSION_SECONDS * (np.asarray(distance, dtype=float) / (Z_SCORE * volatility)) ** 2
+    return np.clip(np.nan_to_num(seconds, nan=min_interval, posinf=max_interval), min_interval, max_interval)
+
+
+class RefreshScheduler:
+    """记录每只股票上次刷新的时间和刷新间隔，给出到期需要刷新的股票"""
+
+    def __init__(self, batch=MAX_BATCH, params=None):
+        self.batch = batch
+        self.params = params    # 风险控制参数，None 时使用内置规则的阈值
+        self.intervals = {}     # 股票 -> 刷新间隔（秒）
+        self.last = {}          # 股票 -> 上次刷新时间
+
+    def plan(self, stocks, volatility, now=None):
+        """根据持仓快照和 {股票: 日波动率} 重新计算每只股票的刷新间隔
+
+        休市时间隔为距离下一次开盘的秒数，开盘后所有股票会立即到期。
+        """
+        now = time.time() if now is None else now
+        tickers = [stock['ticker'] for stock in stocks]
+        for ticker in set(self.intervals) - set(tickers):
+            self.intervals.pop(ticker, None)
+            self.last.pop(ticker, None)
+        if not tickers:
+            return {}
+
+        market_now = pd.Timestamp(now, unit='s', tz='UTC')
+        if market_calendar.market_open(market_now):
+            prices = [stock.get('current_price', stock['avg_price']) for stock in stocks]
+            distance = trigger_distance(prices, trigger_levels(stocks, self.params))
+            sigma = [volatility.get(ticker, DEFAULT_VOLATILITY) for ticker in tickers]
+            intervals = refresh_intervals(distance, sigma)
+        else:
+            # 休市期间推迟到开盘，加上已经过去的时间使到期时间恰好落在开盘时
+            wait = market_calendar.seconds_until_open(market_now)
+            intervals = [wait + now - self.last.get(ticker, now) for ticker in tickers]
+        self.intervals.update(zip(tickers, map(float, intervals)))
+        return dict(self.intervals)
+
+    def due(self, now=None):
+        """到期需要刷新的股票，按逾期程度（已等待时间 / 间隔）从高到低，最多 batch 只
+
+        从未刷新过的股票总是到期。
+        """
+        now = time.time() if now is None else now
+        overdue = {}
+        for ticker, interval in self.intervals.items():
+            last = self.last.get(ticker)
+            if last is None:
+                overdue[ticker] = np.inf
+            elif now - last >= interval:
+                overdue[ticker] = (now - last) / max(interval, 1e-9)
+        return sorted(overdue, key=overdue.get, reverse=True)[:self.batch]
+
+    def mark(self, tickers, now=None):
+        """记录刷新完成的时间"""
+        now = time.time() if now is None else now
+        for ticker in tickers:
+            self.last[ticker] = now
+
+    def next_due(self, now=None):
+        """距离下一只股票到期的秒数（没有持仓时为 None）"""
+        if not self.intervals:
+            return None
+        now = time.time() if now is None else now
+        waits = [0.0 if ticker not in self.last else self.last[ticker] + interval - now
+                 for ticker, interval in self.intervals.items()]
+        return max(0.0, min(waits))
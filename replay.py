@@ -0,0 +1,264 @@
+"""行情数据录制与回放
+
+RecordingProvider 包装真实数据源，把每次 history()/info() 的返回结果
+（包括VIX）保存到一个压缩的本地归档；ReplayProvider 从归档中读取，
+不访问网络，可以离线、可重复地重跑整个会话（包括界面和仓位建议）。
+
+同一请求的多次返回按顺序编号保存（例如每次刷新得到的报价），回放时按
+录制的顺序依次返回，用完后一直返回最后一次的结果，价格变化和预警触发
+都能按原样重现。内容相同的返回只保存一份。
+
+设置环境变量 STOCK_DATA_MODE=record 或 replay 即可切换，
+归档路径由 STOCK_DATA_ARCHIVE 指定（默认 cache/market_data.zip）。
+"""
+import io
+import os
+import json
+import atexit
+import hashlib
+import zipfile
+import threading
+import numpy as np
+import pandas as pd
+from metrics import metrics
+
+ARCHIVE_FILE = os.path.join('cache', 'market_data.zip')
+
+# 录制时每积累这么多条新结果，或第一条未保存的结果之后经过 SAVE_INTERVAL 秒，
+# 就把归档写入磁盘，程序崩溃或被强制结束时最多丢失最近的一小段录制
+SAVE_EVERY = 50
+SAVE_INTERVAL = 30.0
+
+
+def _history_key(ticker, period, interval, start, end):
+    return json.dumps(['history', ticker, period, interval,
+                       None if start is None else str(start), None if end is None else str(end)])
+
+
+def _info_key(ticker):
+    return json.dumps(['info', ticker])
+
+
+def _nth(key, n):
+    """同一请求第 n 次（从0开始）返回结果的键"""
+    return json.dumps(json.loads(key) + [n])
+
+
+def _series_key(ticker, interval):
+    """同一股票同一周期的最近一次录制，用于回放时匹配随当前时间变化的 start/end"""
+    return json.dumps(['history', ticker, interval])
+
+
+def _member(data, suffix):
+    """按内容命名成员，内容相同的返回只保存一份"""
+    return hashlib.sha1(data).hexdigest() + suffix
+
+
+def _frame_to_bytes(frame):
+    """把K线DataFrame序列化为npz字节"""
+    index = pd.DatetimeIndex(frame.index)
+    tz = '' if index.tz is None else str(index.tz)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    arrays = {'index': index.values.astype('datetime64[ns]').astype(np.int64), 'tz': np.array(tz)}
+    columns = [str(column[0] if isinstance(column, tuple) else column) for column in frame.columns]
+    arrays['columns'] = np.array(columns)
+    for i, column in enumerate(columns):
+        arrays[f"c{i}"] = np.asarray(frame.iloc[:, i])
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _frame_from_bytes(data):
+    with np.load(io.BytesIO(data)) as arrays:
+        index = pd.DatetimeIndex(arrays['index'])
+        tz = str(arrays['tz'])
+        if tz:
+            index = index.tz_localize('UTC').tz_convert(tz)
+        columns = [str(column) for column in arrays['columns']]
+        return pd.DataFrame({column: arrays[f"c{i}"] for i, column in enumerate(columns)}, index=index)
+
+
+class _Archive:
+    """zip归档：K线为 .npz 成员，info为 .json 成员，manifest.json 记录键与成员的对应关系
+
+    counts 记录每个请求已录制的次数，第 n 次的结果保存在键 _nth(请求键, n) 下。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.members = {}       # 键 -> 成员名
+        self.data = {}          # 成员名 -> 字节
+        self.counts = {}        # 请求键 -> 录制次数
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with zipfile.ZipFile(path, 'r') as archive:
+                manifest = json.loads(archive.read('manifest.json'))
+                self.members, self.counts = manifest['members'], manifest['counts']
+                self.data = {name: archive.read(name) for name in archive.namelist() if name != 'manifest.json'}
+
+    def get(self, key):
+        """返回 (成员名, 字节)，没有记录时返回 (None, None)"""
+        name = self.members.get(key)
+        return (None, None) if name is None else (name, self.data[name])
+
+    def put(self, key, name, data, latest=None):
+        """追加请求 key 的一次返回结果；latest 为同时指向最近一次结果的键"""
+        with self._lock:
+            self.data[name] = data
+            n = self.counts.get(key, 0)
+            self.members[_nth(key, n)] = name
+            self.counts[key] = n + 1
+            if latest is not None:
+                self.members[latest] = name
+
+    def save(self):
+        """写入临时文件后原子替换"""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp = self.path + '.tmp'
+            # 成员本身已经压缩（npz）或很小（json），zip层使用deflate即可
+            with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                archive.writestr('manifest.json', json.dumps({'members': self.members, 'counts': self.counts}))
+                for name, data in self.data.items():
+                    archive.writestr(name, data)
+            os.replace(tmp, self.path)
+
+
+class RecordingProvider:
+    """录制模式：调用真实数据源并保存每次返回的结果
+
+    归档在录制过程中定期写入（见 SAVE_EVERY / SAVE_INTERVAL），退出时再写一次。
+    """
+
+    def __init__(self, provider, path=ARCHIVE_FILE, save_every=SAVE_EVERY, save_interval=SAVE_INTERVAL):
+        self.provider = provider
+        self.archive = _Archive(path)
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self._unsaved = 0
+        self._timer = None
+        self._lock = threading.Lock()
+        atexit.register(self.save)
+
+    def _recorded(self):
+        """记录一条新结果，积累足够多时立即保存，否则在 save_interval 秒后保存"""
+        metrics.increment('replay.recorded')
+        with self._lock:
+            self._unsaved += 1
+            if self._unsaved < self.save_every:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.save_interval, self.save)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.save()
+
+    def history(self, ticker, period=None, interval='1d', start=None, end=None):
+        frame = self.provider.history(ticker, period=period, interval=interval, start=start, end=end)
+        data = _frame_to_bytes(frame)
+        self.archive.put(_history_key(ticker, period, interval, start, end), _member(data, '.npz'), data,
+                         latest=_series_key(ticker, interval))
+        self._recorded()
+        return frame
+
+    def info(self, ticker):
+        info = self.provider.info(ticker)
+        data = json.dumps(info, default=str).encode()
+        self.archive.put(_info_key(ticker), _member(data, '.json'), data)
+        self._recorded()
+        return info
+
+    @metrics.timed('replay.save')
+    def save(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._unsaved = 0
+        self.archive.save()
+
+
+class ReplayProvider:
+    """回放模式：从归档读取数据，不访问网络
+
+    每个请求按录制的顺序依次返回各次结果，用完后重复最后一次。history() 先按
+    完整参数匹配；没有完全相同的记录时（例如 start/end 取决于当前时间），使用
+    同一股票同一周期最近一次录制的数据并按 start/end 截取。归档中没有的请求
+    （包括截取后为空）抛出 KeyError，与网络请求失败时的处理方式一致。
+    """
+
+    def __init__(self, path=ARCHIVE_FILE):
+        self.archive = _Archive(path)
+        self._frames = {}
+        self._cursors = {}      # 请求键 -> 下一次返回的序号
+        self._lock = threading.Lock()
+
+    def _next(self, key):
+        """请求 key 的下一次录制结果 (成员名, 字节)，没有录制时返回 (None, None)"""
+        count = self.archive.counts.get(key, 0)
+        if not count:
+            return None, None
+        with self._lock:
+            n = self._cursors.get(key, 0)
+            self._cursors[key] = n + 1
+        return self.archive.get(_nth(key, min(n, count - 1)))
+
+    def history(self, ticker, period=None, interval='1d', start=None, end=None):
+        name, data = self._next(_history_key(ticker, period, interval, start, end))
+        exact = data is not None
+        if not exact:
+            name, data = self.archive.get(_series_key(ticker, interval))
+        if data is None:
+            metrics.increment('replay.miss')
+            raise KeyError(f"归档中没有 {ticker} {interval} 的K线")
+        # 解码后的DataFrame缓存在内存中，重复请求不再解压
+        frame = self._frames.get(name)
+        if frame is None:
+            frame = self._frames[name] = _frame_from_bytes(data)
+        if not exact:
+            frame = _slice(frame, start, end)
+            if frame.empty:
+                metrics.increment('replay.miss')
+                raise KeyError(f"归档中没有 {ticker} {interval} 在 {start} - {end} 之间的K线")
+        metrics.increment('replay.hit')
+        return frame.copy()
+
+    def info(self, ticker):
+        _, data = self._next(_info_key(ticker))
+        if data is None:
+            metrics.increment('replay.miss')
+            raise KeyError(f"归档中没有 {ticker} 的报价信息")
+        metrics.increment('replay.hit')
+        return json.loads(data)
+
+
+def _slice(frame, start, end):
+    """按 start/end 截取K线，范围内没有数据时返回空的DataFrame"""
+    if frame.empty or (start is None and end is None):
+        return frame
+    index = frame.index
+    mask = np.ones(len(frame), dtype=bool)
+    for bound, compare in ((start, np.greater_equal), (end, np.less)):
+        if bound is None:
+            continue
+        bound = pd.Timestamp(bound)
+        if index.tz is not None:
+            bound = bound.tz_localize(index.tz) if bound.tz is None else bound.tz_convert(index.tz)
+        mask &= compare(index, bound)
+    return frame[mask]
+
+
+def provider_from_env(provider=None):
+    """根据环境变量 STOCK_DATA_MODE（record/replay）包装或替换数据源"""
+    mode = os.environ.get('STOCK_DATA_MODE', '').strip().lower()
+    path = os.environ.get('STOCK_DATA_ARCHIVE', ARCHIVE_FILE)
+    if mode == 'replay':
+        return ReplayProvider(path)
+    if provider is None:
+        from data_provider import YFinanceProvider
+        provider = YFinanceProvider()
+    if mode == 'record':
+        return RecordingProvider(provider, path)
+    return provider
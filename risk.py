@@ -0,0 +1,135 @@
+"""组合层面的风险度量：VaR/CVaR 和压力测试
+
+check_risk_control 只看单只股票的止损、止盈和熔断阈值。这里把整个组合
+作为一个整体：
+
+- 历史模拟法：用缓存日线算出的收益率面板 (日期 × 股票) 乘以持仓市值，
+  得到组合每天的盈亏，取分位数得到 VaR，尾部平均得到 CVaR
+- 参数法：假设收益率服从正态分布，组合标准差为 sqrt(wᵀΣw)
+- 压力测试：每个情景由市场冲击、个股冲击和VIX水平组成。个股价格变动为
+  β × 市场冲击（个股冲击优先），全部情景组成 (情景 × 股票) 的冲击矩阵，
+  与持仓市值做一次矩阵乘法得到所有情景的盈亏；VIX水平按 vix.regime
+  换算为凯利波动率系数，得到情景下凯利仓位的缩放比例
+
+所有函数只依赖 NumPy，金额与 exposures 同单位。
+"""
+from statistics import NormalDist
+import numpy as np
+import vix
+from metrics import metrics
+
+DEFAULT_CONFIDENCE = 0.95
+
+# 预置的压力情景：market 为市场涨跌幅，vix 为情景下的VIX（None 表示不变），
+# shocks 为个股涨跌幅（优先于 β × 市场冲击）
+DEFAULT_SCENARIOS = (
+    {'name': '市场下跌10%', 'market': -0.10, 'vix': None},
+    {'name': '市场下跌20%', 'market': -0.20, 'vix': None},
+    {'name': 'VIX升至40', 'market': 0.0, 'vix': 40},
+    {'name': '市场下跌10%且VIX升至40', 'market': -0.10, 'vix': 40},
+    {'name': '市场上涨10%', 'market': 0.10, 'vix': None},
+)
+
+
+def returns(close):
+    """由收盘价面板 (日期 × 股票) 计算简单收益率，缺失的价格对应的收益率记为0"""
+    close = np.asarray(close, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = close[1:] / close[:-1] - 1
+    return np.where(np.isfinite(result), result, 0.0)
+
+
+def horizon_returns(daily, horizon=1):
+    """把日收益率合成为 horizon 天的滚动（重叠）收益率"""
+    if horizon <= 1:
+        return daily
+    growth = np.cumsum(np.log1p(daily), axis=0)
+    growth = np.vstack([np.zeros((1, daily.shape[1])), growth])
+    return np.expm1(growth[horizon:] - growth[:-horizon])
+
+
+def historical_var(pnl, confidence=DEFAULT_CONFIDENCE):
+    """历史模拟法，返回 (VaR, CVaR)，均为正数表示的损失"""
+    pnl = np.asarray(pnl, dtype=float)
+    if not len(pnl):
+        return 0.0, 0.0
+    cutoff = np.quantile(pnl, 1 - confidence)
+    tail = pnl[pnl <= cutoff]
+    return float(max(0.0, -cutoff)), float(max(0.0, -tail.mean()))
+
+
+def parametric_var(daily, exposures, confidence=DEFAULT_CONFIDENCE, horizon=1):
+    """参数法（正态分布），返回 (VaR, CVaR)，期望收益和方差按 horizon 天线性放大"""
+    daily = np.asarray(daily, dtype=float)
+    exposures = np.asarray(exposures, dtype=float)
+    if len(daily) < 2:
+        return 0.0, 0.0
+    mean = float(daily.mean(axis=0) @ exposures) * horizon
+    covariance = np.atleast_2d(np.cov(daily, rowvar=False))
+    sigma = float(np.sqrt(max(0.0, exposures @ covariance @ exposures) * horizon))
+    normal = NormalDist()
+    z = normal.inv_cdf(1 - confidence)
+    var = -(mean + z * sigma)
+    cvar = -(mean - sigma * normal.pdf(z) / (1 - confidence))
+    return max(0.0, var), max(0.0, cvar)
+
+
+def betas(daily, market=None):
+    """各股票相对市场的β，market 默认为各股票收益率的等权平均"""
+    daily = np.asarray(daily, dtype=float)
+    market = daily.mean(axis=1) if market is None else np.asarray(market, dtype=float)
+    if len(market) < 2:
+        return np.ones(daily.shape[1])
+    centered = market - market.mean()
+    variance = centered @ centered
+    if variance <= 0:
+        return np.ones(daily.shape[1])
+    return centered @ (daily - daily.mean(axis=0)) / variance
+
+
+def scenario_matrix(scenarios, tickers, beta):
+    """把情景列表展开为 (情景 × 股票) 的价格变动矩阵和情景VIX数组（不变为NaN）"""
+    index = {ticker: i for i, ticker in enumerate(tickers)}
+    market = np.array([scenario.get('market', 0.0) or 0.0 for scenario in scenarios], dtype=float)
+    shocks = market[:, None] * np.asarray(beta, dtype=float)[None, :]
+    for row, scenario in enumerate(scenarios):
+        for ticker, shock in (scenario.get('shocks') or {}).items():
+            if ticker in index:
+                shocks[row, index[ticker]] = shock
+    levels = np.array([np.nan if scenario.get('vix') is None else scenario['vix'] for scenario in scenarios], dtype=float)
+    # 价格最多跌到0
+    return np.maximum(shocks, -1.0), levels
+
+
+@metrics.timed('risk.stress')
+def stress(shocks, exposures, vix_levels=None, current_vix=vix.DEFAULT_VIX, total_value=None):
+    """一次矩阵运算评估全部情景
+
+    shocks 为 (情景 × 股票) 的价格变动，exposures 为各股票持仓市值。返回字典：
+    pnl（各情景盈亏）、pnl_percent（占总资产百分比，未提供 total_value 时按持仓
+    总市值）、vix_coefficient（情景下的波动率系数）、kelly_scale（凯利仓位相对
+    当前的缩放比例，VIX升高时小于1）。
+    """
+    shocks = np.asarray(shocks, dtype=float)
+    exposures = np.asarray(exposures, dtype=float)
+    pnl = shocks @ exposures
+    base = total_value if total_value else exposures.sum()
+    levels = np.full(len(shocks), np.nan) if vix_levels is None else np.asarray(vix_levels, dtype=float)
+    levels = np.where(np.isnan(levels), current_vix, levels)
+    coefficients = vix.regime(levels)
+    return {
+        'pnl': pnl,
+        'pnl_percent': pnl / base * 100 if base else np.zeros(len(pnl)),
+        'vix_coefficient': coefficients,
+        'kelly_scale': float(vix.regime(current_vix)) / coefficients,
+    }
+
+
+def random_scenarios(count, tickers, beta, market_sigma=0.05, idiosyncratic_sigma=0.03, seed=None):
+    """生成随机情景矩阵：市场冲击 × β 加上个股扰动，VIX随市场下跌而上升"""
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0, market_sigma, count)
+    shocks = market[:, None] * np.asarray(beta, dtype=float)[None, :] + \
+        rng.normal(0, idiosyncratic_sigma, (count, len(tickers)))
+    levels = np.clip(vix.DEFAULT_VIX - market * 250, 9, 90)
+    return np.maximum(shocks, -1.0), levels
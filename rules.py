@@ -0,0 +1,342 @@
+"""声明式仓位与风险规则
+
+规则文件（JSON，安装了PyYAML时也可用YAML）由若干规则组组成，每组对应一个
+输出，例如均线仓位、MACD加仓比例、风险控制动作、市场情绪：
+
+    {
+        "ma_position": {
+            "default": 15,
+            "rules": ["count < 200 -> 0", "close < ma200 -> 0", "close < ma20 -> 5"]
+        }
+    }
+
+每条规则写作 "条件 -> 值"，按顺序匹配，第一条满足的规则生效（与 if/elif 相同），
+都不满足时取 default。条件和值是对指标列的算术/比较/逻辑表达式（and、or、not、
+abs、min、max），值也可以是 labels 中的名称（例如风险动作、情绪）。规则组可以用
+params 定义命名常量，在条件和值中直接引用。
+
+风险控制规则组 risk_action 的阈值同时用于预警触发价、刷新频率和调仓减仓比例，
+这些地方无法从任意表达式中推出阈值，因此规则文件只能修改它的 params：
+
+    {"risk_action": {"params": {"stop_percent": 5, "profit_percent": 20}}}
+
+规则在加载时编译为数组表达式：安装了 numexpr 时用 numexpr 计算，否则用
+NumPy。指标列可以是整个面板 (日期 × 股票)，所有股票、所有日期一次算完。
+"""
+import ast
+import json
+import numpy as np
+import indicators
+from metrics import metrics
+
+try:
+    import numexpr
+    HAS_NUMEXPR = True
+except ImportError:
+    HAS_NUMEXPR = False
+
+try:
+    import yaml
+    HAS_YAML = True
+except ImportError:
+    HAS_YAML = False
+
+# 可以手动关闭numexpr（例如用于对比测试）
+USE_NUMEXPR = HAS_NUMEXPR
+
+# 数组元素少于这个数时numexpr的启动开销大于收益，直接用NumPy
+NUMEXPR_MIN_SIZE = 10000
+
+RULES_FILE = 'rules.json'
+
+# 按顺序查找的规则文件名
+RULES_FILES = (RULES_FILE, 'rules.yaml', 'rules.yml')
+
+# 内置规则，与原来 calculate_ma_position / check_macd_signal / check_risk_control /
+# auto_detect_sentiment 中的判断一致；规则文件中的同名规则组会覆盖这里的定义
+DEFAULT_RULES = {
+    'ma_position': {
+        'default': 15,
+        'rules': [
+            'count < 200 -> 0',
+            'close < ma200 -> 0',
+            'close < ma20 -> 5',
+        ],
+    },
+    'macd_adjustment': {
+        'default': 0,
+        'rules': [
+            'count < 26 -> 0',
+            'golden_cross and macd > 0 -> 5',
+            'golden_cross -> 3',
+        ],
+    },
+    'risk_action': {
+        'labels': ['hold', 'reduce', 'sell_all', 'take_profit'],
+        'default': 'hold',
+        # 阈值和各动作的减仓比例（百分比）
+        'params': {
+            'band_percent': 5,           # 单日波动超过该幅度减仓
+            'stop_percent': 3,           # 跌破买入价该幅度清仓
+            'profit_percent': 15,        # 盈利达到该幅度止盈
+            'reduce_cut': 50,
+            'sell_all_cut': 100,
+            'take_profit_cut': 33,
+        },
+        'rules': [
+            'abs(daily_change) > band_percent -> reduce',
+            'price < avg_price * (1 - stop_percent / 100) -> sell_all',
+            'price > avg_price * (1 + profit_percent / 100) -> take_profit',
+        ],
+    },
+    'sentiment': {
+        'labels': {
+            'sideways': '横盘震荡',
+            'breakout': '突破前高+放量',
+            'breakdown': '放量破位',
+            'consolidation': '横盘震荡',
+        },
+        'default': 'sideways',
+        'rules': [
+            'count < 20 -> sideways',
+            'breakout and high_volume -> breakout',
+            'high_volume and price_change < -2 -> breakdown',
+            'range_5d < 3 -> consolidation',
+        ],
+    },
+}
+
+_BINARY = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/', ast.Mod: '%', ast.Pow: '**'}
+_COMPARE = {ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=', ast.Eq: '==', ast.NotEq: '!='}
+_NUMPY_FUNCTIONS = {'where': np.where, 'abs': np.abs}
+
+
+class RuleError(ValueError):
+    """规则无法解析或引用了不存在的指标列"""
+
+
+def _translate(node, constants, names):
+    """把Python表达式语法树翻译为 numexpr / NumPy 通用的表达式字符串，同时收集引用的列名"""
+    if isinstance(node, ast.BoolOp):
+        op = ' & ' if isinstance(node.op, ast.And) else ' | '
+        return '(' + op.join(_translate(value, constants, names) for value in node.values) + ')'
+    if isinstance(node, ast.UnaryOp):
+        operand = _translate(node.operand, constants, names)
+        if isinstance(node.op, ast.Not):
+            return f'(~{operand})'
+        if isinstance(node.op, ast.USub):
+            return f'(-{operand})'
+        if isinstance(node.op, ast.UAdd):
+            return operand
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        return f'({_translate(node.left, constants, names)} {_BINARY[type(node.op)]} {_translate(node.right, constants, names)})'
+    if isinstance(node, ast.Compare):
+        # 链式比较 a < b < c 拆成 (a < b) & (b < c)
+        operands = [_translate(node.left, constants, names)] + [_translate(c, constants, names) for c in node.comparators]
+        parts = [f'({operands[i]} {_COMPARE[type(op)]} {operands[i + 1]})' for i, op in enumerate(node.ops)
+                 if type(op) in _COMPARE]
+        if len(parts) != len(node.ops):
+            raise RuleError("不支持的比较运算")
+        return parts[0] if len(parts) == 1 else '(' + ' & '.join(parts) + ')'
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        args = [_translate(arg, constants, names) for arg in node.args]
+        if node.func.id == 'abs' and len(args) == 1:
+            return f'abs({args[0]})'
+        if node.func.id in ('min', 'max') and len(args) == 2:
+            op = '<' if node.func.id == 'min' else '>'
+            return f'where({args[0]} {op} {args[1]}, {args[0]}, {args[1]})'
+        raise RuleError(f"不支持的函数: {node.func.id}")
+    if isinstance(node, ast.Name):
+        if node.id in constants:
+            return repr(constants[node.id])
+        if node.id in ('True', 'False'):
+            return node.id
+        names.add(node.id)
+        return node.id
+    if isinstance(node, ast.Constant) and isinstance(node.value, (bool, int, float)):
+        return repr(node.value)
+    raise RuleError(f"不支持的表达式: {ast.dump(node)}")
+
+
+class Expression:
+    """编译后的数组表达式"""
+
+    def __init__(self, text, constants=None):
+        self.text = str(text)
+        self.names = set()
+        try:
+            tree = ast.parse(self.text.strip(), mode='eval')
+        except SyntaxError as e:
+            raise RuleError(f"无法解析表达式 '{self.text}': {e}") from None
+        self.source = _translate(tree.body, constants or {}, self.names)
+        self.code = compile(self.source, '<rule>', 'eval')
+
+    def evaluate(self, columns):
+        missing = self.names - set(columns)
+        if missing:
+            raise RuleError(f"规则 '{self.text}' 引用了不存在的指标列: {', '.join(sorted(missing))}")
+        local = {name: columns[name] for name in self.names}
+        if USE_NUMEXPR and local and max(np.size(value) for value in local.values()) >= NUMEXPR_MIN_SIZE:
+            return numexpr.evaluate(self.source, local_dict=local)
+        return eval(self.code, {'__builtins__': {}, **_NUMPY_FUNCTIONS}, local)
+
+
+class RuleSet:
+    """一组按顺序匹配的规则，对应一个输出"""
+
+    def __init__(self, name, rules, default=0, labels=None, params=None):
+        self.name = name
+        self.params = dict(params or {})
+        # labels 可以是名称列表（值为下标），也可以是 {名称: 显示文字}
+        if isinstance(labels, dict):
+            self.names, self.texts = list(labels), list(labels.values())
+        else:
+            self.names = list(labels or [])
+            self.texts = list(self.names)
+        constants = {label: i for i, label in enumerate(self.names)}
+        if set(constants) & set(self.params):
+            raise RuleError(f"规则组 {name} 的参数与标签重名: {', '.join(sorted(set(constants) & set(self.params)))}")
+        constants.update(self.params)
+        self.conditions = []
+        self.values = []
+        for rule in rules:
+            if isinstance(rule, dict):
+                condition, value = rule['when'], rule['then']
+            elif '->' in str(rule):
+                condition, value = str(rule).rsplit('->', 1)
+            else:
+                raise RuleError(f"规则 '{rule}' 缺少 '->'")
+            # 名称只在值中表示标签，条件中同名的仍是指标列（例如 breakout）
+            self.conditions.append(Expression(condition, self.params))
+            self.values.append(Expression(value, constants))
+        self.default = Expression(default, constants)
+        self.rules = list(rules)
+
+    @property
+    def columns(self):
+        """规则用到的全部指标列"""
+        return set().union(self.default.names, *(e.names for e in self.conditions + self.values))
+
+    def evaluate(self, columns):
+        """按顺序匹配规则，返回与指标列形状相同的结果数组（有 labels 时为下标）"""
+        columns = {name: np.asarray(value) for name, value in columns.items()}
+        missing = self.columns - set(columns)
+        if missing:
+            raise RuleError(f"规则组 {self.name} 缺少指标列: {', '.join(sorted(missing))}")
+        shape = np.broadcast_shapes(*(np.shape(columns[name]) for name in self.columns)) if self.columns else ()
+        conditions = [np.broadcast_to(condition.evaluate(columns), shape) for condition in self.conditions]
+        values = [np.broadcast_to(value.evaluate(columns), shape) for value in self.values]
+        default = np.broadcast_to(self.default.evaluate(columns), shape)
+        if not conditions:
+            return np.array(default)
+        return np.select(conditions, values, default=default)
+
+    def label(self, codes):
+        """把结果下标转换为显示文字"""
+        return np.asarray(self.texts, dtype=object)[np.asarray(codes, dtype=int)]
+
+
+class RuleBook:
+    """全部规则组"""
+
+    def __init__(self, definitions=None):
+        definitions = dict(DEFAULT_RULES, **_risk_override((definitions or {}).get('risk_action'), definitions))
+        self.sets = {name: RuleSet(name, spec.get('rules', []), spec.get('default', 0), spec.get('labels'),
+                                   spec.get('params'))
+                     for name, spec in definitions.items()}
+
+    def __contains__(self, name):
+        return name in self.sets
+
+    def __getitem__(self, name):
+        return self.sets[name]
+
+    @metrics.timed('rules.evaluate')
+    def evaluate(self, name, columns=None, **values):
+        """计算一个规则组，columns 与关键字参数合并为指标列"""
+        return self.sets[name].evaluate(dict(columns or {}, **values))
+
+    def scalar(self, name, **values):
+        """用标量指标计算一个规则组，返回Python数值（有 labels 时返回名称）"""
+        result = self.sets[name].evaluate(values).item()
+        rule_set = self.sets[name]
+        return rule_set.names[int(result)] if rule_set.names else result
+
+    def evaluate_all(self, columns, names=None):
+        """计算多个规则组（默认全部），跳过缺少指标列的规则组，返回 {规则组: 结果数组}"""
+        results = {}
+        for name in names or self.sets:
+            rule_set = self.sets[name]
+            if rule_set.columns <= set(columns):
+                results[name] = rule_set.evaluate(columns)
+        return results
+
+
+def _risk_override(spec, definitions):
+    """合并规则文件中的 risk_action：只允许修改 params，其余沿用内置规则"""
+    definitions = dict(definitions or {})
+    if spec is None:
+        return definitions
+    builtin = DEFAULT_RULES['risk_action']
+    for key in ('rules', 'labels', 'default'):
+        if key in spec and spec[key] != builtin[key]:
+            raise RuleError("risk_action 的规则不能自定义（预警、刷新频率和调仓都使用同样的阈值），"
+                            "请通过 params 修改阈值和减仓比例")
+    unknown = set(spec.get('params') or {}) - set(builtin['params'])
+    if unknown:
+        raise RuleError(f"risk_action 没有这些参数: {', '.join(sorted(unknown))}")
+    definitions['risk_action'] = dict(builtin, params=dict(builtin['params'], **(spec.get('params') or {})))
+    return definitions
+
+
+def load_rules(path=RULES_FILE):
+    """读取规则文件（.json，或安装了PyYAML时的 .yaml/.yml），与内置规则合并"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith(('.yaml', '.yml')):
+            if not HAS_YAML:
+                raise RuleError("读取YAML规则文件需要安装PyYAML")
+            definitions = yaml.safe_load(f)
+        else:
+            definitions = json.load(f)
+    return RuleBook(definitions)
+
+
+def panel_columns(close, high=None, volume=None):
+    """由 (日期 × 股票) 的收盘价、最高价、成交量面板算出规则可用的全部指标列
+
+    每列与输入形状相同，第 t 行只用到 t 及之前的数据。
+    """
+    close = np.asarray(close, dtype=np.float64)
+    high = close if high is None else np.asarray(high, dtype=np.float64)
+    macd, signal, hist = indicators.macd(close)
+    previous = np.vstack([np.full((1,) + close.shape[1:], np.nan), close[:-1]]) if close.ndim == 2 \
+        else np.r_[np.nan, close[:-1]]
+    high_20d = indicators.rolling_max(high, 20)
+    high_20d_prev = np.vstack([np.full((1,) + close.shape[1:], np.nan), high_20d[:-1]]) if close.ndim == 2 \
+        else np.r_[np.nan, high_20d[:-1]]
+    max_5d = indicators.rolling_max(close, 5)
+    min_5d = -indicators.rolling_max(-close, 5)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns = {
+            'close': close,
+            'high': high,
+            'count': np.cumsum(~np.isnan(close), axis=0),
+            'ma20': indicators.sma(close, 20),
+            'ma200': indicators.sma(close, 200),
+            'macd': macd,
+            'signal': signal,
+            'hist': hist,
+            'golden_cross': indicators.crossover(macd, signal),
+            'death_cross': indicators.crossunder(macd, signal),
+            'price_change': (close - previous) / previous * 100,
+            'high_20d_prev': high_20d_prev,
+            'breakout': close > high_20d_prev,
+            'range_5d': (max_5d - min_5d) / min_5d * 100,
+        }
+    if volume is not None:
+        volume = np.asarray(volume, dtype=np.float64)
+        avg_volume = indicators.rolling_mean(volume, 20)
+        columns['volume'] = volume
+        columns['avg_volume_20d'] = avg_volume
+        columns['high_volume'] = volume > avg_volume * 1.5
+    return columns
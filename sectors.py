@@ -0,0 +1,219 @@
+"""持仓的行业分类缓存和按行业汇总
+
+分类表按股票保存 (行业, 细分行业)，数据来自 MetadataCache 中的 sector/industry
+字段或本地CSV/JSON文件。分类几乎不会变化，写入后一直有效（不按有效期刷新），
+只有表中没有的股票才需要请求数据源；数据源也没有分类的股票记为"未分类"，
+不会反复请求。
+
+汇总时把股票映射为整数编号，用 np.bincount 一次算出所有行业的市值、成本、
+盈亏和仓位，数千只持仓也只需几毫秒。
+
+分类表保存在 cache/classification.json。
+"""
+import os
+import csv
+import json
+import threading
+import numpy as np
+import pandas as pd
+from metrics import metrics
+from rebalance import MAX_SECTOR
+
+CLASSIFICATION_FILE = os.path.join('cache', 'classification.json')
+
+UNCLASSIFIED = '未分类'
+
+# 汇总层级对应的分类字段下标
+LEVELS = {'sector': 0, 'industry': 1}
+
+EXPOSURE_COLUMNS = ('count', 'value', 'cost', 'pnl', 'pnl_percent', 'weight')
+
+
+def _clean(value):
+    """空值记为未分类"""
+    value = str(value).strip() if value is not None else ''
+    return value if value and value.lower() != 'nan' else UNCLASSIFIED
+
+
+class Classification:
+    """股票行业分类表 {股票: [行业, 细分行业]}"""
+
+    def __init__(self, path=CLASSIFICATION_FILE):
+        self.path = path
+        self.entries = {}
+        self.version = 0            # 分类变化时递增，用于缓存编号
+        self._codes = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error loading classification: {e}")
+
+    def save(self):
+        """有未保存的修改时写入临时文件后原子替换"""
+        with self._lock:
+            if not self._dirty or not self.path:
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    def store(self, rows):
+        """写入 {股票: (行业, 细分行业)}，返回实际变化的股票数"""
+        changed = 0
+        with self._lock:
+            for ticker, (sector, industry) in rows.items():
+                entry = [_clean(sector), _clean(industry)]
+                if self.entries.get(ticker) != entry:
+                    self.entries[ticker] = entry
+                    changed += 1
+            if changed:
+                self._dirty = True
+                self.version += 1
+                self._codes.clear()
+        return changed
+
+    def missing(self, tickers):
+        """分类表中没有的股票"""
+        return [ticker for ticker in dict.fromkeys(tickers) if ticker not in self.entries]
+
+    def get(self, ticker):
+        """(行业, 细分行业)，没有分类时均为"未分类"""
+        return tuple(self.entries.get(ticker, (UNCLASSIFIED, UNCLASSIFIED)))
+
+    @metrics.timed('classification.fill')
+    def fill(self, metadata, tickers):
+        """用股票信息缓存补齐分类表中没有的股票（并行请求），返回补齐的股票数"""
+        missing = self.missing(tickers)
+        if not missing:
+            return 0
+        fields = ('sector', 'industry')
+        metadata.warm(missing, fields=fields)
+        rows = {}
+        for ticker in missing:
+            try:
+                info = metadata.get(ticker, fields, save=False)
+            except Exception as e:
+                print(f"Error fetching classification for {ticker}: {e}")
+                continue
+            rows[ticker] = (info['sector'], info['industry'])
+        self.store(rows)
+        self.save()
+        return len(rows)
+
+    def load_file(self, path):
+        """从文件导入分类，返回写入的股票数
+
+        支持带 ticker、sector、industry 列的CSV，或 {股票: {"sector": ..., "industry": ...}}
+        格式的JSON。文件中的分类覆盖已有的分类。
+        """
+        if path.lower().endswith('.csv'):
+            with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+                rows = {row['ticker'].strip().upper(): (row.get('sector'), row.get('industry'))
+                        for row in csv.DictReader(f) if row.get('ticker')}
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                rows = {ticker: (values.get('sector'), values.get('industry'))
+                        for ticker, values in json.load(f).items()}
+        self.store(rows)
+        self.save()
+        return len(rows)
+
+    def codes(self, tickers, level='sector'):
+        """把股票映射为分组编号，返回 (分组名称数组, 编号数组)
+
+        同一组股票、同一版本的分类只计算一次。
+        """
+        tickers = tuple(tickers)
+        cached = self._codes.get(level)
+        if cached is not None and cached[0] == self.version and cached[1] == tickers:
+            return cached[2], cached[3]
+        index = LEVELS[level]
+        labels = np.array([self.entries.get(ticker, (UNCLASSIFIED, UNCLASSIFIED))[index] for ticker in tickers],
+                          dtype=object)
+        if len(labels):
+            names, codes = np.unique(labels.astype(str), return_inverse=True)
+        else:
+            names, codes = np.empty(0, dtype=str), np.empty(0, dtype=int)
+        # 每个层级只保留最近一组股票的编号，持仓变化后旧的编号不再有用
+        self._codes[level] = (self.version, tickers, names, codes)
+        return names, codes
+
+
+def group_totals(codes, count, **columns):
+    """按分组编号对各列求和，返回 {列名: 长度为 count 的数组}，另含每组股票数 count"""
+    codes = np.asarray(codes, dtype=int)
+    totals = {'count': np.bincount(codes, minlength=count)}
+    for name, values in columns.items():
+        totals[name] = np.bincount(codes, weights=np.asarray(values, dtype=float), minlength=count)
+    return totals
+
+
+def exposure(names, codes, values, costs, total_value=None):
+    """各分组的持仓数、市值、成本、盈亏、盈亏比例和仓位（占总资产百分比）
+
+    返回按市值从大到小排列的 DataFrame，索引为分组名称。未提供 total_value 时
+    仓位按持仓总市值计算。
+    """
+    totals = group_totals(codes, len(names), value=values, cost=costs)
+    base = total_value if total_value else totals['value'].sum()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pnl = totals['value'] - totals['cost']
+        frame = pd.DataFrame({
+            'count': totals['count'],
+            'value': totals['value'],
+            'cost': totals['cost'],
+            'pnl': pnl,
+            'pnl_percent': np.where(totals['cost'] > 0, pnl / totals['cost'] * 100, 0.0),
+            'weight': totals['value'] / base * 100 if base else np.zeros(len(names)),
+        }, index=pd.Index(names, name='group'))
+    return frame[frame['count'] > 0].sort_values('value', ascending=False)
+
+
+def over_limit(weights, limit=MAX_SECTOR, limits=None):
+    """仓位超过上限的分组 {名称: 仓位}，"未分类"不参与检查
+
+    weights 为 {名称: 仓位} 或以名称为索引的 Series，limits 可以为个别分组单独设置上限。
+    """
+    limits = limits or {}
+    return {name: float(weight) for name, weight in dict(weights).items()
+            if name != UNCLASSIFIED and weight > limits.get(name, limit)}
+
+
+@metrics.timed('classification.rollup')
+def rollup(classification, tickers, values, costs, total_value=None):
+    """行业 → 细分行业两级汇总
+
+    返回 DataFrame，索引为 (行业, 细分行业) 的 MultiIndex，细分行业为空字符串
+    的行是整个行业的合计。行业按市值从大到小排列，行业内的细分行业也按市值排列。
+    """
+    tickers = list(tickers)
+    values = np.asarray(values, dtype=float)
+    costs = np.asarray(costs, dtype=float)
+    sector_names, sector_codes = classification.codes(tickers, 'sector')
+    industry_names, industry_codes = classification.codes(tickers, 'industry')
+    sectors = exposure(sector_names, sector_codes, values, costs, total_value)
+    # 细分行业可能出现在多个行业中，按 (行业, 细分行业) 组合编号
+    pair_codes = sector_codes * max(len(industry_names), 1) + industry_codes
+    pair_names, pair_index = np.unique(pair_codes, return_inverse=True)
+    industries = exposure(pair_names, pair_index, values, costs, total_value)
+    pairs = industries.index.to_numpy()
+    industries.index = pd.MultiIndex.from_arrays([
+        sector_names[pairs // max(len(industry_names), 1)],
+        industry_names[pairs % max(len(industry_names), 1)],
+    ], names=['sector', 'industry'])
+
+    sectors.index = pd.MultiIndex.from_arrays([sectors.index, np.full(len(sectors), '', dtype=object)],
+                                              names=['sector', 'industry'])
+    table = pd.concat([sectors, industries])
+    # 按行业的市值排名排序，行业合计在前，行业内按市值从大到小
+    rank = pd.Series(np.arange(len(sectors)), index=sectors.index.get_level_values('sector'))
+    order = np.lexsort((-table['value'].to_numpy(), table.index.get_level_values('industry') != '',
+                        rank.reindex(table.index.get_level_values('sector')).to_numpy()))
+    return table.iloc[order]
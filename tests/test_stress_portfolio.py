@@ -0,0 +1,30 @@
+"""投资组合写线程的并发测试（小规模运行 benchmarks/stress_portfolio.py 的检查）"""
+import os
+import sys
+import json
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import stress_portfolio
+from synthetic import make_portfolio
+
+
+def test_concurrent_writers_keep_snapshots_consistent(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    errors, reads = stress_portfolio.run(str(tmp_path), threads=4, readers=2, iterations=20, size=10)
+    assert errors == []
+    assert reads > 0
+
+
+def test_check_saved_reports_mismatched_stock_field():
+    portfolio = make_portfolio(3, cash=1000)
+    saved = json.loads(json.dumps(portfolio))
+    stress_portfolio.check_saved(portfolio, saved)
+    saved['stocks'][1]['avg_price'] += 1
+    with pytest.raises(AssertionError, match='avg_price'):
+        stress_portfolio.check_saved(portfolio, saved)
@@ -1,24 +1,34 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
 # matplotlib相关导入
 import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import threading
-import time
+import os
 import pandas as pd
 import numpy as np
 from processor import StockProcessor
+from jobs import JobScheduler, HIGH, LOW
+import refresh
+import indicators
+from metrics import metrics, LogExporter, JsonLinesExporter, PrometheusExporter
 
 class StockPortfolioApp:
-    def __init__(self, root):
+    def __init__(self, root, processor=None):
         self.root = root
         self.root.title("美股仓位管理系统")
         self.root.geometry("1200x800")
         self.root.minsize(1000, 700)
         
         # 初始化处理器
-        self.processor = StockProcessor()
+        self.processor = processor or StockProcessor()
+        
+        # 后台任务调度器，回调通过 root.after 回到主线程执行
+        self.jobs = JobScheduler(dispatch=lambda callback: self.root.after(0, callback))
+        
+        # 批量导入后尚未补齐数据的股票 -> 状态文字，以及股票代码 -> 列表行
+        self.enrich_status = {}
+        self.tree_items = {}
         
         # 创建主框架
         self.create_main_frame()
@@ -29,11 +39,15 @@ class StockPortfolioApp:
         # 加载股票数据
         self.load_stocks()
         
-        # 自动更新线程
-        self.update_thread = None
-        self.stop_thread = False
+        # 自动更新定时器
+        self.auto_update_id = None
+        self.auto_updating = False
         
     def create_main_frame(self):
+        # 底部状态栏显示后台任务
+        self.status_var = tk.StringVar(value="就绪")
+        ttk.Label(self.root, textvariable=self.status_var, anchor=tk.W, relief=tk.SUNKEN).pack(side=tk.BOTTOM, fill=tk.X)
+        
         # 创建左侧和右侧框架
         self.paned_window = ttk.PanedWindow(self.root, orient=tk.HORIZONTAL)
         self.paned_window.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -60,6 +74,16 @@ class StockPortfolioApp:
         self.chart_frame = tk.LabelFrame(self.right_frame, text="Stock Chart", bg="#f0f0f0", font=("Arial", 12, "bold"))
         self.chart_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
+        # K线周期选择
+        interval_frame = tk.Frame(self.chart_frame, bg="#f0f0f0")
+        interval_frame.pack(fill=tk.X, padx=5)
+        tk.Label(interval_frame, text="周期:", bg="#f0f0f0").pack(side=tk.LEFT)
+        self.interval_var = tk.StringVar(value="1d")
+        interval_box = ttk.Combobox(interval_frame, textvariable=self.interval_var, width=5, state="readonly",
+                                    values=("1d", "1h", "15m", "5m", "1m"))
+        interval_box.pack(side=tk.LEFT, padx=5)
+        interval_box.bind("<<ComboboxSelected>>", lambda event: self.update_chart(self.ticker_label.cget("text")))
+        
         # Create figure for matplotlib
         self.figure = plt.Figure(figsize=(6, 4), dpi=100)
         self.ax = self.figure.add_subplot(111)
@@ -68,16 +92,60 @@ class StockPortfolioApp:
         self.canvas = FigureCanvasTkAgg(self.figure, self.chart_frame)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
+        # 滚轮缩放图表
+        self.chart_range = None
+        self.chart_ideal_position = 0
+        self.canvas.mpl_connect('scroll_event', self.on_chart_scroll)
+        
         # Initial chart message
         self.ax.text(0.5, 0.5, "Select a stock to view chart", ha="center", va="center", fontsize=12)
         self.ax.set_xticks([])
         self.ax.set_yticks([])
         self.canvas.draw()
 
-    def update_chart(self, ticker):
-        """更新股票图表"""
-        if not ticker:
+    def update_chart(self, ticker, refresh=True):
+        """更新股票图表，refresh=False 时使用已缓存的图表数据（缩放时）
+        
+        需要获取K线时在后台加载，加载完成后在主线程中绘制。
+        """
+        if not ticker or ticker == "-":
+            return
+        if not refresh:
+            self.draw_chart(ticker)
             return
+        interval = self.interval_var.get()
+        self.chart_range = None
+        
+        def done(ideal_position):
+            # 加载期间用户可能已切换到其他股票或周期
+            if self.ticker_label.cget("text") != ticker or self.interval_var.get() != interval:
+                return
+            self.chart_ideal_position = ideal_position
+            self.draw_chart(ticker)
+        
+        self.run_job(f"加载 {ticker} 图表", self.load_chart_data, ticker, interval,
+                     priority=HIGH, key=('chart', ticker, interval), on_result=done)
+        
+    def load_chart_data(self, ticker, interval):
+        """获取图表数据并计算理想持仓（在后台线程中执行）"""
+        if interval == "1d":
+            series = self.processor.get_chart_series(ticker)
+        else:
+            series = self.processor.get_chart_series(ticker, period='5d', interval=interval)
+        if series is None:
+            return 0
+        # 计算理想持仓（与调仓订单使用相同的目标仓位规则）
+        try:
+            if interval == "1d":
+                return self.processor.target_shares(ticker, series.lines['close'])
+            return self.processor.target_shares(ticker, indicators.column(self.processor.get_stock_data(ticker), 'Close'))
+        except Exception:
+            return 0
+        
+    @metrics.timed('ui.update_chart')
+    def draw_chart(self, ticker):
+        """用已缓存的图表数据绘制图表"""
+        interval = self.interval_var.get()
         
         # 清除旧图表
         self.figure.clear()
@@ -87,86 +155,81 @@ class StockPortfolioApp:
         ax1 = self.figure.add_subplot(gs[0])
         ax2 = self.figure.add_subplot(gs[1])
         
-        # 获取历史数据
-        hist = self.processor.get_stock_data(ticker)
-        if hist.empty:
+        # 读取已加载的图表数据（带多级降采样缓存）
+        if interval == "1d":
+            series = self.processor.get_chart_series(ticker, refresh=False)
+        else:
+            series = self.processor.get_chart_series(ticker, period='5d', interval=interval, refresh=False)
+        if series is None:
             # 如果没有数据，显示提示信息
             self.ax.text(0.5, 0.5, "Unable to get stock data", ha="center", va="center", fontsize=12)
             self.canvas.draw()
             return
-            
-        dates = hist.index
+        
+        # 按画布宽度和缩放范围选择降采样级别
+        width = max(200, self.canvas.get_tk_widget().winfo_width())
+        start, end = self.chart_range if self.chart_range else (None, None)
+        view = series.view(width, start, end)
+        lines = view['lines']
+        bars = view['bars']
+        bar_dates = pd.DatetimeIndex(bars['ns']).tz_localize('UTC')
+        if series.index.tz is not None:
+            bar_dates = bar_dates.tz_convert(series.index.tz)
         
         # 绘制K线图
         from mplfinance.original_flavor import candlestick_ohlc
         import matplotlib.dates as mdates
 
-        hist['Date_Num'] = mdates.date2num(hist.index.to_pydatetime())
-        ohlc = hist[['Date_Num', 'Open', 'High', 'Low', 'Close']].values
+        ohlc = np.column_stack([mdates.date2num(bar_dates.to_pydatetime()),
+                                bars['open'], bars['high'], bars['low'], bars['close']])
 
-        candlestick_ohlc(ax1, ohlc, width=0.6,
+        # K线宽度按每根K线代表的时间换算为天
+        bar_width = 0.6 * view['bar_seconds'] / 86400
+        candlestick_ohlc(ax1, ohlc, width=bar_width,
                         colorup='#4CAF50', colordown='#F44336',
                         alpha=1.0)
 
-        ax1.plot(dates, hist['Close'].rolling(window=20).mean(), label='20-day MA', color='#FFA726', linestyle='--')
+        close = series.lines['close']
+        ax1.plot(*lines['ma20'], label='20-day MA', color='#FFA726', linestyle='--')
         ax1.set_title(f"{ticker} Price Trend", pad=15)
         ax1.set_ylabel("Price (USD)")
         ax1.legend(loc='upper left', framealpha=0.8)
         ax1.grid(True, alpha=0.3)
         
-        # 计算并绘制MACD
-        exp1 = hist['Close'].ewm(span=12, adjust=False).mean()
-        exp2 = hist['Close'].ewm(span=26, adjust=False).mean()
-        macd = exp1 - exp2
-        signal = macd.ewm(span=9, adjust=False).mean()
-        hist_macd = macd - signal
-        
-        # 简化MACD直方图绘制逻辑，使用numpy的where函数和颜色掩码替代复杂的列表推导式
+        # 绘制MACD（直方图按K线同样的粒度聚合）
         try:
-            # 转换为numpy数组
-            hist_macd_values = hist_macd.values if isinstance(hist_macd, pd.Series) else hist_macd
-            
-            # 确保长度一致
-            min_length = min(len(dates), len(hist_macd_values))
-            plot_dates = dates[:min_length]
-            plot_values = hist_macd_values[:min_length]
-            
-            # 使用颜色掩码绘制
-            colors = np.where(plot_values >= 0, '#4CAF50', '#F44336')
-            ax2.bar(plot_dates, plot_values, color=colors, alpha=0.7, width=1)
+            colors = np.where(bars['hist'] >= 0, '#4CAF50', '#F44336')
+            ax2.bar(bar_dates, bars['hist'], color=colors, alpha=0.7, width=bar_width / 0.6)
         except Exception as e:
             print(f"Error plotting MACD histogram: {e}")
         
-        ax2.plot(dates, macd, label='MACD', color='#2196F3', linewidth=1.5)
-        ax2.plot(dates, signal, label='Signal', color='#FF9800', linewidth=1.5)
+        ax2.plot(*lines['macd'], label='MACD', color='#2196F3', linewidth=1.5)
+        ax2.plot(*lines['signal'], label='Signal', color='#FF9800', linewidth=1.5)
         ax2.axhline(y=0, color='black', linestyle='-', alpha=0.2)
         ax2.set_xlabel("Date")
         ax2.set_ylabel("MACD")
         ax2.legend(loc='upper left', framealpha=0.8)
         ax2.grid(True, alpha=0.3)
         
-        ax1.xaxis.set_major_formatter(plt.matplotlib.dates.DateFormatter('%Y-%m-%d'))
-        ax2.xaxis.set_major_formatter(plt.matplotlib.dates.DateFormatter('%Y-%m-%d'))
+        date_format = '%Y-%m-%d' if interval == "1d" else '%m-%d %H:%M'
+        ax1.xaxis.set_major_formatter(plt.matplotlib.dates.DateFormatter(date_format))
+        ax2.xaxis.set_major_formatter(plt.matplotlib.dates.DateFormatter(date_format))
         self.figure.autofmt_xdate()
         
         # 获取当前价格和持仓信息
         try:
-            current_price = hist['Close'].iloc[-1]
+            current_price = close[-1]
             position = 0
             ideal_position = 0
             
             # 查找当前持仓
-            for stock in self.processor.portfolio['stocks']:
+            for stock in self.processor.snapshot()['stocks']:
                 if stock['ticker'] == ticker:
                     position = stock['shares']
                     break
                     
-            # 计算理想持仓（如果processor有相关方法）
-            try:
-                ideal_position = round(self.processor.calculate_kelly_position(ticker) * 
-                                      self.processor.portfolio['total_value'] / 100.0 / current_price)
-            except:
-                ideal_position = 0
+            # 理想持仓在加载图表数据时已计算
+            ideal_position = self.chart_ideal_position
             
             info_text = f"Current: {position} shares\nIdeal: {ideal_position} shares\nPrice: USD{current_price:.2f}"
             ax1.text(0.02, 0.02, info_text, transform=ax1.transAxes, bbox=dict(facecolor='white', alpha=0.7))
@@ -186,6 +249,30 @@ class StockPortfolioApp:
         self.chart_frame.update_idletasks()
         self.canvas.draw()
         
+    def on_chart_scroll(self, event):
+        """鼠标滚轮以指针位置为中心放大或缩小图表的时间范围"""
+        ticker = self.ticker_label.cget("text")
+        if event.xdata is None or not ticker or ticker == "-":
+            return
+        interval = self.interval_var.get()
+        period = '1y' if interval == "1d" else '5d'
+        series = self.processor.get_chart_series(ticker, period=period, interval=interval, refresh=False)
+        if series is None or len(series) < 2:
+            return
+        
+        import matplotlib.dates as mdates
+        center = pd.Timestamp(mdates.num2date(event.xdata)).value
+        first, last = series.ns[0], series.ns[-1]
+        start, end = (pd.Timestamp(t).value for t in self.chart_range) if self.chart_range else (first, last)
+        factor = 0.5 if event.button == 'up' else 2.0
+        start = max(first, int(center - (center - start) * factor))
+        end = min(last, int(center + (end - center) * factor))
+        if start <= first and end >= last:
+            self.chart_range = None
+        elif end - start > 0:
+            self.chart_range = (pd.Timestamp(start, tz='UTC'), pd.Timestamp(end, tz='UTC'))
+        self.update_chart(ticker, refresh=False)
+        
     def create_menu(self):
         menubar = tk.Menu(self.root)
         self.root.config(menu=menubar)
@@ -194,7 +281,10 @@ class StockPortfolioApp:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="文件", menu=file_menu)
         file_menu.add_command(label="添加股票", command=self.add_stock)
+        file_menu.add_command(label="从CSV导入持仓", command=self.import_csv)
         file_menu.add_command(label="更新所有股票价格", command=self.update_all_stocks)
+        file_menu.add_command(label="查看交易流水", command=self.show_trades)
+        file_menu.add_command(label="查看组合净值走势", command=self.show_equity_chart)
         file_menu.add_separator()
         file_menu.add_command(label="退出", command=self.root.quit)
         
@@ -202,7 +292,18 @@ class StockPortfolioApp:
         tools_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="工具", menu=tools_menu)
         tools_menu.add_command(label="开始自动更新", command=self.start_auto_update)
+        tools_menu.add_command(label="取消全部后台任务", command=self.cancel_jobs)
         tools_menu.add_command(label="停止自动更新", command=self.stop_auto_update)
+        tools_menu.add_command(label="生成调仓订单", command=self.show_rebalance_orders)
+        tools_menu.add_command(label="组合风险与压力测试", command=self.show_portfolio_risk)
+        tools_menu.add_command(label="持仓相关性热力图", command=self.show_correlation)
+        tools_menu.add_command(label="按规则评估全部持仓", command=self.show_rule_results)
+        tools_menu.add_command(label="行业分布与盈亏汇总", command=self.show_sector_rollup)
+        tools_menu.add_command(label="从文件导入行业分类", command=self.import_classification)
+        tools_menu.add_command(label="从文件预热股票信息", command=self.warm_metadata)
+        tools_menu.add_separator()
+        tools_menu.add_command(label="开启/关闭性能监控", command=self.toggle_metrics)
+        tools_menu.add_command(label="查看性能统计", command=self.show_metrics)
         
         # 帮助菜单
         help_menu = tk.Menu(menubar, tearoff=0)
@@ -343,33 +444,47 @@ class StockPortfolioApp:
             self.stock_tree.delete(item)
         
         # 更新现金和总价值
-        self.cash_label.config(text=f"${self.processor.portfolio['cash']:.2f}")
-        self.total_value_label.config(text=f"${self.processor.portfolio['total_value']:.2f}")
+        self.cash_label.config(text=f"${self.processor.snapshot()['cash']:.2f}")
+        self.total_value_label.config(text=f"${self.processor.snapshot()['total_value']:.2f}")
+        
+        # 批量检测风险信号，触发的股票高亮显示
+        alert_tickers = {alert['ticker'] for alert in self.processor.check_all_risk_controls()}
         
         # 添加股票到列表
-        for stock in self.processor.portfolio['stocks']:
-            values = (
-                stock['ticker'],
-                f"${stock['current_price']:.2f}",
-                stock['shares'],
-                f"${stock['value']:.2f}",
-                f"{stock['profit_loss_percent']:.2f}%",
-                f"{stock['daily_change']:.2f}%",
-                stock['sentiment']
-            )
-            
-            # 设置颜色
-            tags = ()
-            if stock['profit_loss_percent'] > 0:
-                tags = ("profit",)
-            elif stock['profit_loss_percent'] < 0:
-                tags = ("loss",)
-                
-            self.stock_tree.insert("", tk.END, values=values, tags=tags)
+        self.tree_items = {}
+        for stock in self.processor.snapshot()['stocks']:
+            values, tags = self.stock_row(stock, alert_tickers)
+            self.tree_items[stock['ticker']] = self.stock_tree.insert("", tk.END, values=values, tags=tags)
         
         # 设置颜色
         self.stock_tree.tag_configure("profit", foreground="green")
         self.stock_tree.tag_configure("loss", foreground="red")
+        self.stock_tree.tag_configure("alert", background="#FFF3CD")
+        self.stock_tree.tag_configure("pending", foreground="gray")
+        
+    def stock_row(self, stock, alert_tickers=()):
+        """股票列表中一行的内容和颜色标签"""
+        values = (
+            stock['ticker'],
+            f"${stock['current_price']:.2f}",
+            stock['shares'],
+            f"${stock['value']:.2f}",
+            f"{stock['profit_loss_percent']:.2f}%",
+            f"{stock['daily_change']:.2f}%",
+            self.enrich_status.get(stock['ticker'], stock['sentiment'])
+        )
+        
+        # 设置颜色
+        tags = ()
+        if stock['ticker'] in self.enrich_status:
+            tags = ("pending",)
+        elif stock['profit_loss_percent'] > 0:
+            tags = ("profit",)
+        elif stock['profit_loss_percent'] < 0:
+            tags = ("loss",)
+        if stock['ticker'] in alert_tickers:
+            tags += ("alert",)
+        return values, tags
         
     def on_stock_select(self, event):
         # 获取选中的项目
@@ -383,7 +498,7 @@ class StockPortfolioApp:
         
         # 查找股票数据
         selected_stock = None
-        for stock in self.processor.portfolio['stocks']:
+        for stock in self.processor.snapshot()['stocks']:
             if stock['ticker'] == ticker:
                 selected_stock = stock
                 break
@@ -487,20 +602,94 @@ class StockPortfolioApp:
                     messagebox.showerror("错误", "请输入有效的股票信息")
                     return
                     
-                # 添加股票（不传递情绪参数，由系统自动判断）
-                success = self.processor.add_stock(ticker, shares, price)
+            except ValueError:
+                messagebox.showerror("错误", "请输入有效的数字")
+                return
+            
+            def done(success):
                 if success:
                     messagebox.showinfo("成功", f"已添加股票 {ticker}")
-                    add_window.destroy()
                     self.load_stocks()  # 刷新列表
                 else:
                     messagebox.showerror("错误", "添加股票失败")
-            except ValueError:
-                messagebox.showerror("错误", "请输入有效的数字")
+            
+            # 添加股票（不传递情绪参数，由系统自动判断），获取报价和判断情绪在后台完成
+            add_window.destroy()
+            self.run_job(f"添加 {ticker}", self.processor.add_stock, ticker, shares, price,
+                         priority=HIGH, key=('add', ticker), on_result=done)
         
         ttk.Button(add_window, text="添加", command=on_add).grid(row=3, column=0, padx=10, pady=20)
         ttk.Button(add_window, text="取消", command=add_window.destroy).grid(row=3, column=1, padx=10, pady=20)
         
+    def import_csv(self):
+        """从券商导出的CSV批量导入持仓，报价和市场情绪在后台补齐"""
+        path = filedialog.askopenfilename(title="选择持仓CSV文件",
+                                          filetypes=[("CSV", "*.csv"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            tickers, rejected = self.processor.import_positions(path)
+        except Exception as e:
+            messagebox.showerror("错误", f"导入失败: {e}")
+            return
+        
+        message = f"已导入 {len(tickers)} 只股票"
+        if len(rejected):
+            lines = [f"第{row.row}行 {row.ticker}: {row.reason}" for row in rejected.head(10).itertuples()]
+            message += f"，{len(rejected)} 行被跳过:\n" + "\n".join(lines)
+            if len(rejected) > 10:
+                message += "\n..."
+        if not tickers:
+            messagebox.showwarning("导入结果", message)
+            return
+        
+        # 列表中先显示等待状态，后台每补齐一只股票刷新对应的行
+        for ticker in tickers:
+            self.enrich_status[ticker] = "等待更新..."
+        self.load_stocks()
+        self.stock_tree.heading("情绪", text=f"情绪 (0/{len(tickers)})")
+        
+        def stop_waiting():
+            # 取消或出错后，未补齐的股票不再显示等待状态
+            for ticker in tickers:
+                if self.enrich_status.get(ticker) == "等待更新...":
+                    self.enrich_status.pop(ticker)
+            self.stock_tree.heading("情绪", text="情绪")
+            self.load_stocks()
+        
+        def work(job):
+            def progress(ticker, ok, done, total):
+                job.report(done, total, ticker)
+                self.root.after(0, lambda: self.on_enrich_progress(ticker, ok, done, total))
+            count = self.processor.enrich_positions(tickers, progress=progress, cancelled=lambda: job.cancelled)
+            if job.cancelled:
+                self.root.after(0, stop_waiting)
+            return count
+        
+        def failed(error):
+            stop_waiting()
+            messagebox.showerror("错误", f"补齐导入的持仓失败: {error}")
+        
+        # 每次导入的股票不同，不按 key 合并
+        self.run_job("补齐导入的持仓", work, pass_job=True, on_error=failed)
+        messagebox.showinfo("导入结果", message + "\n报价和市场情绪正在后台更新")
+        
+    def on_enrich_progress(self, ticker, ok, done, total):
+        """后台补齐一只股票后更新列表中的对应行和进度（在主线程中执行）"""
+        if ok:
+            self.enrich_status.pop(ticker, None)
+        else:
+            self.enrich_status[ticker] = "更新失败"
+        self.stock_tree.heading("情绪", text=f"情绪 ({done}/{total})" if done < total else "情绪")
+        if done == total:
+            self.load_stocks()
+            return
+        stock = self.processor._find_stock(ticker)
+        item = self.tree_items.get(ticker)
+        if stock is not None and item is not None and self.stock_tree.exists(item):
+            values, tags = self.stock_row(stock)
+            self.stock_tree.item(item, values=values, tags=tags)
+        
     def update_selected_stock(self):
         # 获取选中的项目
         selection = self.stock_tree.selection()
@@ -512,33 +701,92 @@ class StockPortfolioApp:
         item = self.stock_tree.item(selection[0])
         ticker = item['values'][0]
         
-        # 更新股票价格
-        self.processor.update_stock_prices()
+        def work():
+            # 更新股票价格
+            self.processor.update_stock_prices()
+            
+            # 自动更新市场情绪
+            self.processor.update_sentiment(ticker)
         
-        # 自动更新市场情绪
-        self.processor.update_sentiment(ticker)
+        self.run_job(f"更新 {ticker}", work, priority=HIGH, key=('update', ticker),
+                     on_result=lambda _: self.reload_and_select(ticker))
         
+    def reload_and_select(self, ticker):
+        """刷新列表并重新选择该股票"""
         self.load_stocks()
-        
-        # 重新选择该股票
-        for item in self.stock_tree.get_children():
-            values = self.stock_tree.item(item, 'values')
-            if values[0] == ticker:
-                self.stock_tree.selection_set(item)
-                self.stock_tree.focus(item)
-                self.on_stock_select(None)
-                break
+        item = self.tree_items.get(ticker)
+        if item is not None:
+            self.stock_tree.selection_set(item)
+            self.stock_tree.focus(item)
+            self.on_stock_select(None)
                 
     def update_all_stocks(self):
-        # 更新所有股票价格
-        self.processor.update_stock_prices()
-        
-        # 自动更新所有股票的市场情绪
-        for stock in self.processor.portfolio['stocks']:
-            self.processor.update_sentiment(stock['ticker'])
+        def work(job):
+            # 更新所有股票价格
+            job.report(0, 2, "更新股价")
+            self.processor.update_stock_prices()
             
-        self.load_stocks()
-        messagebox.showinfo("成功", "已更新所有股票价格和市场情绪")
+            # 自动更新所有股票的市场情绪（没有新日线的股票沿用上次的判断）
+            job.report(1, 2, "更新市场情绪")
+            self.processor.refresh_sentiments()
+            
+            # 把新日线递推进相关性矩阵，检查高度相关股票组的合计仓位
+            self.processor.update_covariance()
+        
+        def done(_):
+            self.load_stocks()
+            messagebox.showinfo("成功", "已更新所有股票价格和市场情绪")
+        
+        self.run_job("更新所有股票", work, key='update_all', pass_job=True, on_result=done)
+        
+    def run_job(self, message, func, *args, on_result=None, on_error=None, **kwargs):
+        """在后台执行耗时操作：状态栏显示进度，结果和错误在主线程中处理
+        
+        没有指定 on_error 时出错弹窗提示。其余关键字参数（priority、key、pass_job 等）传给 JobScheduler.submit。
+        """
+        def finish(result):
+            self.update_status(exclude=job)
+            if on_result is not None:
+                on_result(result)
+        
+        def fail(error):
+            self.update_status(exclude=job)
+            if on_error is not None:
+                on_error(error)
+            else:
+                messagebox.showerror("错误", f"{message}失败: {error}")
+        
+        def progress(done, total, text):
+            self.status_var.set(f"{message}: {text or ''} ({done}/{total})" if total else f"{message}: {text or done}")
+        
+        job = self.jobs.submit(func, *args, name=message, on_result=finish, on_error=fail,
+                               on_progress=progress, **kwargs)
+        self.update_status()
+        return job
+        
+    def cancel_jobs(self):
+        """取消排队和运行中的后台任务（运行中的任务在下一个检查点结束）"""
+        self.jobs.cancel_all()
+        self.update_status()
+        # 还没开始补齐的导入持仓不再显示等待状态
+        waiting = [ticker for ticker, status in self.enrich_status.items() if status == "等待更新..."]
+        if waiting:
+            for ticker in waiting:
+                del self.enrich_status[ticker]
+            self.stock_tree.heading("情绪", text="情绪")
+            self.load_stocks()
+        
+    def update_status(self, exclude=None):
+        """在状态栏显示正在运行和排队的后台任务"""
+        names = [job.name for job in self.jobs.running() if job is not exclude]
+        pending = self.jobs.pending()
+        if not names and not pending:
+            self.status_var.set("就绪")
+            return
+        text = "正在" + "、".join(names) + "..." if names else "等待中"
+        if pending:
+            text += f"（另有 {pending} 个任务排队）"
+        self.status_var.set(text)
         
     # 移除了update_sentiment方法，因为情绪现在是自动判断的
                 
@@ -553,26 +801,19 @@ class StockPortfolioApp:
         item = self.stock_tree.item(selection[0])
         ticker = item['values'][0]
         
-        # 计算仓位建议
-        advice = self.processor.generate_position_advice(ticker)
-        
-        # 更新建议文本
-        self.advice_text.config(state=tk.NORMAL)
-        self.advice_text.delete(1.0, tk.END)
-        self.advice_text.insert(tk.END, advice)
-        self.advice_text.config(state=tk.DISABLED)
-        
-        # 刷新列表
-        self.load_stocks()
+        def done(advice):
+            # 刷新列表并重新选择该股票（建议文本已写入持仓，选择时会显示）
+            self.reload_and_select(ticker)
+            
+            # 更新建议文本
+            self.advice_text.config(state=tk.NORMAL)
+            self.advice_text.delete(1.0, tk.END)
+            self.advice_text.insert(tk.END, advice)
+            self.advice_text.config(state=tk.DISABLED)
         
-        # 重新选择该股票
-        for item in self.stock_tree.get_children():
-            values = self.stock_tree.item(item, 'values')
-            if values[0] == ticker:
-                self.stock_tree.selection_set(item)
-                self.stock_tree.focus(item)
-                self.on_stock_select(None)
-                break
+        # 计算仓位建议
+        self.run_job(f"计算 {ticker} 仓位建议", self.processor.generate_position_advice, ticker,
+                     priority=HIGH, key=('advice', ticker), on_result=done)
                 
     def show_context_menu(self, event):
         # 获取点击的项目
@@ -604,7 +845,7 @@ class StockPortfolioApp:
     def edit_shares(self, ticker):
         # 查找股票数据
         selected_stock = None
-        for stock in self.processor.portfolio['stocks']:
+        for stock in self.processor.snapshot()['stocks']:
             if stock['ticker'] == ticker:
                 selected_stock = stock
                 break
@@ -645,7 +886,7 @@ class StockPortfolioApp:
     def edit_avg_price(self, ticker):
         # 查找股票数据
         selected_stock = None
-        for stock in self.processor.portfolio['stocks']:
+        for stock in self.processor.snapshot()['stocks']:
             if stock['ticker'] == ticker:
                 selected_stock = stock
                 break
@@ -684,42 +925,65 @@ class StockPortfolioApp:
             
     def start_auto_update(self):
         # 检查是否已经在运行
-        if self.update_thread and self.update_thread.is_alive():
+        if self.auto_updating:
             messagebox.showinfo("提示", "自动更新已经在运行")
             return
             
-        # 重置停止标志
-        self.stop_thread = False
-        
-        # 创建并启动线程
-        self.update_thread = threading.Thread(target=self.auto_update_task)
-        self.update_thread.daemon = True
-        self.update_thread.start()
-        
-        messagebox.showinfo("成功", "已启动自动更新 (每5分钟更新一次)")
+        self.auto_updating = True
+        self.auto_update_task()
+        messagebox.showinfo("成功", "已启动自动更新 (接近止损/止盈/熔断价的股票每几秒刷新，其余股票和休市期间很少刷新)")
         
     def stop_auto_update(self):
-        # 设置停止标志
-        self.stop_thread = True
+        # 取消定时器，已排队的自动更新任务一并取消
+        self.auto_updating = False
+        if self.auto_update_id is not None:
+            self.root.after_cancel(self.auto_update_id)
+            self.auto_update_id = None
+        self.jobs.cancel_key('auto_update')
         messagebox.showinfo("成功", "已停止自动更新")
         
     def auto_update_task(self):
-        while not self.stop_thread:
-            # 更新所有股票价格
-            self.processor.update_stock_prices()
-            
-            # 在主线程中更新UI
-            self.root.after(0, self.load_stocks)
-            
-            # 等待5分钟
-            for _ in range(300):  # 5分钟 = 300秒
-                if self.stop_thread:
-                    break
-                time.sleep(1)
+        """提交一次后台价格更新（低优先级），只刷新间隔已到期的股票
+        
+        每只股票的刷新间隔由 processor.refresh 按风险触发价的距离和波动率安排，
+        完成后在最近一只股票到期时再次执行。
+        """
+        self.auto_update_id = None
+        
+        def done(updated):
+            if updated:
+                # 在主线程中更新UI
+                self.load_stocks()
                 
+                # 新触发的风险信号提醒用户
+                new_alerts = [alert for alert in self.processor.risk_alerts if alert['crossed']]
+                if new_alerts:
+                    self.show_risk_alerts(new_alerts)
+            schedule()
+        
+        def schedule():
+            if not self.auto_updating or self.auto_update_id is not None:
+                return
+            wait = self.processor.refresh.next_due()
+            wait = refresh.MAX_SLEEP if wait is None else min(max(wait, refresh.MIN_INTERVAL), refresh.MAX_SLEEP)
+            self.auto_update_id = self.root.after(int(wait * 1000), self.auto_update_task)
+        
+        def failed(error):
+            # 自动更新出错时只在状态栏提示，继续调度
+            self.status_var.set(f"自动更新股价失败: {error}")
+            schedule()
+        
+        self.run_job("自动更新股价", self.processor.refresh_due_prices, priority=LOW, key='auto_update',
+                     on_result=done, on_error=failed)
+                
+    def show_risk_alerts(self, alerts):
+        """显示新触发的风险控制信号"""
+        lines = [f"{alert['ticker']}: {alert['reason']}，建议{alert['percent']}%" for alert in alerts]
+        messagebox.showwarning("风险预警", "\n".join(lines))
+        
     def edit_cash(self):
         # 弹出对话框让用户输入现金额
-        current_cash = self.processor.portfolio['cash']
+        current_cash = self.processor.snapshot()['cash']
         new_cash = simpledialog.askfloat("编辑现金", 
                                       "请输入持有现金额:", 
                                       initialvalue=current_cash,
@@ -727,9 +991,7 @@ class StockPortfolioApp:
         
         if new_cash is not None:
             # 更新现金额
-            self.processor.portfolio['cash'] = new_cash
-            self.processor.update_portfolio_value()
-            self.processor.save_portfolio()
+            self.processor.update_cash(new_cash)
             self.load_stocks()
             messagebox.showinfo("成功", f"现金已更新为 ${new_cash:.2f}")
     
@@ -746,7 +1008,7 @@ class StockPortfolioApp:
         
         # 查找股票数据
         selected_stock = None
-        for stock in self.processor.portfolio['stocks']:
+        for stock in self.processor.snapshot()['stocks']:
             if stock['ticker'] == ticker:
                 selected_stock = stock
                 break
@@ -754,14 +1016,43 @@ class StockPortfolioApp:
         if not selected_stock:
             return
         
-        # 获取情绪解释（如果没有，则重新计算）
-        if 'sentiment_reason' not in selected_stock or not selected_stock['sentiment_reason']:
-            self.processor.update_sentiment(ticker)
-            # 重新获取更新后的股票数据
-            for stock in self.processor.portfolio['stocks']:
-                if stock['ticker'] == ticker:
-                    selected_stock = stock
-                    break
+        # 情绪解释（如果没有则重新计算）和技术指标都在后台获取，完成后再显示
+        def work():
+            if not selected_stock.get('sentiment_reason'):
+                self.processor.update_sentiment(ticker)
+            return self.sentiment_indicators(ticker)
+        
+        self.run_job(f"分析 {ticker} 市场情绪", work, priority=HIGH, key=('sentiment', ticker),
+                     on_result=lambda values: self.open_sentiment_window(ticker, values))
+        
+    def sentiment_indicators(self, ticker):
+        """最近1个月日线的价格、20日均线和成交量指标（在后台任务中调用，会请求数据）
+        
+        数据不足时返回None，获取失败时返回 {'error': 错误信息}。
+        """
+        try:
+            data = self.processor.get_stock_data(ticker, period='1mo')  # 获取1个月数据用于分析
+            if data.empty or len(data) < 20:
+                return None
+            close = indicators.column(data, 'Close')
+            volume = indicators.column(data, 'Volume')
+            ma20 = indicators.sma(close, 20)
+            return {
+                'price': close[-1],
+                'price_change': (close[-1] - close[-2]) / close[-2] * 100,
+                'ma20': ma20[-1],
+                'ma20_trend': "上升" if ma20[-1] > ma20[-2] else "下降",
+                'volume': volume[-1],
+                'volume_ratio': volume[-1] / indicators.rolling_mean(volume, 20)[-1],
+            }
+        except Exception as e:
+            return {'error': str(e)}
+        
+    def open_sentiment_window(self, ticker, values=None):
+        """显示市场情绪的判断依据、技术指标（由 sentiment_indicators 预先算好）和操作建议"""
+        selected_stock = self.processor._find_stock(ticker)
+        if selected_stock is None:
+            return
         
         # 创建一个更详细的情绪解释对话框
         explanation_window = tk.Toplevel(self.root)
@@ -786,30 +1077,13 @@ class StockPortfolioApp:
         text.insert(tk.END, f"判断依据:\n{selected_stock.get('sentiment_reason', '无详细解释')}\n\n", "reason")
         
         # 添加技术指标数据
-        try:
-            data = self.processor.get_stock_data(ticker, period='1mo')  # 获取1个月数据用于分析
-            if not data.empty and len(data) >= 20:
-                # 计算一些基本指标
-                current_price = data['Close'].iloc[-1].item()
-                prev_price = data['Close'].iloc[-2].item()
-                price_change = (current_price - prev_price) / prev_price * 100
-                
-                # 计算20日均线
-                ma20 = data['Close'].rolling(window=20).mean().iloc[-1].item()
-                ma20_prev = data['Close'].rolling(window=20).mean().iloc[-2].item()
-                ma20_trend = "上升" if ma20 > ma20_prev else "下降"
-                
-                # 计算成交量变化
-                current_volume = data['Volume'].iloc[-1].item()
-                avg_volume = data['Volume'].rolling(window=20).mean().iloc[-1].item()
-                volume_ratio = current_volume / avg_volume
-                
-                text.insert(tk.END, "技术指标分析:\n", "subtitle")
-                text.insert(tk.END, f"- 当前价格: ${current_price:.2f} (日涨跌: {price_change:.2f}%)\n")
-                text.insert(tk.END, f"- 20日均线: ${ma20:.2f} (趋势: {ma20_trend})\n")
-                text.insert(tk.END, f"- 成交量: {current_volume:.0f} (是20日均量的 {volume_ratio:.1f} 倍)\n\n")
-        except Exception as e:
-            text.insert(tk.END, f"获取技术指标数据失败: {str(e)}\n\n")
+        if values is not None and 'error' in values:
+            text.insert(tk.END, f"获取技术指标数据失败: {values['error']}\n\n")
+        elif values is not None:
+            text.insert(tk.END, "技术指标分析:\n", "subtitle")
+            text.insert(tk.END, f"- 当前价格: ${values['price']:.2f} (日涨跌: {values['price_change']:.2f}%)\n")
+            text.insert(tk.END, f"- 20日均线: ${values['ma20']:.2f} (趋势: {values['ma20_trend']})\n")
+            text.insert(tk.END, f"- 成交量: {values['volume']:.0f} (是20日均量的 {values['volume_ratio']:.1f} 倍)\n\n")
         
         text.insert(tk.END, "情绪类型解释:\n", "subtitle")
         text.insert(tk.END, "- 突破前高+放量: 股价突破20日最高价且成交量明显放大，通常是强势上涨信号\n")
@@ -835,6 +1109,332 @@ class StockPortfolioApp:
         # 添加关闭按钮
         ttk.Button(explanation_window, text="关闭", command=explanation_window.destroy).pack(pady=10)
     
+    def show_rebalance_orders(self):
+        """计算整个组合的目标仓位并显示调仓订单"""
+        self.run_job("生成调仓订单", self.processor.generate_rebalance_orders, key='rebalance',
+                     on_result=self.open_rebalance_window)
+        
+    def open_rebalance_window(self, orders):
+        """显示调仓订单"""
+        if not orders:
+            messagebox.showinfo("调仓订单", "当前持仓已符合目标仓位，无需调仓")
+            return
+        
+        orders_window = tk.Toplevel(self.root)
+        orders_window.title("调仓订单")
+        orders_window.geometry("600x400")
+        
+        columns = ("股票代码", "方向", "数量", "价格", "金额", "目标仓位")
+        tree = ttk.Treeview(orders_window, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=90, anchor="center")
+        for order in orders:
+            tree.insert("", tk.END, values=(
+                order['ticker'],
+                "买入" if order['side'] == 'buy' else "卖出",
+                f"{order['shares']:g}",
+                f"${order['price']:.2f}",
+                f"${order['value']:,.2f}",
+                f"{order['target_weight']:.1f}%",
+            ))
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        ttk.Button(orders_window, text="关闭", command=orders_window.destroy).pack(pady=5)
+    
+    def show_portfolio_risk(self):
+        """计算组合VaR/CVaR和压力情景"""
+        self.run_job("计算组合风险", self.processor.portfolio_risk, key='portfolio_risk',
+                     on_result=self.open_risk_window)
+        
+    def open_risk_window(self, report):
+        """显示组合VaR/CVaR和各压力情景下的盈亏"""
+        risk_window = tk.Toplevel(self.root)
+        risk_window.title("组合风险与压力测试")
+        risk_window.geometry("700x400")
+        
+        confidence = report['confidence'] * 100
+        historical_var, historical_cvar = report['historical']
+        parametric_var, parametric_cvar = report['parametric']
+        summary = (f"置信度 {confidence:.0f}%，持有期 {report['horizon']} 天，样本 {report['days']} 个交易日，"
+                   f"当前VIX {report['vix']:.1f}\n"
+                   f"历史模拟法  VaR: ${historical_var:,.2f}    CVaR: ${historical_cvar:,.2f}\n"
+                   f"参数法      VaR: ${parametric_var:,.2f}    CVaR: ${parametric_cvar:,.2f}")
+        ttk.Label(risk_window, text=summary, justify=tk.LEFT).pack(anchor=tk.W, padx=10, pady=5)
+        
+        columns = ("情景", "盈亏", "占总资产", "VIX系数", "凯利仓位缩放")
+        tree = ttk.Treeview(risk_window, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100, anchor="center")
+        tree.column("情景", width=200)
+        tree.tag_configure("loss", foreground="red")
+        for scenario in report['scenarios']:
+            tree.insert("", tk.END, values=(
+                scenario['name'],
+                f"${scenario['pnl']:,.2f}",
+                f"{scenario['pnl_percent']:.2f}%",
+                f"{scenario['vix_coefficient']:.1f}",
+                f"{scenario['kelly_scale']:.2f}x",
+            ), tags=("loss",) if scenario['pnl'] < 0 else ())
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        ttk.Button(risk_window, text="关闭", command=risk_window.destroy).pack(pady=5)
+    
+    def show_correlation(self):
+        """更新持仓相关性并显示热力图"""
+        self.run_job("计算持仓相关性", self.processor.correlation_report, key='correlation',
+                     on_result=self.open_correlation_window)
+        
+    def open_correlation_window(self, report):
+        """显示仓位最大的股票之间的相关系数热力图，以及合计仓位超限的高度相关股票组"""
+        tickers = report['tickers']
+        if len(tickers) < 2:
+            messagebox.showinfo("持仓相关性", "至少需要两只有日线数据的股票")
+            return
+        
+        corr_window = tk.Toplevel(self.root)
+        corr_window.title("持仓相关性")
+        corr_window.geometry("700x650")
+        
+        if report['clusters']:
+            lines = [f"{'、'.join(cluster['tickers'])}: 合计仓位 {cluster['weight']:.1f}%，平均相关系数 {cluster['correlation']:.2f}"
+                     for cluster in report['clusters']]
+            text = "以下高度相关的股票组合计仓位超过25%:\n" + "\n".join(lines)
+        else:
+            text = "没有合计仓位超过25%的高度相关股票组"
+        ttk.Label(corr_window, text=text, justify=tk.LEFT).pack(anchor=tk.W, padx=10, pady=5)
+        
+        figure = plt.Figure(figsize=(7, 6), dpi=100)
+        canvas = FigureCanvasTkAgg(figure, corr_window)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        ax = figure.add_subplot(111)
+        image = ax.imshow(report['correlation'], cmap='RdYlGn_r', vmin=-1, vmax=1)
+        ax.set_xticks(range(len(tickers)))
+        ax.set_yticks(range(len(tickers)))
+        fontsize = 8 if len(tickers) <= 20 else 6
+        ax.set_xticklabels(tickers, rotation=90, fontsize=fontsize)
+        ax.set_yticklabels(tickers, fontsize=fontsize)
+        figure.colorbar(image, ax=ax, fraction=0.046, pad=0.04)
+        figure.tight_layout()
+        canvas.draw()
+    
+    def show_rule_results(self):
+        """用规则引擎一次评估全部持仓"""
+        self.run_job("按规则评估持仓", self.processor.evaluate_rules, key='rules',
+                     on_result=self.open_rules_window)
+        
+    def open_rules_window(self, results):
+        """显示每只股票各规则组的结果"""
+        if results.empty:
+            messagebox.showinfo("规则评估", "没有持仓")
+            return
+        
+        rules_window = tk.Toplevel(self.root)
+        rules_window.title("规则评估结果")
+        rules_window.geometry("700x450")
+        
+        columns = ("股票代码",) + tuple(results.columns)
+        tree = ttk.Treeview(rules_window, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=110, anchor="center")
+        for ticker, row in results.iterrows():
+            tree.insert("", tk.END, values=(ticker,) + tuple(
+                f"{value:g}" if isinstance(value, float) else value for value in row))
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        ttk.Button(rules_window, text="关闭", command=rules_window.destroy).pack(pady=5)
+    
+    def show_sector_rollup(self):
+        """补齐行业分类并按行业汇总持仓"""
+        self.run_job("按行业汇总持仓", self.processor.sector_rollup, key='sectors',
+                     on_result=self.open_sector_window)
+        
+    def open_sector_window(self, report):
+        """显示行业 → 细分行业的市值、盈亏和仓位汇总，以及各行业仓位与上限的对比"""
+        table = report['rollup']
+        if table.empty:
+            messagebox.showinfo("行业分布", "没有持仓")
+            return
+        
+        sector_window = tk.Toplevel(self.root)
+        sector_window.title("行业分布与盈亏汇总")
+        sector_window.geometry("800x700")
+        
+        limit = report['limit']
+        if report['breaches']:
+            lines = [f"{name}: 合计仓位 {weight:.1f}%" for name, weight in report['breaches'].items()]
+            text = f"以下行业合计仓位超过{limit:.0f}%:\n" + "\n".join(lines)
+        else:
+            text = f"没有合计仓位超过{limit:.0f}%的行业"
+        ttk.Label(sector_window, text=text, justify=tk.LEFT).pack(anchor=tk.W, padx=10, pady=5)
+        
+        # 行业为父节点、细分行业为子节点
+        columns = ("股票数", "市值", "盈亏", "盈亏比例", "仓位")
+        tree = ttk.Treeview(sector_window, columns=columns, height=12)
+        tree.heading("#0", text="行业 / 细分行业")
+        tree.column("#0", width=220)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100, anchor="center")
+        tree.tag_configure("over", foreground="red")
+        parents = {}
+        for (sector, industry), row in table.iterrows():
+            values = (
+                int(row['count']),
+                f"${row['value']:,.2f}",
+                f"${row['pnl']:,.2f}",
+                f"{row['pnl_percent']:.2f}%",
+                f"{row['weight']:.2f}%",
+            )
+            if industry == '':
+                tags = ("over",) if sector in report['breaches'] else ()
+                parents[sector] = tree.insert("", tk.END, text=sector, values=values, tags=tags)
+            else:
+                tree.insert(parents[sector], tk.END, text=industry, values=values)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        totals = table.xs('', level='industry')
+        figure = plt.Figure(figsize=(8, 3), dpi=100)
+        canvas = FigureCanvasTkAgg(figure, sector_window)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        ax = figure.add_subplot(111)
+        colors = ['red' if name in report['breaches'] else 'steelblue' for name in totals.index]
+        ax.barh(range(len(totals)), totals['weight'], color=colors)
+        ax.set_yticks(range(len(totals)))
+        ax.set_yticklabels(totals.index, fontsize=8)
+        ax.invert_yaxis()
+        ax.axvline(limit, color='red', linestyle='--', linewidth=1)
+        ax.set_xlabel('仓位 (%)')
+        figure.tight_layout()
+        canvas.draw()
+    
+    def import_classification(self):
+        """从CSV/JSON文件导入股票的行业和细分行业"""
+        path = filedialog.askopenfilename(title="选择行业分类文件",
+                                          filetypes=[("JSON/CSV", "*.json *.csv"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            count = self.processor.classify_holdings(path)
+        except Exception as e:
+            messagebox.showerror("错误", f"读取行业分类文件失败: {e}")
+            return
+        messagebox.showinfo("成功", f"已导入 {count} 只股票的行业分类")
+        
+    def warm_metadata(self):
+        """从JSON/CSV文件批量导入股票信息（名称、行业、交易所等）"""
+        path = filedialog.askopenfilename(title="选择股票信息文件",
+                                          filetypes=[("JSON/CSV", "*.json *.csv"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            count = self.processor.warm_metadata(path)
+        except Exception as e:
+            messagebox.showerror("错误", f"读取股票信息文件失败: {e}")
+            return
+        messagebox.showinfo("成功", f"已导入 {count} 只股票的信息")
+        
+    def show_trades(self):
+        """显示最近的交易流水和已实现盈亏"""
+        ledger = self.processor.ledger
+        trades = ledger.trades[-500:]
+        
+        trades_window = tk.Toplevel(self.root)
+        trades_window.title("交易流水")
+        trades_window.geometry("700x450")
+        
+        summary = f"已实现盈亏（先进先出）: ${ledger.realized_pnl('fifo'):,.2f}    " \
+                  f"已实现盈亏（平均成本）: ${ledger.realized_pnl('average'):,.2f}"
+        ttk.Label(trades_window, text=summary).pack(pady=5)
+        
+        columns = ("日期", "类型", "股票代码", "数量", "价格", "金额")
+        tree = ttk.Treeview(trades_window, columns=columns, show="headings")
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100, anchor="center")
+        tree.column("日期", width=150)
+        
+        kinds = {'buy': "买入", 'sell': "卖出", 'adjust': "调整成本", 'deposit': "存入", 'withdraw': "取出", 'split': "拆股"}
+        for trade in reversed(trades):
+            if trade['type'] == 'split':
+                values = (trade['date'], kinds['split'], trade['ticker'], f"1:{trade['ratio']:g}", "", "")
+            elif 'ticker' in trade:
+                amount = trade['shares'] * trade['price'] if trade['type'] != 'adjust' else 0
+                values = (trade['date'], kinds[trade['type']], trade['ticker'], f"{trade['shares']:g}",
+                          f"${trade['price']:.2f}", f"${amount:,.2f}")
+            else:
+                values = (trade['date'], kinds[trade['type']], "", "", "", f"${trade['amount']:,.2f}")
+            tree.insert("", tk.END, values=values)
+        
+        scrollbar = ttk.Scrollbar(trades_window, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+    
+    def show_equity_chart(self):
+        """显示投资组合净值走势"""
+        chart_window = tk.Toplevel(self.root)
+        chart_window.title("组合净值走势")
+        chart_window.geometry("800x500")
+        
+        range_frame = tk.Frame(chart_window)
+        range_frame.pack(fill=tk.X, padx=5, pady=5)
+        tk.Label(range_frame, text="范围:").pack(side=tk.LEFT)
+        ranges = {"1天": pd.Timedelta(days=1), "1周": pd.Timedelta(weeks=1), "1月": pd.Timedelta(days=30),
+                  "1年": pd.Timedelta(days=365), "全部": None}
+        range_var = tk.StringVar(value="1月")
+        range_box = ttk.Combobox(range_frame, textvariable=range_var, width=5, state="readonly", values=tuple(ranges))
+        range_box.pack(side=tk.LEFT, padx=5)
+        
+        figure = plt.Figure(figsize=(8, 4), dpi=100)
+        canvas = FigureCanvasTkAgg(figure, chart_window)
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        def draw(event=None):
+            span = ranges[range_var.get()]
+            start = None if span is None else pd.Timestamp.now(tz='UTC') - span
+            # 长时间范围自动读取按小时或按天的汇总
+            history = self.processor.equity.load(start=start)
+            figure.clear()
+            ax = figure.add_subplot(111)
+            if history.empty:
+                ax.text(0.5, 0.5, "暂无净值记录，更新股价后开始记录", ha="center", va="center", fontsize=12)
+                ax.set_xticks([])
+                ax.set_yticks([])
+            else:
+                ax.plot(history.index, history['total'], label='Total Value', color='#2196F3', linewidth=1.5)
+                ax.plot(history.index, history['cash'], label='Cash', color='#FFA726', linewidth=1, linestyle='--')
+                ax.set_ylabel("Value (USD)")
+                ax.legend(loc='upper left', framealpha=0.8)
+                ax.grid(True, alpha=0.3)
+                figure.autofmt_xdate()
+            canvas.draw()
+        
+        range_box.bind("<<ComboboxSelected>>", draw)
+        draw()
+    
+    def toggle_metrics(self):
+        """开启或关闭性能监控，关闭时导出统计结果"""
+        if metrics.enabled:
+            metrics.disable()
+            messagebox.showinfo("性能监控", "已关闭性能监控，统计结果已导出到 cache/metrics.prom")
+        else:
+            metrics.reset()
+            metrics.enable([LogExporter(), JsonLinesExporter(), PrometheusExporter()])
+            messagebox.showinfo("性能监控", "已开启性能监控，每次计时写入 cache/metrics.jsonl")
+    
+    def show_metrics(self):
+        """显示各操作的耗时统计"""
+        snapshot = metrics.snapshot()
+        if not snapshot['spans'] and not snapshot['counters']:
+            messagebox.showinfo("性能统计", "暂无数据，请先开启性能监控")
+            return
+        lines = []
+        for name, stats in sorted(snapshot['spans'].items(), key=lambda item: -item[1]['total']):
+            lines.append(f"{name}: {stats['count']}次, 共{stats['total'] * 1000:.0f}ms, 最长{stats['max'] * 1000:.0f}ms")
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f"{name}: {value}")
+        messagebox.showinfo("性能统计", "\n".join(lines))
+    
     def show_about(self):
         about_text = """美股仓位管理系统 v1.0
 
@@ -849,4 +1449,12 @@ class StockPortfolioApp:
 if __name__ == "__main__":
     root = tk.Tk()
     app = StockPortfolioApp(root)
-    root.mainloop()
\ No newline at end of file
+    # 设置 STOCK_PROFILE=cprofile 或 pyinstrument 时对整个会话做性能剖析
+    profile_engine = os.environ.get('STOCK_PROFILE')
+    if profile_engine:
+        output = 'session.prof' if profile_engine == 'cprofile' else 'session.html'
+        with metrics.profile(output, engine=profile_engine):
+            root.mainloop()
+    else:
+        root.mainloop()
+    metrics.flush()
\ No newline at end of file
@@ -0,0 +1,146 @@
+import os
+import time
+import threading
+import numpy as np
+import pandas as pd
+from metrics import metrics
+import market_calendar
+
+VIX_TICKER = '^VIX'
+VIX_FILE = os.path.join('cache', 'vix.npz')
+MARKET_TZ = 'America/New_York'
+
+# 内存中的最新VIX超过这个秒数才重新请求
+VIX_TTL = 15 * 60
+
+# 首次下载的历史长度
+HISTORY_PERIOD = 'max'
+
+# VIX区间对应的凯利波动率系数：<20 为1.0，20-30 为1.5，>30 为2.0
+LOW_VIX = 20
+HIGH_VIX = 30
+DEFAULT_VIX = 15
+
+
+def regime(vix):
+    """把VIX数值（标量或数组）向量化映射为波动率系数"""
+    vix = np.asarray(vix, dtype=float)
+    return np.select([vix < LOW_VIX, vix <= HIGH_VIX], [1.0, 1.5], default=2.0)
+
+
+def kelly(probabilities, coefficients):
+    """凯利仓位百分比: (上涨概率 * 0.5) / 波动率系数，限制在0-100%
+
+    probabilities 与 coefficients 按NumPy规则广播，例如 (股票,) 与 (日期, 1)
+    得到 (日期 × 股票) 的仓位矩阵。
+    """
+    return np.clip(np.asarray(probabilities) * 0.5 / np.asarray(coefficients), 0, 1) * 100
+
+
+def _to_days(dates):
+    """把日期（DatetimeIndex、UTC纳秒数组或单个日期）转换为纽约时区的自然日编号"""
+    if isinstance(dates, np.ndarray) and dates.dtype == np.int64:
+        index = pd.DatetimeIndex(dates).tz_localize('UTC')
+    else:
+        index = pd.DatetimeIndex(np.atleast_1d(dates))
+    if index.tz is not None:
+        index = index.tz_convert(MARKET_TZ).tz_localize(None)
+    return index.values.astype('datetime64[D]').astype(np.int64)
+
+
+class VixHistory:
+    """本地缓存的VIX日线
+
+    日期（纽约时区的自然日编号，int32）和收盘价（float32）保存在 cache/vix.npz，
+    每次刷新只请求最后一个缓存日之后的数据。coefficients() 按日期向前对齐
+    （取当日或之前最近一个交易日的VIX），可以与任意股票面板直接拼接。
+    """
+
+    def __init__(self, provider, path=VIX_FILE, ttl=VIX_TTL):
+        self.provider = provider
+        self.path = path
+        self.ttl = ttl
+        self.days = np.empty(0, dtype=np.int32)
+        self.close = np.empty(0, dtype=np.float32)
+        self._refreshed = 0.0
+        # 最近一次下载时已收盘的交易日，之前的数据都是完整的
+        self.checked = -1
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with np.load(path) as data:
+                self.days, self.close = data['days'], data['close']
+                if 'checked' in data.files:
+                    self.checked = int(data['checked'])
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = self.path + '.tmp.npz'
+        np.savez(tmp, days=self.days, close=self.close, checked=np.int64(self.checked))
+        os.replace(tmp, self.path)
+
+    def refresh(self):
+        """从最后一个缓存日开始补齐VIX日线（最后一天的数据会被更新的值覆盖）"""
+        with self._lock:
+            session = int(_to_days([pd.Timestamp(market_calendar.last_session_day())])[0])
+            if len(self.days):
+                start = pd.Timestamp(int(self.days[-1]), unit='D').strftime('%Y-%m-%d')
+                data = self.provider.history(VIX_TICKER, start=start)
+            else:
+                data = self.provider.history(VIX_TICKER, period=HISTORY_PERIOD)
+            self._refreshed = time.time()
+            if data is None or data.empty:
+                return
+            days = _to_days(data.index).astype(np.int32)
+            close = np.asarray(data['Close'], dtype=np.float32).reshape(len(data), -1)[:, 0]
+            keep = self.days < days[0]
+            self.days = np.concatenate([self.days[keep], days])
+            self.close = np.concatenate([self.close[keep], close])
+            self.checked = session
+            self._save()
+
+    def is_complete(self, now=None):
+        """休市期间缓存已包含最近一个已收盘交易日时，不可能有新数据"""
+        if market_calendar.market_open(now) or not len(self.days):
+            return False
+        session = int(_to_days([pd.Timestamp(market_calendar.last_session_day(now))])[0])
+        return self.days[-1] >= session and self.checked >= session
+
+    def _ensure_fresh(self):
+        if time.time() - self._refreshed > self.ttl and not self.is_complete():
+            try:
+                self.refresh()
+            except Exception as e:
+                self._refreshed = time.time()
+                print(f"Error fetching VIX history: {e}")
+
+    def latest(self):
+        """最新的VIX收盘价（盘中为最新价），缓存超过 ttl 秒才会重新请求"""
+        self._ensure_fresh()
+        if not len(self.close):
+            return DEFAULT_VIX
+        return float(self.close[-1])
+
+    def values(self, dates):
+        """每个日期当日或之前最近一个交易日的VIX，早于缓存起点的日期为NaN"""
+        days = _to_days(dates)
+        positions = np.searchsorted(self.days, days, side='right') - 1
+        result = np.where(positions >= 0, self.close[np.maximum(positions, 0)], np.nan) if len(self.days) \
+            else np.full(len(days), np.nan)
+        return result.astype(float)
+
+    @metrics.timed('vix.coefficients')
+    def coefficients(self, dates, refresh=True):
+        """每个日期的凯利波动率系数，缺少数据的日期按默认VIX计算"""
+        if refresh:
+            self._ensure_fresh()
+        values = self.values(dates)
+        return regime(np.where(np.isnan(values), DEFAULT_VIX, values))
+
+    def join(self, panel):
+        """为以日期为索引的DataFrame附加 vix 和 vix_coefficient 两列"""
+        self._ensure_fresh()
+        values = self.values(panel.index)
+        result = panel.copy()
+        result['vix'] = values
+        result['vix_coefficient'] = regime(np.where(np.isnan(values), DEFAULT_VIX, values))
+        return result
@@ -0,0 +1,236 @@
+"""滚动前推优化（walk-forward）
+
+在滚动的训练窗口上为均线和风险控制阈值选择参数，再在紧随其后的测试窗口上
+检验，把各测试窗口的收益拼接为样本外净值曲线。各折互相独立，在多个进程中
+并行运行；所有候选均线在完整序列上只计算一次，各折直接切片复用。
+
+用法: python walkforward.py AAPL [--period 10y] [--train 504] [--test 126] [--workers 4] [--store cache/prices]
+
+行情存储（price_store）中已收录该股票时直接零拷贝读取，否则从数据源下载。
+"""
+import os
+import itertools
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import indicators
+from metrics import metrics
+
+# 参数网格，默认值与 calculate_ma_position / check_risk_control 中手工设定的阈值一致
+DEFAULT_GRID = {
+    'ma_short': (10, 20, 50),
+    'ma_long': (100, 150, 200),
+    'stop_loss': (0.95, 0.97, 0.99),
+    'take_profit': (1.10, 1.15, 1.25),
+    'daily_band': (0.03, 0.05, 0.08),
+}
+
+TRAIN_DAYS = 504    # 两年
+TEST_DAYS = 126     # 半年
+TRADING_DAYS = 252
+
+# 与风险控制规则一致：止盈卖出1/3，单日波动超限减仓一半
+TAKE_PROFIT_CUT = 0.33
+BAND_CUT = 0.5
+
+
+def _simulate_python(close, ma_short, ma_long, stop_loss, take_profit, daily_band):
+    """逐日模拟均线仓位和风险控制规则，返回每日收益
+
+    价格在长均线下方空仓，在短均线下方持有1/3，否则满仓（对应均线策略的
+    0%/5%/15%）。跌破建仓价的 stop_loss 倍止损，之后等价格回到短均线下方
+    再重新站上才再次建仓；超过建仓价的 take_profit 倍后卖出1/3；
+    单日涨跌幅超过 daily_band 时仓位减半。收盘时确定的仓位用于下一交易日。
+    """
+    n = len(close)
+    returns = np.zeros(n)
+    exposure = 0.0
+    entry = np.nan
+    took_profit = False
+    stopped = False
+    armed = False
+    for t in range(1, n):
+        price = close[t]
+        returns[t] = exposure * (price / close[t - 1] - 1)
+        if not (price >= ma_long[t]):
+            # 长均线下方（或均线尚未形成）空仓，重置所有状态
+            exposure, entry, took_profit, stopped, armed = 0.0, np.nan, False, False, False
+            continue
+        base = 1.0 / 3 if price < ma_short[t] else 1.0
+        if stopped:
+            if price < ma_short[t]:
+                armed = True
+            if not (armed and base == 1.0):
+                exposure = 0.0
+                continue
+            stopped, armed, entry, took_profit = False, False, np.nan, False
+        if entry != entry:
+            entry = price
+        if price < entry * stop_loss:
+            exposure, entry, stopped, armed = 0.0, np.nan, True, False
+            continue
+        if price > entry * take_profit:
+            took_profit = True
+        target = base
+        if took_profit:
+            target *= 1 - TAKE_PROFIT_CUT
+        if abs(price / close[t - 1] - 1) > daily_band:
+            target *= BAND_CUT
+        exposure = target
+    return returns
+
+
+if indicators.HAS_NUMBA:
+    _simulate_numba = indicators.njit(cache=True)(_simulate_python)
+
+
+def simulate(close, ma_short, ma_long, stop_loss, take_profit, daily_band):
+    """模拟策略每日收益，可用时使用Numba加速"""
+    if indicators.USE_NUMBA:
+        return _simulate_numba(close, ma_short, ma_long, stop_loss, take_profit, daily_band)
+    return _simulate_python(close, ma_short, ma_long, stop_loss, take_profit, daily_band)
+
+
+def sharpe(returns):
+    """年化夏普比率（无风险利率取0）"""
+    std = returns.std()
+    if std == 0:
+        return 0.0
+    return float(returns.mean() / std * np.sqrt(TRADING_DAYS))
+
+
+def make_folds(n, train=TRAIN_DAYS, test=TEST_DAYS, step=None):
+    """生成 (训练开始, 训练结束=测试开始, 测试结束) 的滚动窗口"""
+    step = step or test
+    folds = []
+    start = 0
+    while start + train < n:
+        folds.append((start, start + train, min(start + train + test, n)))
+        start += step
+    return folds
+
+
+# 工作进程中共享的收盘价和均线缓存，由 _init_worker 每个进程设置一次
+_close = None
+_averages = None
+
+
+def _init_worker(close, averages):
+    global _close, _averages
+    _close, _averages = close, averages
+
+
+def _run_fold(fold, grid):
+    """在训练窗口上选出最优参数，并返回其在测试窗口上的收益"""
+    train_start, test_start, test_end = fold
+    keys = list(grid)
+    best_params, best_score = None, -np.inf
+    close = _close[train_start:test_start]
+    for values in itertools.product(*grid.values()):
+        params = dict(zip(keys, values))
+        if params['ma_short'] >= params['ma_long']:
+            continue
+        returns = simulate(close,
+                           _averages[params['ma_short']][train_start:test_start],
+                           _averages[params['ma_long']][train_start:test_start],
+                           params['stop_loss'], params['take_profit'], params['daily_band'])
+        score = sharpe(returns)
+        if score > best_score:
+            best_params, best_score = params, score
+    test_returns = simulate(_close[test_start:test_end],
+                            _averages[best_params['ma_short']][test_start:test_end],
+                            _averages[best_params['ma_long']][test_start:test_end],
+                            best_params['stop_loss'], best_params['take_profit'], best_params['daily_band'])
+    return best_params, best_score, test_returns
+
+
+@metrics.timed('walkforward.run')
+def walk_forward(close, grid=None, train=TRAIN_DAYS, test=TEST_DAYS, step=None, workers=None):
+    """对收盘价序列运行滚动前推优化
+
+    close 为以日期为索引的 pd.Series 或一维数组。返回字典：
+    folds（每折的日期范围、最优参数、训练期夏普、测试期收益）、
+    equity（拼接的样本外净值曲线）、sharpe（样本外夏普）和 total_return。
+    """
+    grid = grid or DEFAULT_GRID
+    index = close.index if isinstance(close, pd.Series) else pd.RangeIndex(len(close))
+    values = np.ascontiguousarray(np.asarray(close, dtype=np.float64))
+    folds = make_folds(len(values), train, test, step)
+    if not folds:
+        raise ValueError(f"数据不足: 需要超过 {train} 个交易日，实际 {len(values)}")
+
+    # 所有候选均线在完整序列上计算一次，只依赖过去的数据，各折切片复用
+    windows = sorted(set(grid['ma_short']) | set(grid['ma_long']))
+    averages = {window: indicators.sma(values, window) for window in windows}
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(folds) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(folds)), initializer=_init_worker,
+                                 initargs=(values, averages)) as pool:
+            results = list(pool.map(_run_fold, folds, itertools.repeat(grid)))
+    else:
+        _init_worker(values, averages)
+        results = [_run_fold(fold, grid) for fold in folds]
+
+    # 步长小于测试窗口时各折的测试期会重叠，只保留每段首次出现的收益
+    pieces = []
+    covered = 0
+    report = []
+    for (train_start, test_start, test_end), (params, score, returns) in zip(folds, results):
+        start = max(test_start, covered)
+        pieces.append(pd.Series(returns[start - test_start:], index=index[start:test_end]))
+        covered = test_end
+        report.append({
+            'train': (index[train_start], index[test_start - 1]),
+            'test': (index[test_start], index[test_end - 1]),
+            'params': params,
+            'train_sharpe': score,
+            'test_return': float(np.prod(1 + returns) - 1),
+        })
+    out_of_sample = pd.concat(pieces)
+    equity = (1 + out_of_sample).cumprod()
+    return {
+        'folds': report,
+        'equity': equity,
+        'sharpe': sharpe(out_of_sample.to_numpy()),
+        'total_return': float(equity.iloc[-1] - 1),
+    }
+
+
+def load_close(ticker, period, store_dir=None):
+    """最近 period 的收盘价序列：优先读取行情存储，未收录时从数据源下载"""
+    from bars import period_to_days
+    from price_store import PriceStore, PRICE_STORE_DIR
+    store = PriceStore(store_dir or PRICE_STORE_DIR)
+    start = pd.Timestamp.now(tz='UTC') - pd.Timedelta(days=period_to_days(period))
+    window = store.window(ticker, start=start)
+    if window is not None and len(window['ts']):
+        index = pd.DatetimeIndex(np.asarray(window['ts']).astype('datetime64[ns]')).tz_localize('UTC')
+        return pd.Series(np.asarray(window['Close'], dtype=float), index=index)
+    from data_provider import YFinanceProvider
+    history = YFinanceProvider().history(ticker, period=period)
+    return pd.Series(indicators.column(history, 'Close'), index=history.index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('ticker')
+    parser.add_argument('--period', default='10y')
+    parser.add_argument('--train', type=int, default=TRAIN_DAYS)
+    parser.add_argument('--test', type=int, default=TEST_DAYS)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--store', default=None, help='行情存储目录（默认 cache/prices）')
+    args = parser.parse_args()
+
+    close = load_close(args.ticker, args.period, args.store)
+    result = walk_forward(close, train=args.train, test=args.test, workers=args.workers)
+    for fold in result['folds']:
+        test_start, test_end = fold['test']
+        print(f"{test_start:%Y-%m-%d} ~ {test_end:%Y-%m-%d}  训练夏普 {fold['train_sharpe']:6.2f}  "
+              f"测试收益 {fold['test_return'] * 100:7.2f}%  参数 {fold['params']}")
+    print(f"样本外总收益 {result['total_return'] * 100:.2f}%, 夏普 {result['sharpe']:.2f}")
+
+
+if __name__ == '__main__':
+    main()